@@ -191,6 +191,30 @@ export const pacientesAPI = {
   historial: async (id: number) => {
     return fetchWithCredentials(`${API_URL}/pacientes/${id}/historial/`)
   },
+
+  // Página siguiente del historial (URL 'next' de la respuesta anterior)
+  historialSiguiente: async (url: string) => {
+    return fetchWithCredentials(url)
+  },
+
+  historialFicha: async (id: number, fichaId: number) => {
+    return fetchWithCredentials(`${API_URL}/pacientes/${id}/historial/${fichaId}/`)
+  },
+
+  candidatosNN: async (datos: { nombres?: string; apellidos?: string; fecha_nacimiento?: string; sexo?: string; rut?: string }) => {
+    const params = new URLSearchParams()
+    Object.entries(datos).forEach(([clave, valor]) => {
+      if (valor) params.append(clave, valor)
+    })
+    return fetchWithCredentials(`${API_URL}/pacientes/candidatos_nn/?${params}`)
+  },
+
+  fusionar: async (id: number, nn: number[]) => {
+    return fetchWithCredentials(`${API_URL}/pacientes/${id}/fusionar/`, {
+      method: 'POST',
+      body: JSON.stringify({ nn }),
+    })
+  },
 }
 
 // Fichas de Emergencia
@@ -201,6 +225,7 @@ export const fichasAPI = {
     if (filtros?.prioridad) params.append('prioridad', filtros.prioridad)
     if (filtros?.paramedico) params.append('paramedico', filtros.paramedico.toString())
     if (filtros?.paciente_id) params.append('paciente_id', filtros.paciente_id.toString())
+    params.append('expand', '*')
     
     return fetchWithCredentials(`${API_URL}/fichas/?${params}`)
   },
@@ -210,27 +235,27 @@ export const fichasAPI = {
   },
 
   atendidas: async () => {
-    return fetchWithCredentials(`${API_URL}/fichas/atendidas/`)
+    return fetchWithCredentials(`${API_URL}/fichas/atendidas/?expand=diagnostico`)
   },
 
   dadosDeAlta: async () => {
-    return fetchWithCredentials(`${API_URL}/fichas/dados_de_alta/`)
+    return fetchWithCredentials(`${API_URL}/fichas/dados_de_alta/?expand=diagnostico`)
   },
 
   hospitalizados: async () => {
-    return fetchWithCredentials(`${API_URL}/fichas/hospitalizados/`)
+    return fetchWithCredentials(`${API_URL}/fichas/hospitalizados/?expand=diagnostico`)
   },
 
   enUci: async () => {
-    return fetchWithCredentials(`${API_URL}/fichas/en_uci/`)
+    return fetchWithCredentials(`${API_URL}/fichas/en_uci/?expand=diagnostico`)
   },
 
   derivados: async () => {
-    return fetchWithCredentials(`${API_URL}/fichas/derivados/`)
+    return fetchWithCredentials(`${API_URL}/fichas/derivados/?expand=diagnostico`)
   },
 
   fallecidos: async () => {
-    return fetchWithCredentials(`${API_URL}/fichas/fallecidos/`)
+    return fetchWithCredentials(`${API_URL}/fichas/fallecidos/?expand=diagnostico`)
   },
 
   crear: async (data: any) => {
@@ -248,11 +273,17 @@ export const fichasAPI = {
   },
 
   enRuta: async () => {
-    return fetchWithCredentials(`${API_URL}/fichas/en_ruta/`)
+    return fetchWithCredentials(`${API_URL}/fichas/en_ruta/?expand=*`)
   },
 
   enHospital: async () => {
-    return fetchWithCredentials(`${API_URL}/fichas/en_hospital/`)
+    return fetchWithCredentials(`${API_URL}/fichas/en_hospital/?expand=*`)
+  },
+
+  // Tablero de urgencias; con version devuelve solo los cambios posteriores
+  tablero: async (version?: number) => {
+    const params = version !== undefined ? `?version=${version}` : ''
+    return fetchWithCredentials(`${API_URL}/fichas/tablero/${params}`)
   },
 
   cambiarEstado: async (id: number, estado: string) => {
@@ -275,6 +306,17 @@ export const signosVitalesAPI = {
   porFicha: async (fichaId: number) => {
     return fetchWithCredentials(`${API_URL}/signos-vitales/?ficha=${fichaId}`)
   },
+
+  lote: async (fichaId: number, lecturas: any[]) => {
+    return fetchWithCredentials(`${API_URL}/signos-vitales/lote/`, {
+      method: 'POST',
+      body: JSON.stringify({ ficha: fichaId, lecturas }),
+    })
+  },
+
+  serie: async (fichaId: number, puntos = 500, metodo: 'minmax' | 'lttb' = 'minmax') => {
+    return fetchWithCredentials(`${API_URL}/signos-vitales/serie/?ficha=${fichaId}&puntos=${puntos}&metodo=${metodo}`)
+  },
 }
 
 // Solicitudes de Medicamentos
@@ -757,6 +799,21 @@ export const camasAPI = {
     })
   },
 
+  // Mejor cama disponible según estado de la ficha, piso y gravedad
+  asignarAutomatica: async (fichaId: number, opciones?: { tipo?: string; piso?: number }) => {
+    return fetchWithCredentials(`${API_URL}/camas/asignar_automatica/`, {
+      method: 'POST',
+      body: JSON.stringify({ ficha_id: fichaId, ...opciones }),
+    })
+  },
+
+  asignarLote: async (fichas: number[], opciones?: { tipo?: string; piso?: number }) => {
+    return fetchWithCredentials(`${API_URL}/camas/asignar_lote/`, {
+      method: 'POST',
+      body: JSON.stringify({ fichas, ...opciones }),
+    })
+  },
+
   liberar: async (id: number) => {
     return fetchWithCredentials(`${API_URL}/camas/${id}/liberar/`, {
       method: 'POST',
@@ -783,6 +840,18 @@ export const camasAPI = {
     })
   },
 
+  // Alta en bloque: patrón de numeración, lista de camas o texto CSV (numero,tipo,piso,sala,observaciones)
+  inventario: async (datos: {
+    patron?: { tipo: string; cantidad: number; prefijo?: string; inicio?: number; digitos?: number; piso?: number; sala?: string }
+    camas?: { numero: string; tipo: string; piso?: number; sala?: string; observaciones?: string }[]
+    csv?: string
+  }) => {
+    return fetchWithCredentials(`${API_URL}/camas/inventario/`, {
+      method: 'POST',
+      body: JSON.stringify(datos),
+    })
+  },
+
   eliminarMultiple: async (ids: number[]) => {
     return fetchWithCredentials(`${API_URL}/camas/eliminar_multiple/`, {
       method: 'POST',
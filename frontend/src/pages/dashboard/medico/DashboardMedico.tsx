@@ -461,6 +461,25 @@ export default function MedicoDashboard() {
     }
   }
 
+  // Siguiente página de atenciones del historial abierto
+  const cargarMasHistorial = async () => {
+    if (!historialPaciente?.next) return
+    try {
+      setCargandoHistorial(true)
+      const pagina = await pacientesAPI.historialSiguiente(historialPaciente.next)
+      setHistorialPaciente((actual: any) => ({
+        ...actual,
+        fichas: [...actual.fichas, ...pagina.fichas],
+        next: pagina.next,
+      }))
+    } catch (err: any) {
+      console.error('Error al cargar historial:', err)
+      toast({ title: "Error", description: "No se pudo cargar el historial del paciente", variant: "destructive" })
+    } finally {
+      setCargandoHistorial(false)
+    }
+  }
+
   // Función para cargar historial del paciente
   const cargarHistorialPaciente = async (pacienteId: number) => {
     try {
@@ -3981,30 +4000,30 @@ Ejemplo:
                       </div>
                     )}
                     
-                    {ficha.signos_vitales?.length > 0 && (
+                    {ficha.ultimos_signos_vitales && (
                       <div className="mt-3 grid grid-cols-3 md:grid-cols-6 gap-2 text-xs">
-                        {ficha.signos_vitales[ficha.signos_vitales.length - 1]?.presion_sistolica && (
+                        {ficha.ultimos_signos_vitales?.presion_sistolica && (
                           <div className="p-2 bg-slate-800 rounded text-center">
                             <span className="text-slate-400">PA</span>
                             <p className="text-white font-medium">
-                              {ficha.signos_vitales[ficha.signos_vitales.length - 1].presion_sistolica}/
-                              {ficha.signos_vitales[ficha.signos_vitales.length - 1].presion_diastolica}
+                              {ficha.ultimos_signos_vitales.presion_sistolica}/
+                              {ficha.ultimos_signos_vitales.presion_diastolica}
                             </p>
                           </div>
                         )}
-                        {ficha.signos_vitales[ficha.signos_vitales.length - 1]?.frecuencia_cardiaca && (
+                        {ficha.ultimos_signos_vitales?.frecuencia_cardiaca && (
                           <div className="p-2 bg-slate-800 rounded text-center">
                             <span className="text-slate-400">FC</span>
                             <p className="text-white font-medium">
-                              {ficha.signos_vitales[ficha.signos_vitales.length - 1].frecuencia_cardiaca}
+                              {ficha.ultimos_signos_vitales.frecuencia_cardiaca}
                             </p>
                           </div>
                         )}
-                        {ficha.signos_vitales[ficha.signos_vitales.length - 1]?.saturacion_o2 && (
+                        {ficha.ultimos_signos_vitales?.saturacion_o2 && (
                           <div className="p-2 bg-slate-800 rounded text-center">
                             <span className="text-slate-400">SpO2</span>
                             <p className="text-white font-medium">
-                              {ficha.signos_vitales[ficha.signos_vitales.length - 1].saturacion_o2}%
+                              {ficha.ultimos_signos_vitales.saturacion_o2}%
                             </p>
                           </div>
                         )}
@@ -4012,6 +4031,16 @@ Ejemplo:
                     )}
                   </div>
                 ))}
+                {historialPaciente.next && (
+                  <Button
+                    variant="outline"
+                    onClick={cargarMasHistorial}
+                    disabled={cargandoHistorial}
+                    className="w-full border-slate-600"
+                  >
+                    {cargandoHistorial ? 'Cargando...' : 'Cargar atenciones anteriores'}
+                  </Button>
+                )}
               </div>
             ) : (
               <div className="text-center py-8 text-slate-400">
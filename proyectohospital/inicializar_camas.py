@@ -6,59 +6,29 @@ import sys
 import django
 
 # Setup Django
-sys.path.append('/Users/diego/Desktop/Hospital/proyectohospital')
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'proyectohospital.settings')
 django.setup()
 
-from urgencias.models import ConfiguracionHospital, Cama, Usuario
+from urgencias.models import ConfiguracionHospital
+from urgencias.inventario_camas import desde_patron, validar, crear, resumen
 
 # Crear configuración inicial
 config = ConfiguracionHospital.get_configuracion()
 # Configuración creada
 
-# Crear camas de ejemplo
-camas_creadas = 0
-
-# Camas generales (1-30)
-for i in range(1, 31):
-    cama, created = Cama.objects.get_or_create(
-        numero=f"G-{i:02d}",
-        defaults={
-            'tipo': 'general',
-            'estado': 'disponible',
-            'piso': (i // 10) + 1,
-            'sala': f"Sala {((i-1) // 5) + 1}"
-        }
-    )
-    if created:
-        camas_creadas += 1
-
-# Camas UCI (1-10)
-for i in range(1, 11):
-    cama, created = Cama.objects.get_or_create(
-        numero=f"UCI-{i:02d}",
-        defaults={
-            'tipo': 'uci',
-            'estado': 'disponible',
-            'piso': 3,
-            'sala': f"UCI"
-        }
-    )
-    if created:
-        camas_creadas += 1
-
-# Camas de emergencia (1-10)
-for i in range(1, 11):
-    cama, created = Cama.objects.get_or_create(
-        numero=f"ER-{i:02d}",
-        defaults={
-            'tipo': 'emergencia',
-            'estado': 'disponible',
-            'piso': 1,
-            'sala': f"Emergencia"
-        }
-    )
-    if created:
-        camas_creadas += 1
-
-# Camas inicializadas correctamente
+# Camas de ejemplo por patrón de numeración
+filas = (
+    desde_patron('box', 10, inicio=1, piso=1, sala='Urgencias')
+    + desde_patron('hospitalizacion', 30, prefijo='HOSP', inicio=1, piso=2, sala='Hospitalización')
+    + desde_patron('uci', 10, inicio=1, piso=3, sala='UCI')
+)
+
+# Las que ya existen se omiten; el resto se crea en bloque
+camas, errores = validar(filas)
+existentes = {error['numero'] for error in errores}
+camas = [cama for cama in camas if cama.numero not in existentes]
+crear(camas)
+
+print(f"Camas creadas: {resumen(camas)}")
+print(f"Camas ya existentes: {len(existentes)}")
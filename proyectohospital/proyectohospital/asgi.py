@@ -20,6 +20,13 @@ django_asgi_app = get_asgi_application()
 
 from urgencias.routing import websocket_urlpatterns
 
+# Precargar plantillas, estilos y fuentes de los PDF antes de la primera request
+from django.conf import settings
+
+if settings.PDF_PRECALENTAR:
+    from urgencias.pdf import calentar
+    calentar()
+
 application = ProtocolTypeRouter({
     "http": django_asgi_app,
     "websocket": AuthMiddlewareStack(
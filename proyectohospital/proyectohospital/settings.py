@@ -4,6 +4,7 @@ Django settings for proyectohospital project.
 
 from pathlib import Path
 import os
+import warnings
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -150,6 +151,79 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 100
 }
 
+# Channel layer para WebSockets y stream de eventos (SSE)
+# En producción con varios procesos se debe usar Redis (REDIS_URL), que
+# también respalda la caché compartida (contadores, tablero de urgencias)
+if os.environ.get('REDIS_URL'):
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {'hosts': [os.environ['REDIS_URL']]},
+        }
+    }
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
+        }
+    }
+    if not DEBUG:
+        # La caché en memoria es propia de cada proceso: los contadores y el
+        # tablero no se comparten entre workers ni los eventos entre conexiones
+        warnings.warn(
+            'REDIS_URL no está configurado: la caché y el channel layer quedan en memoria '
+            'de cada proceso. Configure Redis si la aplicación corre con varios workers.',
+            RuntimeWarning,
+        )
+
+# Auditoría: los AuditLog se escriben en lotes desde un hilo en segundo plano.
+# En PythonAnywhere no se puede contar con hilos lanzados por la aplicación:
+# ahí la escritura es síncrona salvo que se indique lo contrario
+AUDIT_LOG_ASYNC = os.environ.get('AUDIT_LOG_ASYNC', 'False' if PYTHONANYWHERE else 'True') == 'True'
+AUDIT_LOG_BATCH_SIZE = 100
+AUDIT_LOG_FLUSH_INTERVAL = 2  # segundos
+AUDIT_LOG_MAX_QUEUE = 10000
+
+# Retención: los logs más antiguos se mueven a archivos mensuales comprimidos
+# con `python manage.py archivar_auditoria` y se siguen consultando desde la API.
+# En producción AUDIT_LOG_ARCHIVE_DIR debe apuntar a un directorio persistente fuera del código
+AUDIT_LOG_RETENTION_DAYS = int(os.environ.get('AUDIT_LOG_RETENTION_DAYS', 90))
+AUDIT_LOG_ARCHIVE_DIR = Path(os.environ.get('AUDIT_LOG_ARCHIVE_DIR', BASE_DIR / 'auditoria_archivo'))
+
+# Documentos PDF: WeasyPrint corre en un pool de procesos y los PDF se cachean en disco.
+# En producción PDF_CACHE_DIR debe apuntar fuera del código; los PDF sin
+# regenerar en PDF_CACHE_DIAS se borran con `python manage.py limpiar_cache_pdf`.
+# En PythonAnywhere, como con AUDIT_LOG_ASYNC, no se lanzan procesos ni se
+# precalienta al iniciar: se renderiza en el proceso de la request
+PDF_WORKERS = int(os.environ.get('PDF_WORKERS', 0 if PYTHONANYWHERE else 2))
+PDF_RENDER_TIMEOUT = 60  # segundos
+PDF_CACHE_DIR = Path(os.environ.get('PDF_CACHE_DIR', BASE_DIR / 'pdf_cache'))
+PDF_CACHE_DIAS = int(os.environ.get('PDF_CACHE_DIAS', 30))
+PDF_PRECALENTAR = os.environ.get('PDF_PRECALENTAR', 'False' if PYTHONANYWHERE else 'True') == 'True'
+
+# Tablero de urgencias: foto de las fichas activas en caché más los cambios recientes
+TABLERO_HISTORIAL_SEGUNDOS = 3600  # tiempo que se guarda cada cambio
+TABLERO_MAX_CAMBIOS = 500  # más cambios pendientes que esto y se envía la foto completa
+
+# Carga por lotes de signos vitales desde los monitores de ambulancia
+SIGNOS_LOTE_MAX_LECTURAS = 500
+SIGNOS_SERIE_CACHE_SEGUNDOS = 600  # series reducidas para gráficos
+
+# Candidatos NN al identificar a un paciente (ver urgencias/duplicados_nn.py)
+NN_VENTANA_DIAS = 90
+NN_TOLERANCIA_EDAD = 10  # años de diferencia con la edad aproximada
+
+# Estadísticas de ocupación de camas: se invalidan al cambiar una cama
+CAMAS_ESTADISTICAS_CACHE_SEGUNDOS = 300
+# Alta y eliminación de camas en bloque (ver urgencias/inventario_camas.py)
+CAMAS_INVENTARIO_MAX = 2000
+
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
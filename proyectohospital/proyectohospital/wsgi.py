@@ -14,3 +14,10 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'proyectohospital.settings')
 
 application = get_wsgi_application()
+
+# Precargar plantillas, estilos y fuentes de los PDF antes de la primera request
+from django.conf import settings
+
+if settings.PDF_PRECALENTAR:
+    from urgencias.pdf import calentar
+    calentar()
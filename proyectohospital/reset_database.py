@@ -239,9 +239,7 @@ def crear_camas():
         {'numero': 'UCI-05', 'tipo': 'uci', 'piso': 4, 'sala': 'Unidad de Cuidados Intensivos', 'estado': 'disponible'},
     ]
     
-    for cama_data in camas_data:
-        Cama.objects.create(**cama_data)
-        print(f"   + {cama_data['numero']} ({cama_data['tipo']})")
+    Cama.objects.bulk_create([Cama(**cama_data) for cama_data in camas_data])
     
     print(f"✅ {len(camas_data)} camas creadas")
 
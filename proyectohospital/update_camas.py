@@ -9,16 +9,24 @@ import django
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'proyectohospital.settings')
 django.setup()
 
+from django.db.models import Count
+
 from urgencias.models import Cama
 
+
+def mostrar_conteo():
+    """Cantidad de camas por tipo y estado (una consulta)"""
+    for fila in Cama.objects.values('tipo', 'estado').annotate(cantidad=Count('id')).order_by('tipo', 'estado'):
+        print(f"  - tipo={fila['tipo']}, estado={fila['estado']}: {fila['cantidad']}")
+
+
 print("=" * 50)
 print("ACTUALIZANDO TIPOS DE CAMAS")
 print("=" * 50)
 
 # Mostrar estado actual
 print("\nEstado actual de camas:")
-for cama in Cama.objects.all():
-    print(f"  - {cama.numero}: tipo={cama.tipo}, estado={cama.estado}")
+mostrar_conteo()
 
 # Actualizar cama_general -> hospitalizacion
 updated = Cama.objects.filter(tipo='cama_general').update(tipo='hospitalizacion')
@@ -30,8 +38,7 @@ print(f"✅ {updated_uti} camas actualizadas de 'uti' a 'uci'")
 
 # Mostrar estado final
 print("\nEstado final de camas:")
-for cama in Cama.objects.all():
-    print(f"  - {cama.numero}: tipo={cama.tipo}, estado={cama.estado}")
+mostrar_conteo()
 
 print("\n" + "=" * 50)
 print("ACTUALIZACIÓN COMPLETADA")
@@ -0,0 +1,294 @@
+"""
+Puntajes de alerta temprana (NEWS2, qSOFA) y tendencias de signos vitales.
+
+Se calculan con NumPy sobre la serie de signos vitales de varias fichas a
+la vez: la última lectura de cada ficha se puntúa con np.digitize y las
+tendencias (pendiente y cambio dentro de una ventana de tiempo) se obtienen
+con reducciones por segmento sobre la serie completa, sin recorrer las
+filas en Python.
+
+Se usa en dos formas, cargando solo las lecturas de la última ventana de
+tendencia de cada ficha:
+    evaluar_ficha(id): incremental, al registrar una lectura nueva. El
+        resultado queda en FichaEmergencia.alerta_signos (ver
+        SignosVitales.actualizar_ficha).
+    evaluar_fichas({id: fecha}): en lote, varias fichas con una consulta
+        (SignosVitales.recalcular_fichas: al eliminar lecturas y en el
+        comando recalcular_ultimos_signos).
+
+La conciencia se aproxima con Glasgow (< 15 equivale a "no alerta") y no se
+registra oxígeno suplementario, por lo que se usa la escala 1 de SpO2 sin
+puntos por oxígeno.
+"""
+from datetime import timedelta
+
+import numpy as np
+
+from .segmentos import por_segmento
+
+COLUMNAS = ('frecuencia_respiratoria', 'saturacion_o2', 'presion_sistolica', 'presion_diastolica',
+            'frecuencia_cardiaca', 'temperatura', 'escala_glasgow')
+_COL = {columna: i for i, columna in enumerate(COLUMNAS)}
+
+# NEWS2: bordes superiores de cada tramo (inclusive) y puntos de cada tramo
+NEWS2 = {
+    'frecuencia_respiratoria': ([8, 11, 20, 24], [3, 1, 0, 2, 3]),
+    'saturacion_o2': ([91, 93, 95], [3, 2, 1, 0]),
+    'presion_sistolica': ([90, 100, 110, 219], [3, 2, 1, 0, 3]),
+    'frecuencia_cardiaca': ([40, 50, 90, 110, 130], [3, 1, 0, 1, 2, 3]),
+    'temperatura': ([35.0, 36.0, 38.0, 39.0], [3, 1, 0, 1, 2]),
+}
+
+# Umbrales críticos de una lectura: (columna, comparación, umbral, mensaje)
+UMBRALES_CRITICOS = [
+    ('frecuencia_cardiaca', np.less, 50, 'Bradicardia severa: FC {frecuencia_cardiaca:.0f} lpm'),
+    ('frecuencia_cardiaca', np.greater, 120, 'Taquicardia: FC {frecuencia_cardiaca:.0f} lpm'),
+    ('presion_sistolica', np.less, 90, 'Hipotensión: PA {presion_sistolica:.0f}/{presion_diastolica:.0f} mmHg'),
+    ('presion_sistolica', np.greater, 180, 'Crisis hipertensiva: PA {presion_sistolica:.0f}/{presion_diastolica:.0f} mmHg'),
+    ('saturacion_o2', np.less, 90, 'Hipoxemia severa: SatO2 {saturacion_o2:.0f}%'),
+    ('temperatura', np.less, 35, 'Hipotermia: {temperatura:.1f}°C'),
+    ('temperatura', np.greater, 39.5, 'Fiebre alta: {temperatura:.1f}°C'),
+    ('frecuencia_respiratoria', np.less, 10, 'Bradipnea: FR {frecuencia_respiratoria:.0f} rpm'),
+    ('frecuencia_respiratoria', np.greater, 30, 'Taquipnea severa: FR {frecuencia_respiratoria:.0f} rpm'),
+    ('escala_glasgow', np.less_equal, 8, 'Glasgow crítico: {escala_glasgow:.0f}/15'),
+]
+
+# Tendencias: (columna, ventana en minutos, cambio que alerta, mensaje).
+# Un cambio negativo compara la última lectura con el máximo de la ventana
+# (caída) y uno positivo con el mínimo (alza).
+TENDENCIAS = [
+    ('saturacion_o2', 15, -4, 'SatO2 bajando {cambio:.0f} puntos en {minutos} min'),
+    ('presion_sistolica', 30, -30, 'PA sistólica bajando {cambio:.0f} mmHg en {minutos} min'),
+    ('frecuencia_cardiaca', 30, 30, 'FC subiendo {cambio:.0f} lpm en {minutos} min'),
+    ('frecuencia_respiratoria', 30, 8, 'FR subiendo {cambio:.0f} rpm en {minutos} min'),
+    ('escala_glasgow', 60, -2, 'Glasgow bajando {cambio:.0f} puntos en {minutos} min'),
+]
+
+# Ventana para la pendiente de cada signo (y para cargar datos en modo incremental)
+VENTANA_PENDIENTE_MINUTOS = 60
+# Con lecturas más juntas que esto la pendiente no es representativa
+MINUTOS_MINIMOS_PENDIENTE = 5
+
+
+def _ventana_carga():
+    """Minutos de lecturas previas que necesita la evaluación (tendencias y pendiente)"""
+    return max(VENTANA_PENDIENTE_MINUTOS, *(minutos for _, minutos, _, _ in TENDENCIAS))
+
+
+def riesgo_news2(total, maximo_parametro):
+    """Nivel de respuesta clínica según el puntaje NEWS2"""
+    if total >= 7:
+        return 'alto'
+    if total >= 5:
+        return 'medio'
+    if maximo_parametro >= 3:
+        return 'bajo_medio'
+    return 'bajo'
+
+
+def _cargar(filtro):
+    """Serie de signos vitales ordenada por ficha y fecha, como arreglos"""
+    from .models import SignosVitales
+
+    filas = list(
+        SignosVitales.objects.filter(filtro)
+        .order_by('ficha_id', 'timestamp', 'id')
+        .values_list('ficha_id', 'timestamp', *COLUMNAS)
+    )
+    fichas = np.fromiter((fila[0] for fila in filas), dtype=np.int64, count=len(filas))
+    segundos = np.fromiter((fila[1].timestamp() for fila in filas), dtype=np.float64, count=len(filas))
+    # None (Glasgow sin registrar) queda como NaN
+    valores = np.array([fila[2:] for fila in filas], dtype=np.float64).reshape(len(filas), len(COLUMNAS))
+    fechas = [fila[1] for fila in filas]
+    return fichas, segundos, valores, fechas
+
+
+def matriz(lecturas):
+    """Valores de lecturas SignosVitales (sin guardar) como arreglo, con NaN donde falta el dato"""
+    return np.array(
+        [[getattr(lectura, columna) for columna in COLUMNAS] for lectura in lecturas], dtype=np.float64
+    ).reshape(len(lecturas), len(COLUMNAS))
+
+
+def alertas_criticas(valores):
+    """
+    Umbrales críticos de cada lectura (una máscara por regla sobre todas las filas).
+
+    Returns:
+        dict: {índice de la lectura: [mensajes]} solo de las lecturas con alguna alerta
+    """
+    mascaras = [
+        (comparar(valores[:, _COL[columna]], umbral), mensaje)
+        for columna, comparar, umbral, mensaje in UMBRALES_CRITICOS
+    ]
+    criticas = np.flatnonzero(np.any([mascara for mascara, _ in mascaras], axis=0))
+    return {
+        int(i): [mensaje.format(**dict(zip(COLUMNAS, valores[i].tolist()))) for mascara, mensaje in mascaras if mascara[i]]
+        for i in criticas
+    }
+
+
+def puntuar(valores):
+    """
+    NEWS2 y qSOFA de cada lectura.
+
+    Returns:
+        tuple: (componentes NEWS2 {columna: arreglo}, total NEWS2, qSOFA)
+    """
+    componentes = {}
+    for columna, (bordes, puntos) in NEWS2.items():
+        columna_valores = valores[:, _COL[columna]]
+        tramo = np.digitize(columna_valores, bordes, right=True)
+        componentes[columna] = np.where(np.isnan(columna_valores), 0, np.asarray(puntos)[tramo])
+
+    # Sin Glasgow registrado (NaN) el paciente se considera alerta
+    alterado = valores[:, _COL['escala_glasgow']] < 15
+    componentes['conciencia'] = np.where(alterado, 3, 0)
+
+    total = np.sum(list(componentes.values()), axis=0)
+    qsofa = (
+        (valores[:, _COL['frecuencia_respiratoria']] >= 22).astype(int)
+        + (valores[:, _COL['presion_sistolica']] <= 100)
+        + alterado
+    )
+    return componentes, total, qsofa
+
+
+def evaluar(fichas, segundos, valores, fechas):
+    """
+    Evalúa la última lectura de cada ficha con su tendencia.
+
+    Args:
+        fichas, segundos, valores, fechas: Serie ordenada por (ficha, fecha),
+            tal como la retorna _cargar
+
+    Returns:
+        dict: {ficha_id: resultado}
+    """
+    if len(fichas) == 0:
+        return {}
+
+    ids, inicios = np.unique(fichas, return_index=True)
+    finales = np.append(inicios[1:], len(fichas)) - 1
+    grupo = np.repeat(np.arange(len(ids)), finales - inicios + 1)
+
+    # Clave (ficha, segundos) creciente para ubicar el inicio de cada ventana con searchsorted
+    ventana_maxima = _ventana_carga() * 60
+    separacion = segundos.max() - segundos.min() + ventana_maxima + 1
+    clave = grupo * separacion + (segundos - segundos.min())
+
+    def inicio_ventana(minutos):
+        return np.searchsorted(clave, clave[finales] - minutos * 60, side='left')
+
+    # Puntajes de la última lectura de cada ficha
+    componentes, total, qsofa = puntuar(valores[finales])
+    maximo_parametro = np.max(list(componentes.values()), axis=0)
+    ultimos = valores[finales]
+
+    criticas = alertas_criticas(ultimos)
+
+    # Cambios dentro de la ventana de cada regla de tendencia
+    cambios = []
+    for columna, minutos, umbral, mensaje in TENDENCIAS:
+        serie = valores[:, _COL[columna]]
+        desde = inicio_ventana(minutos)
+        if umbral < 0:
+            referencia = por_segmento(np.fmax, serie, desde, finales)
+        else:
+            referencia = por_segmento(np.fmin, serie, desde, finales)
+        cambio = ultimos[:, _COL[columna]] - referencia
+        alerta = cambio <= umbral if umbral < 0 else cambio >= umbral
+        cambios.append((alerta, cambio, minutos, mensaje))
+
+    # Pendiente por mínimos cuadrados en la ventana, en unidades por hora
+    desde = inicio_ventana(VENTANA_PENDIENTE_MINUTOS)
+    minutos_relativos = (segundos - segundos[finales][grupo]) / 60
+    # La última lectura está en 0: el lapso cubierto es el mínimo (negativo) de la ventana
+    lapso = -por_segmento(np.minimum, minutos_relativos, desde, finales)
+    pendientes = {}
+    for columna in ('frecuencia_respiratoria', 'saturacion_o2', 'presion_sistolica',
+                    'frecuencia_cardiaca', 'temperatura'):
+        y = valores[:, _COL[columna]]
+        peso = ~np.isnan(y)
+        y = np.where(peso, y, 0.0)
+        x = minutos_relativos * peso
+        n = por_segmento(np.add, peso.astype(float), desde, finales)
+        sx = por_segmento(np.add, x, desde, finales)
+        sy = por_segmento(np.add, y, desde, finales)
+        sxx = por_segmento(np.add, x * x, desde, finales)
+        sxy = por_segmento(np.add, x * y, desde, finales)
+        denominador = n * sxx - sx * sx
+        with np.errstate(divide='ignore', invalid='ignore'):
+            pendiente = np.where(
+                (denominador > 0) & (lapso >= MINUTOS_MINIMOS_PENDIENTE),
+                (n * sxy - sx * sy) / denominador,
+                np.nan
+            )
+        pendientes[columna] = pendiente * 60
+
+    resultados = {}
+    for i, ficha_id in enumerate(ids.tolist()):
+        alertas = criticas.get(i, []) + [
+            mensaje.format(cambio=abs(cambio[i]), minutos=minutos)
+            for alerta, cambio, minutos, mensaje in cambios if alerta[i]
+        ]
+        riesgo = riesgo_news2(int(total[i]), int(maximo_parametro[i]))
+        if riesgo == 'alto':
+            alertas.append(f'NEWS2 {int(total[i])}: riesgo clínico alto')
+        if qsofa[i] >= 2:
+            alertas.append(f'qSOFA {int(qsofa[i])}/3: sospecha de sepsis')
+
+        resultados[ficha_id] = {
+            'news2': int(total[i]),
+            'riesgo': riesgo,
+            'qsofa': int(qsofa[i]),
+            'componentes': {columna: int(puntos[i]) for columna, puntos in componentes.items()},
+            'pendientes_por_hora': {
+                columna: None if np.isnan(pendiente[i]) else round(float(pendiente[i]), 2)
+                for columna, pendiente in pendientes.items()
+            },
+            'alertas': alertas,
+            'timestamp': fechas[finales[i]],
+        }
+    return resultados
+
+
+def _filtro_ventana(ficha_id, hasta):
+    from django.db.models import Q
+
+    return Q(ficha_id=ficha_id, timestamp__gte=hasta - timedelta(minutes=_ventana_carga()), timestamp__lte=hasta)
+
+
+def evaluar_fichas(hasta_por_ficha):
+    """
+    Evalúa en lote varias fichas, cada una en su lectura `hasta`, con una
+    sola consulta que carga la ventana de tendencia de todas.
+
+    Args:
+        hasta_por_ficha: {ficha_id: fecha de la lectura a evaluar}
+
+    Returns:
+        dict: {ficha_id: resultado} (sin las fichas sin signos vitales)
+    """
+    from functools import reduce
+    from operator import or_
+
+    if not hasta_por_ficha:
+        return {}
+    filtro = reduce(or_, (_filtro_ventana(ficha_id, hasta) for ficha_id, hasta in hasta_por_ficha.items()))
+    return evaluar(*_cargar(filtro))
+
+
+def evaluar_ficha(ficha_id, hasta=None):
+    """
+    Evaluación incremental de una ficha al registrar una lectura.
+
+    Solo se cargan las lecturas de la ventana más larga de tendencia previa
+    a `hasta` (por defecto, ahora).
+
+    Returns:
+        dict con el resultado, o None si la ficha no tiene signos vitales
+    """
+    from django.utils import timezone
+
+    return evaluar(*_cargar(_filtro_ventana(ficha_id, hasta or timezone.now()))).get(ficha_id)
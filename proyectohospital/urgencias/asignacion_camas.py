@@ -0,0 +1,177 @@
+"""
+Asignación de camas sin dobles reservas.
+
+Leer la cama, revisar que esté disponible y guardarla en pasos separados
+permite que dos personas asignen la misma cama a la vez. Aquí cada
+asignación ocurre en una transacción que bloquea las filas involucradas,
+siempre en el mismo orden (fichas por id y luego camas) para no producir
+deadlocks:
+
+    asignar: una cama elegida a una ficha (SELECT ... FOR UPDATE de la cama).
+    asignar_lote: elige la mejor cama disponible para cada una de N fichas
+        (llegada masiva de pacientes). Las camas candidatas se bloquean con
+        SKIP LOCKED, así dos lotes simultáneos toman camas distintas en vez
+        de esperarse.
+
+La escritura final es un UPDATE condicionado a estado='disponible', de modo
+que aunque el motor no soporte FOR UPDATE una cama nunca queda con dos
+fichas.
+
+La mejor cama es la del tipo que corresponde al estado de la ficha (UCI,
+hospitalización o box), en el piso pedido o el más cercano; sin piso pedido,
+los pacientes más graves (nivel ESI del triage o categoría C1-C5) reciben
+primero las camas de los pisos más bajos.
+"""
+from django.db import connection, transaction
+
+# Estado de la ficha -> tipo de cama que necesita (el resto, box)
+TIPO_POR_ESTADO = {
+    'uci': 'uci',
+    'hospitalizado': 'hospitalizacion',
+}
+
+
+def tipo_para(ficha):
+    return TIPO_POR_ESTADO.get(ficha.estado, 'box')
+
+
+def _candidatas(tipo, piso, cantidad):
+    """Camas disponibles del tipo, bloqueadas y en orden de preferencia"""
+    from django.db.models import F
+    from django.db.models.functions import Abs
+    from .models import Cama
+
+    camas = Cama.objects.select_for_update(
+        skip_locked=connection.features.has_select_for_update_skip_locked
+    ).filter(estado='disponible', tipo=tipo)
+    if piso is not None:
+        camas = camas.annotate(distancia=Abs(F('piso') - piso)).order_by(
+            F('distancia').asc(nulls_last=True), 'numero'
+        )
+    else:
+        camas = camas.order_by(F('piso').asc(nulls_last=True), 'numero')
+    return list(camas[:cantidad])
+
+
+def _ocupar(cama, ficha_id, usuario, ahora):
+    """UPDATE condicionado: False si la cama ya no estaba disponible"""
+    from .models import Cama
+
+    ocupada = Cama.objects.filter(pk=cama.pk, estado='disponible').update(
+        estado='ocupada', ficha_actual_id=ficha_id, fecha_asignacion=ahora,
+        asignado_por=usuario, fecha_actualizacion=ahora
+    )
+    if ocupada:
+        cama.estado, cama.ficha_actual_id, cama.fecha_asignacion = 'ocupada', ficha_id, ahora
+        cama.asignado_por = usuario
+    return bool(ocupada)
+
+
+def _liberar_anteriores(fichas_ids, ahora):
+    """Deja disponibles las camas que ya tenían las fichas"""
+    from .models import Cama
+
+    return Cama.objects.filter(ficha_actual_id__in=fichas_ids).update(
+        estado='disponible', ficha_actual=None, fecha_asignacion=None,
+        asignado_por=None, fecha_actualizacion=ahora
+    )
+
+
+def asignar(cama_id, ficha, usuario):
+    """
+    Asigna una cama determinada a la ficha.
+
+    Returns:
+        Cama: La cama ocupada
+
+    Raises:
+        Cama.DoesNotExist: si la cama no existe
+        ValueError: si la cama no está disponible
+    """
+    from django.utils import timezone
+    from .models import Cama, FichaEmergencia
+    from .ocupacion_camas import invalidar
+    from .tablero import registrar_cambio
+
+    ahora = timezone.now()
+    with transaction.atomic():
+        FichaEmergencia.objects.select_for_update().only('pk').get(pk=ficha.pk)
+        cama = Cama.objects.select_for_update().get(pk=cama_id)
+        if cama.estado != 'disponible':
+            raise ValueError('La cama no está disponible')
+        # Si la ficha ya tiene una cama asignada, se libera primero
+        _liberar_anteriores([ficha.pk], ahora)
+        if not _ocupar(cama, ficha.pk, usuario, ahora):
+            raise ValueError('La cama no está disponible')
+        invalidar()
+        registrar_cambio(ficha.pk)
+    return cama
+
+
+def asignar_lote(fichas_ids, usuario, tipo=None, piso=None):
+    """
+    Asigna la mejor cama disponible a cada ficha, de la más grave a la
+    menos grave, en una sola transacción.
+
+    Args:
+        fichas_ids: Ids de las fichas a ubicar
+        tipo: Tipo de cama para todas (por defecto según el estado de cada ficha)
+        piso: Piso preferido (se usa el más cercano si no hay camas en él)
+
+    Returns:
+        dict: {'asignadas': [(ficha, cama)], 'sin_cama': [fichas]}. Las
+        fichas que ya ocupan una cama del tipo pedido la conservan.
+    """
+    from django.utils import timezone
+    from .models import Cama, FichaEmergencia, Triage
+    from .ocupacion_camas import invalidar
+    from .tablero import registrar_cambio
+
+    ahora = timezone.now()
+    asignadas, sin_cama = [], []
+    with transaction.atomic():
+        fichas_ids = sorted(set(fichas_ids))
+        bloqueadas = list(FichaEmergencia.objects.select_for_update().filter(pk__in=fichas_ids).order_by('pk'))
+        niveles = dict(Triage.objects.filter(ficha_id__in=fichas_ids).values_list('ficha_id', 'nivel_esi'))
+        actuales = {
+            cama.ficha_actual_id: cama
+            for cama in Cama.objects.select_for_update().filter(ficha_actual_id__in=fichas_ids).order_by('pk')
+        }
+
+        # Más graves primero: ESI del triage, o la categoría C1-C5 si aún no tiene triage
+        bloqueadas.sort(key=lambda ficha: (niveles.get(ficha.pk) or int(ficha.prioridad[1:]), ficha.fecha_registro))
+        por_tipo = {}
+        for ficha in bloqueadas:
+            tipo_ficha = tipo or tipo_para(ficha)
+            actual = actuales.get(ficha.pk)
+            if actual is not None and actual.tipo == tipo_ficha:
+                asignadas.append((ficha, actual))
+                continue
+            por_tipo.setdefault(tipo_ficha, []).append(ficha)
+
+        nuevas = []
+        for tipo_ficha, pendientes in por_tipo.items():
+            candidatas = _candidatas(tipo_ficha, piso, len(pendientes))
+            for ficha in pendientes:
+                cama = None
+                if candidatas:
+                    # La cama de otro tipo que tenía la ficha se libera al cambiarse
+                    _liberar_anteriores([ficha.pk], ahora)
+                while candidatas and cama is None:
+                    candidata = candidatas.pop(0)
+                    if _ocupar(candidata, ficha.pk, usuario, ahora):
+                        cama = candidata
+                if cama is not None:
+                    nuevas.append((ficha, cama))
+                    continue
+                sin_cama.append(ficha)
+                # Sin cama nueva: conserva la que tenía
+                if ficha.pk in actuales:
+                    _ocupar(actuales[ficha.pk], ficha.pk, actuales[ficha.pk].asignado_por, ahora)
+
+        asignadas.extend(nuevas)
+        if nuevas:
+            invalidar()
+            registrar_cambio(*(ficha.pk for ficha, _ in nuevas))
+
+    return {'asignadas': asignadas, 'sin_cama': sin_cama}
@@ -0,0 +1,343 @@
+"""
+Escritura de registros de auditoría en lotes y archivo histórico.
+
+Los registros se encolan en memoria al confirmarse la transacción de la
+request y un hilo en segundo plano los inserta con bulk_create, de modo que
+las escrituras clínicas no pagan un INSERT extra de AuditLog.
+
+Configuración (settings):
+    AUDIT_LOG_ASYNC: False para escribir de forma síncrona (tests, PythonAnywhere).
+    AUDIT_LOG_BATCH_SIZE: Máximo de registros por INSERT.
+    AUDIT_LOG_FLUSH_INTERVAL: Segundos máximos que un registro espera en cola.
+    AUDIT_LOG_MAX_QUEUE: Tamaño de la cola; si se llena se escribe síncrono.
+    AUDIT_LOG_RETENTION_DAYS: Días que los registros permanecen en la tabla.
+    AUDIT_LOG_ARCHIVE_DIR: Directorio de los archivos mensuales (.jsonl.gz).
+"""
+import atexit
+import gzip
+import json
+import logging
+import os
+import queue
+import threading
+from datetime import datetime, time, timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+# Reintentos de un lote fallido antes de guardarlo registro por registro
+REINTENTOS = 3
+ESPERA_REINTENTO = 0.5  # segundos, crece con cada intento
+
+
+class AuditWriter:
+    """Cola acotada de AuditLog con un hilo que la vacía en lotes"""
+
+    def __init__(self, batch_size=100, flush_interval=2.0, max_queue=10000):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.cola = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._hilo = None
+        self._pid = None
+        self._detener = threading.Event()
+
+    def encolar(self, registro):
+        """Encola un AuditLog sin guardar; si la cola está llena lo guarda de inmediato"""
+        self._asegurar_hilo()
+        try:
+            self.cola.put_nowait(registro)
+        except queue.Full:
+            # Nunca se descartan registros de auditoría
+            guardar_sincrono(registro)
+
+    def flush(self):
+        """Escribe todo lo que haya en cola. Retorna la cantidad de registros guardados"""
+        total = 0
+        while True:
+            lote = self._tomar_lote()
+            if not lote:
+                return total
+            self._guardar(lote)
+            total += len(lote)
+
+    def detener(self):
+        """Detiene el hilo y escribe los registros pendientes (al cerrar el proceso)"""
+        self._detener.set()
+        if self._hilo is not None and self._hilo.is_alive() and self._pid == os.getpid():
+            self._hilo.join(timeout=self.flush_interval + 5)
+        self.flush()
+
+    def _asegurar_hilo(self):
+        # El hilo no sobrevive a un fork (gunicorn, uwsgi): se crea uno por proceso
+        if self._hilo is not None and self._hilo.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._hilo is not None and self._hilo.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._detener.clear()
+            self._hilo = threading.Thread(target=self._ejecutar, name='audit-writer', daemon=True)
+            self._hilo.start()
+
+    def _tomar_lote(self, espera=None):
+        lote = []
+        try:
+            lote.append(self.cola.get(timeout=espera) if espera else self.cola.get_nowait())
+            while len(lote) < self.batch_size:
+                lote.append(self.cola.get_nowait())
+        except queue.Empty:
+            pass
+        return lote
+
+    def _guardar(self, lote):
+        """
+        Inserta el lote. Si falla (deadlock, conexión perdida) se reintenta
+        y luego se guarda registro por registro, de modo que un registro
+        inválido no descarte a los demás.
+        """
+        from .models import AuditLog, AuditDailyRollup
+
+        for intento in range(1, REINTENTOS + 1):
+            close_old_connections()
+            try:
+                with transaction.atomic():
+                    AuditLog.objects.bulk_create(lote, batch_size=self.batch_size)
+                    AuditDailyRollup.acumular(lote)
+                return
+            except Exception:
+                logger.warning('Intento %d: no se pudo guardar el lote de %d registros de auditoría',
+                               intento, len(lote), exc_info=True)
+                # bulk_create puede haber asignado ids antes del rollback
+                for registro in lote:
+                    registro.pk = None
+                    registro._state.adding = True
+                self._detener.wait(ESPERA_REINTENTO * intento)
+            finally:
+                close_old_connections()
+
+        for registro in lote:
+            close_old_connections()
+            try:
+                guardar_sincrono(registro)
+            except Exception:
+                logger.exception('No se pudo guardar el registro de auditoría %s %s #%s',
+                                 registro.accion, registro.modelo, registro.objeto_id)
+            finally:
+                close_old_connections()
+
+    def _ejecutar(self):
+        while not self._detener.is_set():
+            lote = self._tomar_lote(espera=self.flush_interval)
+            if lote:
+                self._guardar(lote)
+
+
+def guardar_sincrono(registro):
+    """Guarda un AuditLog de inmediato junto con su conteo diario"""
+    from .models import AuditDailyRollup
+
+    with transaction.atomic():
+        registro.save()
+        AuditDailyRollup.acumular([registro])
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    """Instancia única del escritor de auditoría del proceso"""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = AuditWriter(
+                    batch_size=getattr(settings, 'AUDIT_LOG_BATCH_SIZE', 100),
+                    flush_interval=getattr(settings, 'AUDIT_LOG_FLUSH_INTERVAL', 2.0),
+                    max_queue=getattr(settings, 'AUDIT_LOG_MAX_QUEUE', 10000),
+                )
+                atexit.register(_writer.detener)
+    return _writer
+
+
+def registrar(**campos):
+    """
+    Registra una acción de auditoría.
+
+    En modo asíncrono el registro se encola al confirmarse la transacción
+    actual (si esta se revierte, el registro se descarta igual que antes).
+    En modo síncrono se inserta de inmediato y se retorna guardado.
+
+    Returns:
+        AuditLog: El registro (sin id si aún está en cola)
+    """
+    from django.utils import timezone
+    from .models import AuditLog
+
+    campos.setdefault('timestamp', timezone.now())
+    registro = AuditLog(**campos)
+
+    if not getattr(settings, 'AUDIT_LOG_ASYNC', True):
+        guardar_sincrono(registro)
+        return registro
+
+    writer = get_writer()
+    transaction.on_commit(lambda: writer.encolar(registro))
+    return registro
+
+
+# ============================================
+# ARCHIVO HISTÓRICO
+# ============================================
+# Los registros más antiguos que la ventana de retención se mueven a un
+# archivo comprimido por mes (auditlog_AAAA_MM.jsonl.gz), ya serializados
+# con AuditLogSerializer para devolverlos tal cual desde la API.
+
+def dias_retencion():
+    return getattr(settings, 'AUDIT_LOG_RETENTION_DAYS', 90)
+
+
+def inicio_ventana():
+    """Fecha desde la cual los registros siguen en la tabla AuditLog"""
+    from django.utils import timezone
+    return timezone.now() - timedelta(days=dias_retencion())
+
+
+def _directorio_archivo():
+    return Path(getattr(settings, 'AUDIT_LOG_ARCHIVE_DIR', Path(settings.BASE_DIR) / 'auditoria_archivo'))
+
+
+def _ruta_mes(anio, mes):
+    return _directorio_archivo() / f'auditlog_{anio:04d}_{mes:02d}.jsonl.gz'
+
+
+def parsear_fecha(valor, fin_de_dia=False):
+    """Convierte un parámetro fecha_desde/fecha_hasta (fecha o fecha-hora) en datetime aware"""
+    from django.utils import timezone
+    from django.utils.dateparse import parse_date, parse_datetime
+
+    if not valor:
+        return None
+    try:
+        fecha_hora = parse_datetime(valor)
+        if fecha_hora is None:
+            fecha = parse_date(valor)
+            if fecha is None:
+                return None
+            fecha_hora = datetime.combine(fecha, time.max if fin_de_dia else time.min)
+    except ValueError:
+        return None
+    if timezone.is_naive(fecha_hora):
+        fecha_hora = timezone.make_aware(fecha_hora)
+    return fecha_hora
+
+
+def archivar(antes_de=None, tamano_lote=1000):
+    """
+    Mueve los AuditLog anteriores a `antes_de` a los archivos mensuales.
+
+    Cada lote se escribe (y se sincroniza a disco) antes de borrarse de la
+    tabla; si el proceso se interrumpe entre ambos pasos, el lote queda
+    duplicado en el archivo y la lectura lo descarta por id.
+
+    Returns:
+        int: Cantidad de registros archivados
+    """
+    from django.utils import timezone
+    from django.core.serializers.json import DjangoJSONEncoder
+    from .models import AuditLog
+    from .serializers import AuditLogSerializer
+
+    antes_de = antes_de or inicio_ventana()
+    _directorio_archivo().mkdir(parents=True, exist_ok=True)
+
+    total = 0
+    while True:
+        lote = list(
+            AuditLog.objects.filter(timestamp__lt=antes_de)
+            .select_related('usuario')
+            .order_by('id')[:tamano_lote]
+        )
+        if not lote:
+            return total
+
+        por_mes = {}
+        for registro, dato in zip(lote, AuditLogSerializer(lote, many=True).data):
+            fecha = timezone.localtime(registro.timestamp)
+            por_mes.setdefault((fecha.year, fecha.month), []).append(dato)
+
+        for (anio, mes), datos in por_mes.items():
+            lineas = ''.join(json.dumps(dato, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n' for dato in datos)
+            # Cada lote se agrega como un miembro gzip nuevo; gzip los lee como uno solo
+            with open(_ruta_mes(anio, mes), 'ab') as archivo:
+                archivo.write(gzip.compress(lineas.encode('utf-8')))
+                archivo.flush()
+                os.fsync(archivo.fileno())
+
+        AuditLog.objects.filter(id__in=[registro.id for registro in lote]).delete()
+        total += len(lote)
+
+
+def _meses_entre(desde, hasta):
+    """Meses (año, mes) de hasta a desde, del más reciente al más antiguo"""
+    anio, mes = hasta.year, hasta.month
+    while (anio, mes) >= (desde.year, desde.month):
+        yield anio, mes
+        anio, mes = (anio - 1, 12) if mes == 1 else (anio, mes - 1)
+
+
+def leer_archivo(desde, hasta=None, usuario=None, accion=None, modelo=None, antes_de=None):
+    """
+    Registros archivados entre dos fechas, con los mismos filtros de la API.
+
+    Se lee un archivo mensual a la vez, del mes más reciente al más antiguo,
+    así que quien consume el iterador y se detiene (una página llena) no
+    descomprime los meses siguientes.
+
+    Args:
+        antes_de: (timestamp, id) del último registro entregado; solo se
+            retornan los anteriores a él (cursor de paginación)
+
+    Yields:
+        dict: Registros serializados, del más reciente al más antiguo
+    """
+    from django.utils import timezone
+    from django.utils.dateparse import parse_datetime
+
+    desde = timezone.localtime(desde)
+    hasta = timezone.localtime(hasta or timezone.now())
+    if antes_de is not None:
+        hasta = min(hasta, timezone.localtime(antes_de[0]))
+
+    for anio, mes in _meses_entre(desde, hasta):
+        ruta = _ruta_mes(anio, mes)
+        if not ruta.exists():
+            continue
+        registros = {}
+        with gzip.open(ruta, 'rt', encoding='utf-8') as archivo:
+            for linea in archivo:
+                dato = json.loads(linea)
+                fecha = parse_datetime(dato['timestamp'])
+                if not desde <= fecha <= hasta:
+                    continue
+                if antes_de is not None and (fecha, dato['id']) >= antes_de:
+                    continue
+                if accion and dato['accion'] != accion:
+                    continue
+                if modelo and dato['modelo'] != modelo:
+                    continue
+                if usuario:
+                    if usuario.isdigit():
+                        if str(dato['usuario']) != usuario:
+                            continue
+                    elif usuario.lower() not in (dato.get('usuario_nombre') or '').lower():
+                        continue
+                registros[dato['id']] = (fecha, dato)
+
+        # Un lote repetido por un archivado interrumpido se descarta por id
+        for _, dato in sorted(registros.values(), key=lambda par: (par[0], par[1]['id']), reverse=True):
+            yield dato
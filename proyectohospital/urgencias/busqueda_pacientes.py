@@ -0,0 +1,140 @@
+"""
+Búsqueda de pacientes por nombre, apellido, ID temporal o RUT.
+
+Buscar con icontains sobre nombres y apellidos obliga a MySQL a recorrer la
+tabla completa ('%texto%' no usa índices). En su lugar cada paciente tiene
+sus palabras normalizadas (minúsculas, sin tildes ni signos) en la tabla
+PacienteToken, indexada por token; cada palabra buscada se resuelve como
+prefijo ('texto%'), que es un rango del índice.
+
+Todas las palabras buscadas deben coincidir con alguna palabra del
+paciente. La consulta parte de la palabra más larga (la más selectiva):
+sus coincidencias, primero las de palabra completa y luego las más
+recientes, dan a lo más MAX_CANDIDATOS pacientes, y solo esos se agrupan y
+puntúan con el resto de las palabras. Los resultados se ordenan por
+calidad: palabra completa antes que prefijo, y luego por paciente más
+reciente.
+
+Se evaluó un índice FULLTEXT de MySQL, pero InnoDB no indexa palabras más
+cortas que innodb_ft_min_token_size (3) ni las de su lista de stopwords, y
+se perderían apellidos cortos; el índice B-tree de prefijos funciona igual
+en todos los motores.
+
+El índice se actualiza en Paciente.save(); los cambios hechos con
+QuerySet.update() o directamente en la base de datos se reindexan con
+`python manage.py reindexar_pacientes`.
+"""
+import re
+import unicodedata
+
+from django.db import transaction
+
+LARGO_TOKEN = 50
+MAX_PALABRAS = 5
+# Pacientes que se puntúan por búsqueda (los que coinciden con la palabra más larga)
+MAX_CANDIDATOS = 500
+_NO_ALFANUMERICO = re.compile(r'[^a-z0-9]+')
+_RUT = re.compile(r'^[0-9.]+-?[0-9kK]?$')
+
+
+def normalizar(texto):
+    """'José Pérez-Soto' -> 'jose perez soto'"""
+    sin_tildes = unicodedata.normalize('NFKD', texto or '').encode('ascii', 'ignore').decode()
+    return _NO_ALFANUMERICO.sub(' ', sin_tildes.lower()).strip()
+
+
+def _rut_compacto(rut):
+    """'12.345.678-k' -> '12345678k' (se busca por prefijo como una sola palabra)"""
+    return _NO_ALFANUMERICO.sub('', (rut or '').lower())
+
+
+def tokens(nombres='', apellidos='', id_temporal='', rut=''):
+    """Palabras indexadas de un paciente"""
+    palabras = set(normalizar(f'{nombres} {apellidos} {id_temporal or ""}').split())
+    if rut:
+        palabras.add(_rut_compacto(rut))
+    return {palabra[:LARGO_TOKEN] for palabra in palabras if palabra}
+
+
+def indexar(paciente):
+    """Reemplaza las palabras indexadas del paciente"""
+    from .models import PacienteToken
+
+    with transaction.atomic():
+        PacienteToken.objects.filter(paciente_id=paciente.id).delete()
+        PacienteToken.objects.bulk_create([
+            PacienteToken(paciente_id=paciente.id, token=token)
+            for token in tokens(paciente.nombres, paciente.apellidos, paciente.id_temporal, paciente.rut)
+        ])
+
+
+def palabras_busqueda(q):
+    """Palabras normalizadas de la consulta (un RUT se busca como una sola palabra)"""
+    if _RUT.match(q.strip()):
+        return [_rut_compacto(q)[:LARGO_TOKEN]]
+    palabras = list(dict.fromkeys(palabra[:LARGO_TOKEN] for palabra in normalizar(q).split()))
+    # Las más largas primero: son las más selectivas
+    return sorted(palabras, key=len, reverse=True)[:MAX_PALABRAS]
+
+
+def candidatos(palabra):
+    """
+    Pacientes con alguna palabra que empieza por `palabra`: primero los que
+    la tienen completa (igualdad en el índice) y luego por prefijo, los más
+    recientes primero, a lo más MAX_CANDIDATOS.
+    """
+    from .models import PacienteToken
+
+    tokens_paciente = PacienteToken.objects.order_by('-paciente_id').values_list('paciente_id', flat=True)
+    # Las palabras de un paciente no se repiten: a lo más una coincidencia completa por paciente
+    ids = list(tokens_paciente.filter(token=palabra)[:MAX_CANDIDATOS])
+    if len(ids) < MAX_CANDIDATOS:
+        prefijos = tokens_paciente.filter(token__istartswith=palabra).exclude(paciente_id__in=ids).distinct()
+        ids.extend(prefijos[:MAX_CANDIDATOS - len(ids)])
+    return ids
+
+
+def buscar(q, limite=10):
+    """
+    Pacientes que coinciden con todas las palabras de `q`, mejores primero.
+
+    Returns:
+        list: Pacientes (a lo más `limite`)
+    """
+    from django.db.models import Case, F, IntegerField, Max, Q, Value, When
+    from .models import Paciente, PacienteToken
+
+    palabras = palabras_busqueda(q)
+    if not palabras:
+        return []
+
+    ids = candidatos(palabras[0])
+    if not ids:
+        return []
+
+    coincide = Q()
+    puntajes = {}
+    for i, palabra in enumerate(palabras):
+        # istartswith es LIKE 'palabra%' en MySQL (rango del índice); los
+        # tokens ya están en minúsculas
+        coincide |= Q(token__istartswith=palabra)
+        # 2 si la palabra es completa, 1 si es prefijo de la palabra del paciente
+        puntajes[f'p{i}'] = Max(Case(
+            When(token=palabra, then=2),
+            When(token__istartswith=palabra, then=1),
+            default=0,
+            output_field=IntegerField(),
+        ))
+
+    mejores = list(
+        PacienteToken.objects.filter(coincide, paciente_id__in=ids)
+        .values('paciente_id')
+        .annotate(**puntajes)
+        .filter(**{f'{nombre}__gt': 0 for nombre in puntajes})
+        .annotate(puntaje=sum((F(nombre) for nombre in puntajes), Value(0)))
+        .order_by('-puntaje', '-paciente_id')
+        .values_list('paciente_id', flat=True)[:limite]
+    )
+
+    pacientes = Paciente.objects.in_bulk(mejores)
+    return [pacientes[paciente_id] for paciente_id in mejores if paciente_id in pacientes]
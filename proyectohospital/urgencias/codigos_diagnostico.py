@@ -0,0 +1,77 @@
+"""
+Códigos de diagnóstico DX-YYYYMMDD-XXXX sin repeticiones.
+
+Buscar el último código del día y sumarle uno cuesta una consulta más por
+diagnóstico y, con dos altas simultáneas, ambas calculan el mismo código y
+una falla contra la restricción única. En su lugar cada día tiene una fila
+en SecuenciaDiagnostico con el último correlativo usado, y reservar() la
+incrementa con un solo UPDATE ... SET ultimo = ultimo + n: el motor bloquea
+la fila hasta el fin de la transacción, así que dos altas nunca reciben el
+mismo número. Si la transacción se revierte, el correlativo también.
+
+La primera reserva del día crea la fila, partiendo del último código ya
+existente ese día (por los códigos anteriores a esta tabla).
+
+Para importaciones masivas se reserva un bloque de n códigos con una sola
+actualización: reservar(n) o asignar(diagnosticos) antes del bulk_create.
+"""
+from django.db import IntegrityError, transaction
+
+PREFIJO = 'DX'
+
+
+def formatear(fecha, numero):
+    return f'{PREFIJO}-{fecha:%Y%m%d}-{numero:04d}'
+
+
+def _ultimo_existente(fecha):
+    """Mayor correlativo ya usado por los diagnósticos del día"""
+    from .models import Diagnostico
+
+    prefijo = formatear(fecha, 0)[:-4]
+    maximo = 0
+    for codigo in Diagnostico.objects.filter(codigo_diagnostico__startswith=prefijo).values_list('codigo_diagnostico', flat=True):
+        try:
+            maximo = max(maximo, int(codigo.split('-')[-1]))
+        except (ValueError, IndexError):
+            continue
+    return maximo
+
+
+def reservar(cantidad=1, fecha=None):
+    """
+    Reserva cantidad códigos consecutivos del día.
+
+    Returns:
+        list: Los códigos reservados, en orden
+    """
+    from django.db.models import F
+    from django.utils import timezone
+    from .models import SecuenciaDiagnostico
+
+    if cantidad < 1:
+        raise ValueError('La cantidad debe ser mayor o igual a 1')
+    fecha = fecha or timezone.now().date()
+
+    with transaction.atomic():
+        secuencia = SecuenciaDiagnostico.objects.filter(fecha=fecha)
+        if not secuencia.update(ultimo=F('ultimo') + cantidad):
+            try:
+                # Primera reserva del día (savepoint: otra puede crearla a la vez)
+                with transaction.atomic():
+                    SecuenciaDiagnostico.objects.create(fecha=fecha, ultimo=_ultimo_existente(fecha) + cantidad)
+            except IntegrityError:
+                secuencia.update(ultimo=F('ultimo') + cantidad)
+        # La fila sigue bloqueada por el UPDATE/INSERT: nadie la cambió entretanto
+        ultimo = secuencia.values_list('ultimo', flat=True).get()
+
+    return [formatear(fecha, numero) for numero in range(ultimo - cantidad + 1, ultimo + 1)]
+
+
+def asignar(diagnosticos):
+    """Asigna códigos en bloque a los diagnósticos sin código (para bulk_create)"""
+    sin_codigo = [diagnostico for diagnostico in diagnosticos if not diagnostico.codigo_diagnostico]
+    if sin_codigo:
+        for diagnostico, codigo in zip(sin_codigo, reservar(len(sin_codigo))):
+            diagnostico.codigo_diagnostico = codigo
+    return diagnosticos
@@ -1,9 +1,11 @@
 """
 WebSocket consumers para chat en tiempo real entre paramédico, TENS y médico
+y para notificaciones push por usuario
 """
 import json
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
 from django.utils import timezone
 
 
@@ -233,3 +235,173 @@ class ChatConsumer(AsyncWebsocketConsumer):
         mensajes = MensajeChat.objects.filter(id__in=mensaje_ids, ficha_id=self.ficha_id)
         for mensaje in mensajes:
             mensaje.marcar_como_leido(self.user)
+
+
+class NotificacionConsumer(AsyncWebsocketConsumer):
+    """
+    Consumer para notificaciones en tiempo real del usuario conectado.
+    
+    Se une a su grupo personal y al grupo de su rol, de modo que las
+    notificaciones masivas (notificar_rol, notificar_roles_en_turno, ...)
+    llegan con un solo envío por rol; ese evento no trae el id de cada
+    destinatario, así que se leen desde el cursor las del usuario. Acepta
+    ?last_notification_id=N para recibir primero las notificaciones
+    perdidas durante una desconexión.
+    """
+    
+    async def connect(self):
+        from urllib.parse import parse_qs
+        from .eventos import grupo_usuario, grupo_rol
+        
+        self.user = self.scope['user']
+        
+        # Solo usuarios autenticados pueden conectarse
+        if not self.user.is_authenticated:
+            await self.close()
+            return
+        
+        self.grupos = [grupo_usuario(self.user.id), grupo_rol(self.user.rol)]
+        for grupo in self.grupos:
+            await self.channel_layer.group_add(grupo, self.channel_name)
+        
+        await self.accept()
+        
+        # Reenviar notificaciones pendientes desde el último id conocido por el cliente
+        query = parse_qs(self.scope.get('query_string', b'').decode())
+        try:
+            last_notification_id = int(query.get('last_notification_id', ['0'])[0])
+        except ValueError:
+            last_notification_id = 0
+        
+        self.last_notification_id = last_notification_id or await self.get_ultimo_id()
+        await self.ponerse_al_dia()
+    
+    async def disconnect(self, close_code):
+        for grupo in getattr(self, 'grupos', []):
+            await self.channel_layer.group_discard(grupo, self.channel_name)
+    
+    async def receive(self, text_data):
+        """Recibe mensajes del WebSocket (solo ping para mantener viva la conexión)"""
+        data = json.loads(text_data)
+        if data.get('type') == 'ping':
+            await self.send(text_data=json.dumps({'type': 'pong'}))
+    
+    async def notificacion(self, event):
+        """Notificación dirigida a este usuario"""
+        await self.enviar_notificacion(event['notificacion'])
+    
+    async def notificacion_rol(self, event):
+        """Notificación masiva al rol: se envían las del usuario creadas desde el cursor"""
+        await self.ponerse_al_dia()
+    
+    async def ponerse_al_dia(self):
+        for notificacion in await self.get_pendientes(self.last_notification_id):
+            await self.enviar_notificacion(notificacion)
+    
+    async def enviar_notificacion(self, notificacion):
+        if notificacion['id'] <= self.last_notification_id:
+            return
+        self.last_notification_id = notificacion['id']
+        await self.send(text_data=json.dumps({
+            'type': 'notificacion',
+            'notificacion': notificacion,
+        }))
+    
+    @database_sync_to_async
+    def get_ultimo_id(self):
+        """Id de la última notificación del usuario (0 si no tiene)"""
+        from django.db.models import Max
+        from .models import Notificacion
+        
+        return Notificacion.objects.filter(usuario=self.user).aggregate(tope=Max('id'))['tope'] or 0
+    
+    @database_sync_to_async
+    def get_pendientes(self, last_notification_id):
+        """Notificaciones del usuario posteriores al último id recibido"""
+        from .models import Notificacion
+        from .serializers import NotificacionSerializer
+        
+        notificaciones = Notificacion.objects.filter(
+            usuario=self.user,
+            id__gt=last_notification_id
+        ).order_by('id')[:100]
+        return json.loads(json.dumps(
+            NotificacionSerializer(notificaciones, many=True).data,
+            cls=DjangoJSONEncoder
+        ))
+
+
+class SignosVitalesConsumer(AsyncWebsocketConsumer):
+    """
+    Consumer para la carga continua de signos vitales desde el monitor de
+    una ambulancia.
+    
+    El monitor envía {"type": "lecturas", "lote": <id del cliente>, "lecturas": [...]}
+    y recibe {"type": "lote_registrado", ...} o {"type": "error", ...} con el
+    mismo "lote" para reintentar solo los que fallaron (ver ingesta_signos).
+    """
+    
+    async def connect(self):
+        self.ficha_id = self.scope['url_route']['kwargs']['ficha_id']
+        self.user = self.scope['user']
+        
+        # Solo usuarios autenticados pueden conectarse
+        if not self.user.is_authenticated:
+            await self.close()
+            return
+        
+        self.ficha = await self.get_ficha()
+        if self.ficha is None:
+            await self.close()
+            return
+        
+        await self.accept()
+    
+    async def receive(self, text_data):
+        """Recibe un lote de lecturas del monitor"""
+        try:
+            data = json.loads(text_data)
+        except ValueError:
+            await self.enviar({'type': 'error', 'error': 'JSON inválido'})
+            return
+        
+        message_type = data.get('type', 'lecturas')
+        if message_type == 'ping':
+            await self.enviar({'type': 'pong'})
+            return
+        if message_type != 'lecturas':
+            return
+        
+        respuesta = await self.registrar(data.get('lecturas'))
+        respuesta['lote'] = data.get('lote')
+        await self.enviar(respuesta)
+    
+    async def enviar(self, datos):
+        await self.send(text_data=json.dumps(datos, cls=DjangoJSONEncoder))
+    
+    @database_sync_to_async
+    def get_ficha(self):
+        from .models import FichaEmergencia
+        
+        return FichaEmergencia.objects.select_related('paciente', 'medico_asignado').filter(
+            id=self.ficha_id
+        ).first()
+    
+    @database_sync_to_async
+    def registrar(self, lecturas):
+        """Valida y guarda el lote; retorna la respuesta para el monitor"""
+        from .ingesta_signos import validar_lecturas, registrar_lote
+        
+        datos, errores = validar_lecturas(lecturas)
+        if errores:
+            return {'type': 'error', 'error': errores}
+        
+        headers = dict(self.scope.get('headers', []))
+        cliente = self.scope.get('client') or [None]
+        resultado = registrar_lote(
+            self.ficha, datos,
+            usuario=self.user,
+            ip_address=cliente[0],
+            user_agent=headers.get(b'user-agent', b'').decode(errors='ignore')
+        )
+        return {'type': 'lote_registrado', **resultado}
@@ -0,0 +1,204 @@
+"""
+Búsqueda de pacientes NN que probablemente son un paciente ya identificado.
+
+Cuando se identifica a un paciente (RUT, nombre, fecha de nacimiento), sus
+atenciones como NN quedaron en otro registro. En vez de revisar a mano los
+NN, se buscan candidatos en dos pasos:
+
+1. Bloqueo en la base de datos: solo pacientes NN del mismo sexo,
+   registrados dentro de la ventana de días y con edad aproximada
+   compatible (o sin edad). Usa el índice (es_nn, sexo, fecha_registro),
+   así que el costo no depende del total de pacientes, solo de los NN
+   recientes.
+2. Puntaje en Python sobre los candidatos: similitud difusa (difflib) entre
+   el nombre buscado y las palabras de las características del NN
+   ('dice llamarse Juan Pérez'), cercanía de la edad y antigüedad.
+
+fusionar() traspasa las fichas de los NN al paciente identificado con un
+solo UPDATE y elimina los registros NN. También la usa el comando
+revisar_ruts_duplicados para fusionar, tras revisarlos, pacientes
+identificados con el mismo RUT (solo_nn=False).
+
+Configuración (settings):
+    NN_VENTANA_DIAS: Días hacia atrás en que se buscan pacientes NN.
+    NN_TOLERANCIA_EDAD: Años de diferencia aceptados con la edad aproximada.
+"""
+from datetime import date, timedelta
+from difflib import SequenceMatcher
+
+from django.conf import settings
+from django.db import transaction
+
+from .busqueda_pacientes import normalizar
+
+MAX_CANDIDATOS = 500
+# Palabras con que se registran los NN (nombres='Paciente', apellidos='NN')
+PALABRAS_NN = {'paciente', 'nn', 'desconocido', 'desconocida', 'sin', 'nombre'}
+SIMILITUD_MINIMA = 0.75
+PESOS = {'nombre': 0.6, 'edad': 0.3, 'reciente': 0.1}
+
+
+def ventana_dias():
+    return getattr(settings, 'NN_VENTANA_DIAS', 90)
+
+
+def tolerancia_edad():
+    return getattr(settings, 'NN_TOLERANCIA_EDAD', 10)
+
+
+def _edad(fecha_nacimiento, hoy):
+    return hoy.year - fecha_nacimiento.year - ((hoy.month, hoy.day) < (fecha_nacimiento.month, fecha_nacimiento.day))
+
+
+def _palabras(texto):
+    return [palabra for palabra in normalizar(texto).split() if len(palabra) >= 3 and palabra not in PALABRAS_NN]
+
+
+def similitud_nombre(buscadas, palabras_nn):
+    """
+    Promedio, sobre las palabras del nombre buscado, de la mejor similitud
+    con alguna palabra del NN (0 si ninguna alcanza SIMILITUD_MINIMA).
+    """
+    if not buscadas or not palabras_nn:
+        return 0.0
+    total = 0.0
+    for buscada in buscadas:
+        mejor = 0.0
+        for palabra in palabras_nn:
+            comparador = SequenceMatcher(None, buscada, palabra)
+            # quick_ratio es una cota superior barata de ratio
+            if comparador.quick_ratio() >= SIMILITUD_MINIMA:
+                mejor = max(mejor, comparador.ratio())
+        total += mejor if mejor >= SIMILITUD_MINIMA else 0.0
+    return total / len(buscadas)
+
+
+def candidatos(nombres='', apellidos='', fecha_nacimiento=None, sexo=None, rut_numero=None, dias=None, limite=10):
+    """
+    Pacientes NN que podrían ser la persona identificada, mejores primero.
+
+    Returns:
+        list: dicts {'paciente', 'puntaje', 'similitud_nombre', 'diferencia_edad'}
+    """
+    from django.db.models import Q
+    from django.utils import timezone
+    from .models import Paciente
+
+    hoy = date.today()
+    dias = ventana_dias() if dias is None else dias
+    desde = timezone.now() - timedelta(days=dias)
+
+    nn = Paciente.objects.filter(es_nn=True, fecha_registro__gte=desde)
+    if sexo:
+        nn = nn.filter(sexo=sexo)
+    edad = _edad(fecha_nacimiento, hoy) if fecha_nacimiento else None
+    if edad is not None:
+        nn = nn.filter(
+            Q(edad_aproximada__isnull=True) |
+            Q(edad_aproximada__range=(edad - tolerancia_edad(), edad + tolerancia_edad()))
+        )
+    nn = nn.order_by('-fecha_registro')[:MAX_CANDIDATOS]
+
+    buscadas = list(dict.fromkeys(_palabras(f'{nombres} {apellidos}')))
+    resultados = []
+    for paciente in nn:
+        if rut_numero and paciente.rut_numero == rut_numero:
+            # El NN ya tenía el RUT anotado: coincidencia segura
+            puntaje, similitud = 1.0, 1.0
+        else:
+            similitud = similitud_nombre(
+                buscadas, _palabras(f'{paciente.nombres} {paciente.apellidos} {paciente.caracteristicas or ""}')
+            )
+            if paciente.fecha_nacimiento and fecha_nacimiento:
+                cercania_edad = 1.0 if paciente.fecha_nacimiento == fecha_nacimiento else 0.0
+            elif edad is not None and paciente.edad_aproximada is not None:
+                cercania_edad = max(0.0, 1 - abs(edad - paciente.edad_aproximada) / (tolerancia_edad() + 1))
+            else:
+                cercania_edad = 0.5  # sin datos para comparar
+            dias_registro = (timezone.now() - paciente.fecha_registro).days
+            reciente = max(0.0, 1 - dias_registro / max(dias, 1))
+            puntaje = (
+                PESOS['nombre'] * similitud
+                + PESOS['edad'] * cercania_edad
+                + PESOS['reciente'] * reciente
+            )
+        resultados.append({
+            'paciente': paciente,
+            'puntaje': round(puntaje, 3),
+            'similitud_nombre': round(similitud, 3),
+            'diferencia_edad': (
+                abs(edad - paciente.edad_aproximada)
+                if edad is not None and paciente.edad_aproximada is not None else None
+            ),
+        })
+
+    resultados.sort(key=lambda resultado: (-resultado['puntaje'], -resultado['paciente'].id))
+    return resultados[:limite]
+
+
+def fusionar(destino, nn_ids, usuario=None, ip_address=None, user_agent='', solo_nn=True):
+    """
+    Traspasa las fichas de los pacientes NN al paciente identificado y
+    elimina los registros NN.
+
+    Args:
+        solo_nn: Con False se aceptan también pacientes identificados
+            (duplicados del destino, ver revisar_ruts_duplicados)
+
+    Returns:
+        dict: {'paciente', 'fusionados', 'fichas'}
+
+    Raises:
+        ValueError: si algún id no es un paciente NN distinto del destino
+    """
+    from .auditoria import registrar
+    from .models import FichaEmergencia, Paciente
+    from .tablero import registrar_cambio
+
+    nn_ids = sorted(set(nn_ids))
+    if not nn_ids:
+        raise ValueError('Debe indicar al menos un paciente NN')
+    if destino.id in nn_ids:
+        raise ValueError('Un paciente no se puede fusionar consigo mismo')
+    if destino.es_nn:
+        raise ValueError('El paciente de destino debe estar identificado')
+
+    with transaction.atomic():
+        # Bloqueo en orden de id: dos fusiones simultáneas no se cruzan
+        bloqueados = list(
+            Paciente.objects.select_for_update()
+            .filter(id__in=[destino.id, *nn_ids]).order_by('id')
+            .values('id', 'es_nn', 'id_temporal', 'caracteristicas', 'rut', 'nombres', 'apellidos')
+        )
+        nn = [paciente for paciente in bloqueados if paciente['id'] != destino.id]
+        if len(nn) != len(nn_ids):
+            raise ValueError('Todos los pacientes a fusionar deben existir')
+        if solo_nn and not all(paciente['es_nn'] for paciente in nn):
+            raise ValueError('Todos los pacientes a fusionar deben existir y ser NN')
+
+        fichas = FichaEmergencia.objects.filter(paciente_id__in=nn_ids)
+        fichas_ids = list(fichas.values_list('id', flat=True))
+        fichas.update(paciente=destino)
+        # Las fichas ya no apuntan a los NN: solo se borran ellos y sus tokens
+        Paciente.objects.filter(id__in=nn_ids).delete()
+
+        registrar(
+            usuario=usuario,
+            accion='editar',
+            modelo='Paciente',
+            objeto_id=destino.id,
+            detalles={
+                'fusion_nn' if solo_nn else 'fusion_duplicados': [
+                    {'id': paciente['id'], 'id_temporal': paciente['id_temporal'],
+                     'caracteristicas': paciente['caracteristicas'], 'rut': paciente['rut'],
+                     'nombre': f"{paciente['nombres']} {paciente['apellidos']}"}
+                    for paciente in nn
+                ],
+                'fichas': fichas_ids,
+            },
+            ip_address=ip_address,
+            user_agent=(user_agent or '')[:500]
+        )
+        registrar_cambio(*fichas_ids)
+
+    return {'paciente': destino.id, 'fusionados': nn_ids, 'fichas': fichas_ids}
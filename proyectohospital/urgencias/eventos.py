@@ -0,0 +1,117 @@
+"""
+Publicación de eventos en tiempo real (chat y notificaciones).
+
+Los eventos se envían a los grupos del channel layer de Django Channels,
+de modo que tanto los WebSockets como el stream SSE (/api/eventos/) los
+reciben en el momento en que se escriben, sin que el cliente tenga que
+hacer polling.
+"""
+import json
+import logging
+
+from asgiref.sync import async_to_sync
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+
+def grupo_usuario(usuario_id):
+    """Nombre del grupo personal de un usuario"""
+    return f'usuario_{usuario_id}'
+
+
+def grupo_rol(rol):
+    """Nombre del grupo compartido por todos los usuarios de un rol"""
+    return f'rol_{rol}'
+
+
+def grupo_chat(ficha_id):
+    """Nombre del grupo de chat de una ficha (el mismo que usa ChatConsumer)"""
+    return f'chat_ficha_{ficha_id}'
+
+
+def get_layer():
+    """Obtiene el channel layer configurado o None si Channels no está disponible"""
+    try:
+        from channels.layers import get_channel_layer
+    except ImportError:
+        return None
+    return get_channel_layer()
+
+
+def _a_json(datos):
+    """Convierte datos serializados (ReturnDict, fechas, decimales) a tipos JSON simples"""
+    return json.loads(json.dumps(datos, cls=DjangoJSONEncoder))
+
+
+def _enviar(envios):
+    """Envía una lista de (grupo, mensaje) al channel layer, sin propagar errores"""
+    layer = get_layer()
+    if layer is None:
+        return
+    for grupo, mensaje in envios:
+        try:
+            async_to_sync(layer.group_send)(grupo, mensaje)
+        except Exception:
+            logger.exception('No se pudo publicar el evento %s en %s', mensaje.get('type'), grupo)
+
+
+def publicar(envios):
+    """
+    Publica eventos una vez confirmada la transacción actual.
+
+    Args:
+        envios: Lista de tuplas (grupo, mensaje). Cada mensaje debe tener 'type'.
+    """
+    envios = list(envios)
+    if envios:
+        transaction.on_commit(lambda: _enviar(envios))
+
+
+def publicar_notificaciones(notificaciones):
+    """Publica cada notificación en el grupo personal de su destinatario"""
+    from .serializers import NotificacionSerializer
+
+    notificaciones = list(notificaciones)
+    if not notificaciones:
+        return
+
+    datos = _a_json(NotificacionSerializer(notificaciones, many=True).data)
+    publicar(
+        (grupo_usuario(notificacion.usuario_id), {'type': 'notificacion', 'notificacion': dato})
+        for notificacion, dato in zip(notificaciones, datos)
+    )
+
+
+def publicar_notificaciones_por_rol(notificaciones):
+    """
+    Publica una notificación masiva con un solo evento por rol.
+
+    Todas las notificaciones comparten contenido y solo cambian destinatario
+    e id, por lo que se serializa una vez y se envía con id None al grupo de
+    cada rol. Los consumidores no toman el id del evento: leen desde su
+    cursor las notificaciones propias, de modo que el evento no lleva datos
+    de otros usuarios y no depende de que bulk_create retorne ids (MySQL).
+    """
+    from .serializers import NotificacionSerializer
+
+    notificaciones = list(notificaciones)
+    if not notificaciones:
+        return
+
+    dato = _a_json(NotificacionSerializer(notificaciones[0]).data)
+    dato['id'] = None
+
+    roles = sorted({notificacion.usuario.rol for notificacion in notificaciones})
+    publicar(
+        (grupo_rol(rol), {'type': 'notificacion_rol', 'notificacion': dato})
+        for rol in roles
+    )
+
+
+def publicar_mensaje(mensaje_data):
+    """Publica un mensaje de chat ya serializado en el grupo de su ficha"""
+    publicar([
+        (grupo_chat(mensaje_data['ficha']), {'type': 'chat_message', 'mensaje': _a_json(mensaje_data)})
+    ])
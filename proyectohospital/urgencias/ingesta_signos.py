@@ -0,0 +1,150 @@
+"""
+Carga por lotes de signos vitales desde los monitores de ambulancia.
+
+Los monitores generan una lectura cada pocos segundos. En lugar de un POST
+por lectura (cada uno con su registro de auditoría, su evaluación de alerta
+temprana y posibles notificaciones), el monitor envía un arreglo de lecturas
+con su hora para una ficha, por HTTP (POST /api/signos-vitales/lote/) o por
+WebSocket (ws/signos-vitales/<ficha_id>/).
+
+Cada lote se valida completo con los rangos de SignosVitalesSerializer, se
+inserta con un solo bulk_create y genera un registro de auditoría y un
+cambio en el tablero. Los umbrales críticos se revisan sobre todas las
+lecturas del lote a la vez (una caída de SpO2 que se recupera dentro del
+lote también alerta); la última lectura queda como los últimos signos
+vitales de la ficha y aporta NEWS2, qSOFA y tendencias. Todo se informa en
+una sola notificación.
+Si alguna lectura no es válida no se guarda ninguna.
+
+Configuración (settings):
+    SIGNOS_LOTE_MAX_LECTURAS: Cantidad máxima de lecturas por lote.
+"""
+from django.conf import settings
+from django.db import transaction
+
+
+def max_lecturas():
+    return getattr(settings, 'SIGNOS_LOTE_MAX_LECTURAS', 500)
+
+
+def validar_lecturas(lecturas):
+    """
+    Valida un lote de lecturas.
+
+    Returns:
+        tuple: (datos validados, None) o (None, errores). Los errores de
+        validación vienen como una lista con los errores de cada lectura.
+    """
+    from .serializers import SignosVitalesLecturaSerializer
+
+    if not isinstance(lecturas, list) or not lecturas:
+        return None, 'Se requiere una lista de lecturas'
+    if len(lecturas) > max_lecturas():
+        return None, f'El lote no puede tener más de {max_lecturas()} lecturas'
+
+    serializer = SignosVitalesLecturaSerializer(data=lecturas, many=True)
+    if not serializer.is_valid():
+        return None, serializer.errors
+    return serializer.validated_data, None
+
+
+def notificar_signos_criticos(ficha, alertas):
+    """Notifica al médico asignado, o a todos los médicos si no hay uno"""
+    from .models import Notificacion
+
+    paciente_nombre = str(ficha.paciente) if ficha.paciente else f"NN-{ficha.id}"
+    mensaje_alertas = "\n".join([f"⚠️ {a}" for a in alertas])
+
+    # Si hay médico asignado, notificar solo a él
+    if ficha.medico_asignado:
+        Notificacion.crear_notificacion(
+            usuario=ficha.medico_asignado,
+            tipo='signos_criticos',
+            titulo='🚨 Signos Vitales Críticos',
+            mensaje=f'Paciente: {paciente_nombre}\n{mensaje_alertas}',
+            ficha=ficha,
+            prioridad='urgente'
+        )
+    else:
+        # Si no hay médico asignado, notificar a todos los médicos
+        Notificacion.notificar_rol(
+            rol='medico',
+            tipo='signos_criticos',
+            titulo='🚨 Signos Vitales Críticos',
+            mensaje=f'Paciente: {paciente_nombre}\n{mensaje_alertas}',
+            ficha=ficha,
+            prioridad='urgente'
+        )
+
+
+def registrar_lote(ficha, lecturas, usuario=None, ip_address=None, user_agent=''):
+    """
+    Guarda un lote de lecturas ya validadas de una ficha.
+
+    Args:
+        ficha: FichaEmergencia (con paciente y medico_asignado cargados)
+        lecturas: Datos validados por validar_lecturas
+        usuario, ip_address, user_agent: Origen del lote para la auditoría
+
+    Returns:
+        dict: {'ficha', 'registradas', 'desde', 'hasta', 'alerta_temprana'}.
+        No incluye los ids de las lecturas (MySQL no los retorna en
+        bulk_create); se consultan con GET /api/signos-vitales/?ficha=<id>.
+    """
+    from django.utils import timezone
+    from .alerta_temprana import alertas_criticas, matriz
+    from .auditoria import registrar
+    from .models import SignosVitales
+    from .tablero import registrar_cambio
+
+    ahora = timezone.now()
+    signos = [SignosVitales(ficha=ficha, **datos) for datos in lecturas]
+    for signo in signos:
+        signo.timestamp = signo.timestamp or ahora
+        signo.calcular_glasgow()
+    desde = min(signo.timestamp for signo in signos)
+    hasta = max(signo.timestamp for signo in signos)
+
+    with transaction.atomic():
+        SignosVitales.objects.bulk_create(signos)
+        # bulk_create no llama a save(): la última lectura del lote (releída
+        # para tener su id) actualiza la ficha y se evalúa una sola vez
+        ultima = SignosVitales.objects.filter(ficha=ficha, timestamp=hasta).order_by('-id').first()
+        resultado = ultima.actualizar_ficha()
+        registrar(
+            usuario=usuario,
+            accion='crear',
+            modelo='SignosVitales',
+            detalles={
+                'ficha_id': ficha.id,
+                'paciente': str(ficha.paciente),
+                'lecturas': len(signos),
+                'desde': desde.isoformat(),
+                'hasta': hasta.isoformat(),
+            },
+            ip_address=ip_address,
+            user_agent=(user_agent or '')[:500]
+        )
+        registrar_cambio(ficha.id)
+
+    # Umbrales críticos de cada lectura del lote, con su hora
+    criticas = alertas_criticas(matriz(signos))
+    alertas = [
+        f"{timezone.localtime(signos[i].timestamp):%H:%M:%S} {'; '.join(mensajes)}"
+        for i, mensajes in sorted(criticas.items(), key=lambda item: signos[item[0]].timestamp)
+    ]
+    # Más NEWS2, qSOFA y tendencias de la última lectura (None si la ficha
+    # ya tenía una lectura posterior al lote); sus umbrales ya están arriba
+    if resultado:
+        umbrales = {mensaje for mensajes in criticas.values() for mensaje in mensajes}
+        alertas += [alerta for alerta in resultado['alertas'] if alerta not in umbrales]
+    if alertas:
+        notificar_signos_criticos(ficha, alertas)
+
+    return {
+        'ficha': ficha.id,
+        'registradas': len(signos),
+        'desde': desde,
+        'hasta': hasta,
+        'alerta_temprana': resultado,
+    }
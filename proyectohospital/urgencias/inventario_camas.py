@@ -0,0 +1,162 @@
+"""
+Creación y eliminación de camas en bloque.
+
+Las camas se describen con un patrón de numeración (prefijo, número inicial,
+cantidad, dígitos: BOX-01 ... BOX-40) o con un CSV de columnas
+numero,tipo,piso,sala,observaciones. Todas se validan antes de escribir: la
+unicidad de los números se revisa con una sola consulta y, si alguna fila
+tiene errores, no se crea ninguna. Luego se insertan con bulk_create en
+lotes de LOTE filas.
+
+La eliminación borra en lotes de LOTE ids, solo camas disponibles. Cama no
+tiene relaciones que la apunten, así que cada lote es un solo DELETE.
+
+Las vistas registran un único registro de auditoría con el resumen.
+
+Configuración (settings):
+    CAMAS_INVENTARIO_MAX: Cantidad máxima de camas por operación.
+"""
+import csv
+import io
+
+from django.conf import settings
+from django.db import transaction
+
+LOTE = 500
+COLUMNAS_CSV = ('numero', 'tipo', 'piso', 'sala', 'observaciones')
+
+
+def max_camas():
+    return getattr(settings, 'CAMAS_INVENTARIO_MAX', 2000)
+
+
+def prefijo_por_defecto(tipo):
+    return {'box': 'BOX', 'uci': 'UCI'}.get(tipo, tipo.upper().replace('_', '-'))
+
+
+def desde_patron(tipo, cantidad, prefijo=None, inicio=None, digitos=2, piso=None, sala=None):
+    """
+    Filas de camas numeradas {prefijo}-{n}.
+
+    Sin inicio se continúa después de las camas existentes del tipo,
+    saltando los números ya usados (dos consultas).
+    """
+    from .models import Cama
+
+    prefijo = prefijo or prefijo_por_defecto(tipo)
+    if inicio is None:
+        usados = set(Cama.objects.filter(numero__startswith=f'{prefijo}-').values_list('numero', flat=True))
+        numero = Cama.objects.filter(tipo=tipo).count() + 1
+        numeros = []
+        while len(numeros) < cantidad:
+            candidato = f'{prefijo}-{numero:0{digitos}d}'
+            if candidato not in usados:
+                numeros.append(candidato)
+            numero += 1
+    else:
+        numeros = [f'{prefijo}-{numero:0{digitos}d}' for numero in range(inicio, inicio + cantidad)]
+    return [{'numero': numero, 'tipo': tipo, 'piso': piso, 'sala': sala} for numero in numeros]
+
+
+def desde_csv(texto):
+    """Filas de camas desde un CSV con encabezado (numero y tipo obligatorios)"""
+    lector = csv.DictReader(io.StringIO(texto.lstrip('\ufeff')))
+    faltantes = {'numero', 'tipo'} - set(lector.fieldnames or [])
+    if faltantes:
+        raise ValueError(f'El CSV debe tener las columnas: {", ".join(sorted(faltantes))}')
+    return [
+        {columna: (fila.get(columna) or '').strip() or None for columna in COLUMNAS_CSV}
+        for fila in lector
+    ]
+
+
+def validar(filas):
+    """
+    Valida las filas y arma las camas sin guardarlas.
+
+    Returns:
+        tuple: (camas, errores) donde errores es una lista de
+        {'fila', 'numero', 'error'}; si hay errores no se debe crear ninguna
+    """
+    from .models import Cama
+
+    if not filas:
+        return [], [{'fila': None, 'numero': None, 'error': 'No se indicaron camas'}]
+    if len(filas) > max_camas():
+        return [], [{'fila': None, 'numero': None, 'error': f'No se pueden crear más de {max_camas()} camas a la vez'}]
+
+    tipos = dict(Cama.TIPO_CHOICES)
+    largo_numero = Cama._meta.get_field('numero').max_length
+    errores, camas, filas_camas, vistos = [], [], [], set()
+    for indice, fila in enumerate(filas, start=1):
+        numero = (fila.get('numero') or '').strip()
+        error = None
+        if not numero or len(numero) > largo_numero:
+            error = f'Número obligatorio de hasta {largo_numero} caracteres'
+        elif numero in vistos:
+            error = 'Número repetido en la lista'
+        elif fila.get('tipo') not in tipos:
+            error = f'Tipo inválido. Debe ser uno de: {list(tipos)}'
+        else:
+            try:
+                piso = int(fila['piso']) if fila.get('piso') not in (None, '') else None
+                if piso is not None and piso < 1:
+                    raise ValueError()
+            except (ValueError, TypeError):
+                error = 'El piso debe ser un número mayor o igual a 1'
+        if error:
+            errores.append({'fila': indice, 'numero': numero or None, 'error': error})
+            continue
+        vistos.add(numero)
+        filas_camas.append(indice)
+        camas.append(Cama(
+            numero=numero, tipo=fila['tipo'], estado='disponible', piso=piso,
+            sala=fila.get('sala') or None, observaciones=fila.get('observaciones') or None
+        ))
+
+    # Unicidad contra la base de datos en una consulta
+    existentes = set(Cama.objects.filter(numero__in=vistos).values_list('numero', flat=True))
+    for indice, cama in zip(filas_camas, camas):
+        if cama.numero in existentes:
+            errores.append({'fila': indice, 'numero': cama.numero, 'error': 'Ya existe una cama con ese número'})
+    return camas, errores
+
+
+def crear(camas):
+    """Inserta camas ya validadas en lotes; retorna la cantidad creada"""
+    from .models import Cama
+    from .ocupacion_camas import invalidar
+
+    with transaction.atomic():
+        Cama.objects.bulk_create(camas, batch_size=LOTE)
+        invalidar()
+    return len(camas)
+
+
+def eliminar(ids):
+    """
+    Elimina en lotes las camas disponibles de la lista.
+
+    Returns:
+        int: Cantidad de camas eliminadas
+    """
+    from .models import Cama
+    from .ocupacion_camas import invalidar
+
+    ids = list(dict.fromkeys(ids))
+    eliminadas = 0
+    with transaction.atomic():
+        for inicio in range(0, len(ids), LOTE):
+            eliminadas += Cama.objects.filter(id__in=ids[inicio:inicio + LOTE], estado='disponible').delete()[0]
+        invalidar()
+    return eliminadas
+
+
+def resumen(camas):
+    """Detalle para el registro de auditoría: cantidad por tipo y rango de números"""
+    por_tipo = {}
+    for cama in camas:
+        por_tipo[cama.tipo] = por_tipo.get(cama.tipo, 0) + 1
+    numeros = sorted(cama.numero for cama in camas)
+    return {'cantidad': len(camas), 'por_tipo': por_tipo, 'desde': numeros[0] if numeros else None,
+            'hasta': numeros[-1] if numeros else None}
@@ -0,0 +1,37 @@
+"""
+Comando Django para mover los logs de auditoría antiguos al archivo histórico.
+Uso: python manage.py archivar_auditoria [--dias 90]
+
+Se recomienda programarlo diariamente (cron o tarea programada).
+"""
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from urgencias.auditoria import archivar, dias_retencion
+
+
+class Command(BaseCommand):
+    help = 'Mueve los AuditLog más antiguos que la ventana de retención a archivos mensuales comprimidos'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dias',
+            type=int,
+            default=None,
+            help='Días que se mantienen en la tabla (default: AUDIT_LOG_RETENTION_DAYS)'
+        )
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=1000,
+            help='Registros movidos por lote (default: 1000)'
+        )
+
+    def handle(self, *args, **options):
+        dias = options['dias'] if options['dias'] is not None else dias_retencion()
+        corte = timezone.now() - timedelta(days=dias)
+        
+        self.stdout.write(f'📦 Archivando logs anteriores a {timezone.localtime(corte).strftime("%d/%m/%Y %H:%M")}...')
+        total = archivar(antes_de=corte, tamano_lote=options['lote'])
+        self.stdout.write(self.style.SUCCESS(f'✅ {total} registros archivados'))
@@ -0,0 +1,32 @@
+"""
+Comando Django para borrar de la caché en disco los PDF antiguos.
+Uso: python manage.py limpiar_cache_pdf [--dias 30]
+
+Los documentos borrados se vuelven a generar en la próxima descarga. Se
+recomienda programarlo diariamente (cron o tarea programada).
+"""
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from urgencias.pdf import limpiar_cache
+
+
+class Command(BaseCommand):
+    help = 'Elimina de PDF_CACHE_DIR los PDF generados hace más de PDF_CACHE_DIAS días'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dias',
+            type=int,
+            default=None,
+            help='Antigüedad mínima de los PDF a eliminar (default: PDF_CACHE_DIAS)'
+        )
+
+    def handle(self, *args, **options):
+        dias = options['dias'] if options['dias'] is not None else getattr(settings, 'PDF_CACHE_DIAS', 30)
+        
+        self.stdout.write(f'🧹 Eliminando PDF en caché de hace más de {dias} días...')
+        total = limpiar_cache(antes_de=time.time() - dias * 86400)
+        self.stdout.write(self.style.SUCCESS(f'✅ {total} archivos eliminados'))
@@ -0,0 +1,53 @@
+"""
+Comando Django para recalcular los últimos signos vitales guardados en cada ficha.
+Uso: python manage.py recalcular_ultimos_signos [--activas] [--lote 500]
+
+Se ejecuta una vez después de la migración que agrega las columnas, y cada
+vez que se corrigen signos vitales directamente en la base de datos.
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Coalesce, Greatest
+
+from urgencias.models import FichaEmergencia, SignosVitales
+from urgencias.tablero import ESTADOS_TABLERO
+
+
+class Command(BaseCommand):
+    help = 'Recalcula ultimos_signos_vitales, alerta_signos y ultima_actividad de las fichas'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--activas',
+            action='store_true',
+            help='Solo las fichas que aparecen en el tablero'
+        )
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=500,
+            help='Fichas actualizadas por transacción (default: 500)'
+        )
+
+    def handle(self, *args, **options):
+        fichas = FichaEmergencia.objects.all()
+        if options['activas']:
+            fichas = fichas.filter(estado__in=ESTADOS_TABLERO)
+        ids = list(fichas.order_by('id').values_list('id', flat=True))
+
+        self.stdout.write(f'🔄 Recalculando últimos signos vitales de {len(ids)} fichas...')
+        total = 0
+        for inicio in range(0, len(ids), options['lote']):
+            with transaction.atomic():
+                total += SignosVitales.recalcular_fichas(ids[inicio:inicio + options['lote']])
+
+        # Fichas anteriores a la columna: última actividad según sus fechas
+        sin_actividad = fichas.filter(ultima_actividad__isnull=True).update(
+            ultima_actividad=Greatest(
+                F('fecha_actualizacion'), Coalesce(F('ultimos_signos_fecha'), F('fecha_actualizacion'))
+            )
+        )
+
+        self.stdout.write(f'   ✓ {sin_actividad} fichas sin última actividad completadas')
+        self.stdout.write(self.style.SUCCESS(f'✅ {total} fichas actualizadas'))
@@ -0,0 +1,90 @@
+"""
+Comando Django para reconstruir el resumen diario de auditoría desde AuditLog.
+Uso: python manage.py reconstruir_resumen_auditoria [--desde AAAA-MM-DD]
+
+Los días ya archivados (ver archivar_auditoria) no están en la tabla y su
+resumen no se puede reconstruir: se parte desde el primer día que sigue
+completo en AuditLog, aunque --desde indique una fecha anterior.
+"""
+from datetime import datetime, time, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, Min
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from urgencias.auditoria import leer_archivo
+from urgencias.models import AuditLog, AuditDailyRollup
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye la tabla AuditDailyRollup a partir de los logs de auditoría'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--desde',
+            type=str,
+            default=None,
+            help='Fecha inicial AAAA-MM-DD (default: primer día completo en AuditLog)'
+        )
+
+    def primer_dia_completo(self):
+        """Día del log más antiguo de la tabla, o el siguiente si parte de ese día ya se archivó"""
+        primero = AuditLog.objects.aggregate(primero=Min('timestamp'))['primero']
+        if primero is None:
+            return None
+        dia = timezone.localtime(primero).date()
+        inicio = timezone.make_aware(datetime.combine(dia, time.min))
+        if next(leer_archivo(inicio, primero), None) is not None:
+            dia += timedelta(days=1)
+        return dia
+
+    def handle(self, *args, **options):
+        desde = None
+        if options['desde']:
+            desde = parse_date(options['desde'])
+            if desde is None:
+                raise CommandError('Fecha inválida, use el formato AAAA-MM-DD')
+        
+        primer_dia = self.primer_dia_completo()
+        if primer_dia is None:
+            self.stdout.write(self.style.WARNING('⚠️  No hay logs de auditoría'))
+            return
+        if desde is None:
+            desde = primer_dia
+        elif desde < primer_dia:
+            # Borrar el resumen de días archivados no se puede deshacer desde AuditLog
+            self.stdout.write(self.style.WARNING(
+                f'⚠️  Los logs anteriores al {primer_dia.strftime("%d/%m/%Y")} están archivados; '
+                'se conserva su resumen'
+            ))
+            desde = primer_dia
+        
+        inicio = timezone.make_aware(datetime.combine(desde, time.min))
+        self.stdout.write(f'🔄 Reconstruyendo resumen de auditoría desde {desde.strftime("%d/%m/%Y")}...')
+        
+        filas = (
+            AuditLog.objects.filter(timestamp__gte=inicio)
+            .annotate(fecha=TruncDate('timestamp'))
+            .values('fecha', 'accion', 'modelo', 'usuario')
+            .annotate(cantidad=Count('id'))
+            .order_by()
+        )
+        
+        with transaction.atomic():
+            eliminados, _ = AuditDailyRollup.objects.filter(fecha__gte=desde).delete()
+            creados = AuditDailyRollup.objects.bulk_create([
+                AuditDailyRollup(
+                    fecha=fila['fecha'],
+                    accion=fila['accion'],
+                    modelo=fila['modelo'],
+                    usuario_id=fila['usuario'],
+                    usuario_clave=fila['usuario'] or 0,
+                    total=fila['cantidad'],
+                )
+                for fila in filas
+            ], batch_size=1000)
+        
+        self.stdout.write(f'   ✓ {eliminados} filas anteriores eliminadas')
+        self.stdout.write(self.style.SUCCESS(f'✅ {len(creados)} filas de resumen creadas'))
@@ -0,0 +1,45 @@
+"""
+Comando Django para reconstruir las palabras de búsqueda de los pacientes.
+Uso: python manage.py reindexar_pacientes [--lote 1000]
+
+Paciente.save() mantiene el índice; este comando es para pacientes
+importados o modificados con QuerySet.update() o directamente en la base
+de datos (ver busqueda_pacientes.py).
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from urgencias.busqueda_pacientes import tokens
+from urgencias.models import Paciente, PacienteToken
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye la tabla PacienteToken usada por /api/pacientes/buscar/'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=1000,
+            help='Pacientes reindexados por transacción (default: 1000)'
+        )
+
+    def handle(self, *args, **options):
+        ids = list(Paciente.objects.order_by('id').values_list('id', flat=True))
+        self.stdout.write(f'🔄 Reindexando {len(ids)} pacientes...')
+        
+        creados = 0
+        for inicio in range(0, len(ids), options['lote']):
+            bloque = ids[inicio:inicio + options['lote']]
+            pacientes = Paciente.objects.filter(id__in=bloque).values_list(
+                'id', 'nombres', 'apellidos', 'id_temporal', 'rut'
+            )
+            with transaction.atomic():
+                PacienteToken.objects.filter(paciente_id__in=bloque).delete()
+                creados += len(PacienteToken.objects.bulk_create([
+                    PacienteToken(paciente_id=paciente_id, token=token)
+                    for paciente_id, *campos in pacientes
+                    for token in tokens(*campos)
+                ], batch_size=5000))
+        
+        self.stdout.write(self.style.SUCCESS(f'✅ {creados} palabras indexadas'))
@@ -0,0 +1,89 @@
+"""
+Comando Django para revisar pacientes con el mismo RUT escrito en otro formato.
+Uso: python manage.py revisar_ruts_duplicados [--fusionar ID [ID ...]]
+
+La migración 0027 dejó sin rut_numero a los pacientes cuyo RUT ya tenía un
+registro más antiguo. Sin opciones se listan los candidatos: solo los que
+tienen un RUT válido y coinciden en cuerpo y dígito verificador con el
+paciente que quedó normalizado. Revisados a mano, --fusionar traspasa sus
+fichas a ese paciente y los elimina (duplicados_nn.fusionar, con registro
+en auditoría).
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+
+from urgencias.duplicados_nn import fusionar
+from urgencias.models import Paciente
+from urgencias.utils import normalizar_rut, rut_valido
+
+
+def candidatos():
+    """
+    Duplicados por RUT pendientes de revisión.
+
+    Returns:
+        dict: {id del duplicado: (duplicado, paciente con el RUT normalizado)}
+    """
+    sin_normalizar = (
+        Paciente.objects.filter(rut_numero__isnull=True)
+        .exclude(rut__isnull=True).exclude(rut='')
+        .annotate(cantidad_fichas=Count('fichas'))
+        .order_by('id')
+    )
+    pares = {}
+    for duplicado in sin_normalizar:
+        if not rut_valido(duplicado.rut):
+            continue
+        numero, dv = normalizar_rut(duplicado.rut)
+        original = Paciente.objects.filter(rut_numero=numero, rut_dv=dv).exclude(pk=duplicado.pk).first()
+        if original is not None:
+            pares[duplicado.id] = (duplicado, original)
+    return pares
+
+
+class Command(BaseCommand):
+    help = 'Lista (y fusiona tras revisarlos) pacientes duplicados por RUT'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fusionar',
+            type=int,
+            nargs='+',
+            metavar='ID',
+            help='Ids de duplicados ya revisados cuyas fichas pasan al paciente con el RUT normalizado'
+        )
+
+    def handle(self, *args, **options):
+        pares = candidatos()
+
+        if not options['fusionar']:
+            if not pares:
+                self.stdout.write(self.style.SUCCESS('✅ No hay pacientes duplicados por RUT'))
+                return
+            self.stdout.write(f'🔎 {len(pares)} pacientes con el RUT de otro registro:')
+            for duplicado, original in pares.values():
+                self.stdout.write(
+                    f'   #{duplicado.id} {duplicado.rut} {duplicado.nombres} {duplicado.apellidos} '
+                    f'({duplicado.cantidad_fichas} fichas) -> #{original.id} {original.rut} {original.nombres} {original.apellidos}'
+                )
+            self.stdout.write('Revise cada par y fusione con --fusionar ID [ID ...]')
+            return
+
+        invalidos = sorted(set(options['fusionar']) - set(pares))
+        if invalidos:
+            raise CommandError(
+                f'No son duplicados por RUT pendientes: {", ".join(str(paciente_id) for paciente_id in invalidos)}'
+            )
+
+        por_original = {}
+        for paciente_id in options['fusionar']:
+            duplicado, original = pares[paciente_id]
+            por_original.setdefault(original.id, (original, []))[1].append(duplicado.id)
+
+        for original, ids in por_original.values():
+            resultado = fusionar(original, ids, solo_nn=False)
+            self.stdout.write(
+                f'   ✓ #{original.id} {original.rut}: {len(resultado["fusionados"])} duplicados, '
+                f'{len(resultado["fichas"])} fichas traspasadas'
+            )
+        self.stdout.write(self.style.SUCCESS(f'✅ {len(options["fusionar"])} pacientes fusionados'))
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.8 on 2026-10-17 10:45
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('urgencias', '0021_alter_auditlog_timestamp'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuditDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('accion', models.CharField(choices=[('crear', 'Crear'), ('editar', 'Editar'), ('eliminar', 'Eliminar'), ('autorizar', 'Autorizar'), ('rechazar', 'Rechazar'), ('login', 'Inicio de Sesión'), ('logout', 'Cierre de Sesión')], max_length=20)),
+                ('modelo', models.CharField(max_length=100)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='resumen_auditoria', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Resumen Diario de Auditoría',
+                'verbose_name_plural': 'Resúmenes Diarios de Auditoría',
+                'indexes': [models.Index(fields=['usuario', 'fecha'], name='urgencias_a_usuario_cb3a82_idx')],
+                'constraints': [models.UniqueConstraint(fields=('fecha', 'accion', 'modelo', 'usuario'), name='unique_rollup_fecha_accion_modelo_usuario')],
+            },
+        ),
+    ]
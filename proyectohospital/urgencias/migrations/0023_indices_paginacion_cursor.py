@@ -0,0 +1,55 @@
+# Generated by Django 5.2.8 on 2026-10-17 13:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('urgencias', '0022_auditdailyrollup'),
+    ]
+
+    operations = [
+        # Los índices nuevos se crean antes de quitar los anteriores: en MySQL el
+        # índice de (ficha, ...) / (usuario, ...) también respalda la clave foránea
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['-timestamp', '-id'], name='urgencias_a_timesta_2730a9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fichaemergencia',
+            index=models.Index(fields=['-fecha_registro', '-id'], name='urgencias_f_fecha_r_bb348d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fichaemergencia',
+            index=models.Index(fields=['paramedico', '-fecha_registro', '-id'], name='urgencias_f_paramed_2dc418_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mensajechat',
+            index=models.Index(fields=['ficha', 'fecha_envio', 'id'], name='urgencias_m_ficha_i_41f390_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notificacion',
+            index=models.Index(fields=['usuario', '-fecha_creacion', '-id'], name='urgencias_n_usuario_833c83_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='signosvitales',
+            index=models.Index(fields=['-timestamp', '-id'], name='urgencias_s_timesta_694032_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='signosvitales',
+            index=models.Index(fields=['ficha', '-timestamp', '-id'], name='urgencias_s_ficha_i_2d3a70_idx'),
+        ),
+        migrations.RemoveIndex(
+            model_name='auditlog',
+            name='urgencias_a_timesta_1ca4bb_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='mensajechat',
+            name='urgencias_m_ficha_i_216483_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='notificacion',
+            name='urgencias_n_usuario_56d626_idx',
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-17 13:34
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('urgencias', '0023_indices_paginacion_cursor'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='signosvitales',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.8 on 2026-10-17 13:40
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('urgencias', '0024_signos_timestamp_lectura'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fichaemergencia',
+            name='alerta_signos',
+            field=models.JSONField(blank=True, editable=False, encoder=django.core.serializers.json.DjangoJSONEncoder, help_text='NEWS2, qSOFA, tendencias y alertas de la última lectura', null=True),
+        ),
+        migrations.AddField(
+            model_name='fichaemergencia',
+            name='ultima_actividad',
+            field=models.DateTimeField(blank=True, editable=False, help_text='Último cambio en la ficha o registro de signos vitales', null=True),
+        ),
+        migrations.AddField(
+            model_name='fichaemergencia',
+            name='ultimos_signos_fecha',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='fichaemergencia',
+            name='ultimos_signos_vitales',
+            field=models.JSONField(blank=True, editable=False, null=True),
+        ),
+    ]
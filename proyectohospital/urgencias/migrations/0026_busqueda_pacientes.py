@@ -0,0 +1,44 @@
+# Generated by Django 5.2.8 on 2026-10-17 13:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def indexar_pacientes(apps, schema_editor):
+    """Palabras de búsqueda de los pacientes existentes"""
+    from urgencias.busqueda_pacientes import tokens
+
+    Paciente = apps.get_model('urgencias', 'Paciente')
+    PacienteToken = apps.get_model('urgencias', 'PacienteToken')
+    pacientes = Paciente.objects.order_by('id').values_list('id', 'nombres', 'apellidos', 'id_temporal', 'rut')
+    lote = []
+    for paciente_id, *campos in pacientes.iterator(chunk_size=2000):
+        lote.extend(PacienteToken(paciente_id=paciente_id, token=token) for token in tokens(*campos))
+        if len(lote) >= 5000:
+            PacienteToken.objects.bulk_create(lote)
+            lote = []
+    PacienteToken.objects.bulk_create(lote)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('urgencias', '0025_ultimos_signos_ficha'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PacienteToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=50)),
+                ('paciente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tokens_busqueda', to='urgencias.paciente')),
+            ],
+            options={
+                'verbose_name': 'Token de Búsqueda de Paciente',
+                'verbose_name_plural': 'Tokens de Búsqueda de Pacientes',
+                'indexes': [models.Index(fields=['token', 'paciente'], name='urgencias_p_token_06ff13_idx')],
+            },
+        ),
+        migrations.RunPython(indexar_pacientes, migrations.RunPython.noop),
+    ]
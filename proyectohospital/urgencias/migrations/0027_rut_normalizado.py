@@ -0,0 +1,71 @@
+# Generated by Django 5.2.8 on 2026-10-17 13:50
+
+from django.db import migrations, models
+
+
+def normalizar_ruts(apps, schema_editor):
+    """
+    rut_numero y rut_dv de los registros existentes con RUT válido (dígito
+    verificador correcto). Si dos registros tienen el mismo RUT escrito
+    distinto, solo el más antiguo queda con rut_numero (los demás se revisan
+    a mano con revisar_ruts_duplicados); el texto de rut no se modifica.
+    """
+    from urgencias.utils import normalizar_rut, rut_valido
+
+    for modelo in ('Paciente', 'Usuario'):
+        Modelo = apps.get_model('urgencias', modelo)
+        vistos = set()
+        lote = []
+        for instancia in Modelo.objects.exclude(rut__isnull=True).exclude(rut='').order_by('id').only('id', 'rut').iterator(chunk_size=2000):
+            # Un dígito verificador incorrecto puede ser otra persona o un error de tipeo
+            partes = normalizar_rut(instancia.rut) if rut_valido(instancia.rut) else None
+            if not partes or partes[0] in vistos:
+                continue
+            vistos.add(partes[0])
+            instancia.rut_numero, instancia.rut_dv = partes
+            lote.append(instancia)
+            if len(lote) >= 2000:
+                Modelo.objects.bulk_update(lote, ['rut_numero', 'rut_dv'])
+                lote = []
+        Modelo.objects.bulk_update(lote, ['rut_numero', 'rut_dv'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('urgencias', '0026_busqueda_pacientes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paciente',
+            name='rut_dv',
+            field=models.CharField(blank=True, editable=False, max_length=1),
+        ),
+        migrations.AddField(
+            model_name='paciente',
+            name='rut_numero',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='usuario',
+            name='rut_dv',
+            field=models.CharField(blank=True, editable=False, max_length=1),
+        ),
+        migrations.AddField(
+            model_name='usuario',
+            name='rut_numero',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(normalizar_ruts, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='paciente',
+            name='rut_numero',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='usuario',
+            name='rut_numero',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, unique=True),
+        ),
+    ]
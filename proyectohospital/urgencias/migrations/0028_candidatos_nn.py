@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-17 13:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('urgencias', '0027_rut_normalizado'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='paciente',
+            index=models.Index(fields=['es_nn', 'sexo', 'fecha_registro'], name='urgencias_p_es_nn_d797aa_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-17 13:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('urgencias', '0028_candidatos_nn'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='fichaemergencia',
+            index=models.Index(fields=['paciente', '-fecha_registro', '-id'], name='urgencias_f_pacient_782600_idx'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.8 on 2026-10-17 14:06
+
+from datetime import datetime
+
+from django.db import migrations, models
+
+
+def cargar_secuencias(apps, schema_editor):
+    """Último correlativo de cada día según los códigos ya emitidos"""
+    Diagnostico = apps.get_model('urgencias', 'Diagnostico')
+    SecuenciaDiagnostico = apps.get_model('urgencias', 'SecuenciaDiagnostico')
+
+    ultimos = {}
+    for codigo in Diagnostico.objects.filter(codigo_diagnostico__startswith='DX-').values_list('codigo_diagnostico', flat=True).iterator(chunk_size=2000):
+        try:
+            _, dia, numero = codigo.split('-')
+            fecha = datetime.strptime(dia, '%Y%m%d').date()
+            ultimos[fecha] = max(ultimos.get(fecha, 0), int(numero))
+        except ValueError:
+            continue
+    SecuenciaDiagnostico.objects.bulk_create(
+        [SecuenciaDiagnostico(fecha=fecha, ultimo=ultimo) for fecha, ultimo in ultimos.items()],
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('urgencias', '0029_historial_paciente'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SecuenciaDiagnostico',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(unique=True)),
+                ('ultimo', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Secuencia de Diagnósticos',
+                'verbose_name_plural': 'Secuencias de Diagnósticos',
+            },
+        ),
+        migrations.RunPython(cargar_secuencias, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+from django.db import migrations, models
+
+
+def completar_clave_usuario(apps, schema_editor):
+    """
+    Copia usuario_id a usuario_clave y une las filas sin usuario que el
+    índice anterior dejaba duplicar (NULL no choca con NULL): la primera
+    suma los totales y las demás se eliminan.
+    """
+    from django.db.models import F
+
+    AuditDailyRollup = apps.get_model('urgencias', 'AuditDailyRollup')
+
+    AuditDailyRollup.objects.filter(usuario__isnull=False).update(usuario_clave=F('usuario_id'))
+
+    conservadas = {}
+    for fila in AuditDailyRollup.objects.filter(usuario__isnull=True).order_by('id'):
+        clave = (fila.fecha, fila.accion, fila.modelo)
+        if clave not in conservadas:
+            conservadas[clave] = fila
+            continue
+        conservadas[clave].total += fila.total
+        conservadas[clave].save(update_fields=['total'])
+        fila.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('urgencias', '0030_secuencia_diagnostico'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='auditdailyrollup',
+            name='unique_rollup_fecha_accion_modelo_usuario',
+        ),
+        migrations.AddField(
+            model_name='auditdailyrollup',
+            name='usuario_clave',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(completar_clave_usuario, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='auditdailyrollup',
+            constraint=models.UniqueConstraint(fields=('fecha', 'accion', 'modelo', 'usuario_clave'), name='unique_rollup_fecha_accion_modelo_usuario_clave'),
+        ),
+    ]
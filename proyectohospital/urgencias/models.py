@@ -1,6 +1,10 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.utils import timezone
 
 
 class Usuario(AbstractUser):
@@ -13,6 +17,9 @@ class Usuario(AbstractUser):
     ]
     
     rut = models.CharField(max_length=12, unique=True)
+    # RUT normalizado (se completa en save()): búsqueda exacta por índice
+    rut_numero = models.PositiveIntegerField(unique=True, blank=True, null=True, editable=False)
+    rut_dv = models.CharField(max_length=1, blank=True, editable=False)
     rol = models.CharField(max_length=20, choices=ROL_CHOICES)
     telefono = models.CharField(max_length=15, blank=True, null=True)
     
@@ -24,6 +31,11 @@ class Usuario(AbstractUser):
         verbose_name = 'Usuario'
         verbose_name_plural = 'Usuarios'
     
+    def save(self, *args, **kwargs):
+        from .utils import asignar_rut
+        kwargs['update_fields'] = asignar_rut(self, kwargs.get('update_fields'))
+        super().save(*args, **kwargs)
+    
     def __str__(self):
         return f"{self.get_full_name()} ({self.get_rol_display()})"
 
@@ -46,6 +58,9 @@ class Paciente(models.Model):
     ]
     
     rut = models.CharField(max_length=12, unique=True, blank=True, null=True)
+    # RUT normalizado (se completa en save()): búsqueda exacta por índice
+    rut_numero = models.PositiveIntegerField(unique=True, blank=True, null=True, editable=False)
+    rut_dv = models.CharField(max_length=1, blank=True, editable=False)
     nombres = models.CharField(max_length=100)
     apellidos = models.CharField(max_length=100)
     fecha_nacimiento = models.DateField(blank=True, null=True)
@@ -68,6 +83,10 @@ class Paciente(models.Model):
         verbose_name = 'Paciente'
         verbose_name_plural = 'Pacientes'
         ordering = ['-fecha_registro']
+        # Bloqueo de candidatos NN recientes por sexo (ver duplicados_nn.py)
+        indexes = [
+            models.Index(fields=['es_nn', 'sexo', 'fecha_registro']),
+        ]
     
     @property
     def nombre_completo(self):
@@ -86,12 +105,38 @@ class Paciente(models.Model):
             return years
         return None
     
+    def save(self, *args, **kwargs):
+        from .busqueda_pacientes import indexar
+        from .utils import asignar_rut
+        kwargs['update_fields'] = asignar_rut(self, kwargs.get('update_fields'))
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            # Palabras para la búsqueda por nombre, ID temporal o RUT
+            indexar(self)
+    
     def __str__(self):
         if self.es_nn:
             return f"Paciente NN ({self.id_temporal})"
         return f"{self.nombres} {self.apellidos} - {self.rut}"
 
 
+class PacienteToken(models.Model):
+    """Palabra normalizada de un paciente para la búsqueda (ver busqueda_pacientes.py)"""
+    paciente = models.ForeignKey(Paciente, on_delete=models.CASCADE, related_name='tokens_busqueda')
+    token = models.CharField(max_length=50)
+    
+    class Meta:
+        verbose_name = 'Token de Búsqueda de Paciente'
+        verbose_name_plural = 'Tokens de Búsqueda de Pacientes'
+        # El índice (token, paciente) resuelve la búsqueda por prefijo sin leer la tabla
+        indexes = [
+            models.Index(fields=['token', 'paciente']),
+        ]
+    
+    def __str__(self):
+        return f"{self.token} - Paciente #{self.paciente_id}"
+
+
 class FichaEmergencia(models.Model):
     """Ficha de emergencia registrada por paramédicos"""
     ESTADO_CHOICES = [
@@ -130,10 +175,40 @@ class FichaEmergencia(models.Model):
     fecha_actualizacion = models.DateTimeField(auto_now=True)
     fecha_llegada_hospital = models.DateTimeField(blank=True, null=True, help_text="Fecha y hora de llegada al hospital")
     
+    # Resumen de la última lectura de signos vitales, mantenido por SignosVitales
+    # para que los listados y el tablero no consulten la tabla de signos
+    ultimos_signos_vitales = models.JSONField(blank=True, null=True, editable=False)
+    ultimos_signos_fecha = models.DateTimeField(blank=True, null=True, editable=False)
+    alerta_signos = models.JSONField(blank=True, null=True, editable=False, encoder=DjangoJSONEncoder, help_text="NEWS2, qSOFA, tendencias y alertas de la última lectura")
+    ultima_actividad = models.DateTimeField(blank=True, null=True, editable=False, help_text="Último cambio en la ficha o registro de signos vitales")
+    
     class Meta:
         verbose_name = 'Ficha de Emergencia'
         verbose_name_plural = 'Fichas de Emergencia'
         ordering = ['-fecha_registro']
+        # (fecha, id) para la paginación por cursor
+        indexes = [
+            models.Index(fields=['-fecha_registro', '-id']),
+            models.Index(fields=['paramedico', '-fecha_registro', '-id']),
+            # Historial de un paciente (PacienteViewSet.historial)
+            models.Index(fields=['paciente', '-fecha_registro', '-id']),
+        ]
+    
+    # Los mantiene SignosVitales con UPDATE; save() no los escribe para no
+    # pisar una lectura registrada después de cargar la ficha
+    CAMPOS_SIGNOS = ('ultimos_signos_vitales', 'ultimos_signos_fecha', 'alerta_signos')
+    
+    def save(self, *args, **kwargs):
+        self.ultima_actividad = timezone.now()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'ultima_actividad'}
+        elif not self._state.adding:
+            kwargs['update_fields'] = [
+                campo.name for campo in self._meta.concrete_fields
+                if not campo.primary_key and campo.name not in self.CAMPOS_SIGNOS
+            ]
+        super().save(*args, **kwargs)
     
     def __str__(self):
         return f"Ficha #{self.id} - {self.paciente} - {self.get_prioridad_display()}"
@@ -160,18 +235,105 @@ class SignosVitales(models.Model):
     eva = models.IntegerField(blank=True, null=True, validators=[MinValueValidator(0), MaxValueValidator(10)], help_text="Escala de dolor 0-10")
     
     ubicacion_gps = models.CharField(max_length=100, blank=True, null=True)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Por defecto la hora de registro; los monitores envían la hora de cada lectura
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
     
-    def save(self, *args, **kwargs):
-        # Calcular Glasgow total automáticamente
+    def calcular_glasgow(self):
+        """Glasgow total a partir del desglose (también se usa en la carga por lotes)"""
         if self.glasgow_ocular and self.glasgow_verbal and self.glasgow_motor:
             self.escala_glasgow = self.glasgow_ocular + self.glasgow_verbal + self.glasgow_motor
-        super().save(*args, **kwargs)
+    
+    def save(self, *args, **kwargs):
+        # Calcular Glasgow total automáticamente
+        self.calcular_glasgow()
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            # Resultado de alerta temprana si es la última lectura de la ficha
+            self.alerta_temprana = self.actualizar_ficha()
+    
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            resultado = super().delete(*args, **kwargs)
+            SignosVitales.recalcular_fichas([self.ficha_id])
+        return resultado
+    
+    def resumen(self):
+        """Datos de la lectura que la ficha guarda como últimos signos vitales"""
+        from .serializers import SignosVitalesResumenSerializer
+        return dict(SignosVitalesResumenSerializer(self).data)
+    
+    def actualizar_ficha(self):
+        """
+        Guarda esta lectura y su evaluación de alerta temprana como las
+        últimas de la ficha, salvo que la ficha ya tenga una lectura más
+        reciente (las lecturas de un lote llegan con su propia hora).
+        
+        Returns:
+            dict: Resultado de alerta_temprana.evaluar_ficha, o None si la
+            lectura no quedó como la última
+        """
+        from .alerta_temprana import evaluar_ficha
+        
+        ahora = timezone.now()
+        fichas = FichaEmergencia.objects.filter(id=self.ficha_id)
+        es_ultima = fichas.filter(
+            models.Q(ultimos_signos_fecha__isnull=True) | models.Q(ultimos_signos_fecha__lte=self.timestamp)
+        )
+        if not es_ultima.exists():
+            fichas.update(ultima_actividad=ahora)
+            return None
+        
+        resultado = evaluar_ficha(self.ficha_id, hasta=self.timestamp)
+        # Otra lectura más reciente puede haberse guardado entre ambas consultas
+        actualizadas = es_ultima.update(
+            ultimos_signos_vitales=self.resumen(),
+            ultimos_signos_fecha=self.timestamp,
+            alerta_signos=resultado,
+            ultima_actividad=ahora,
+        )
+        if not actualizadas:
+            fichas.update(ultima_actividad=ahora)
+            return None
+        return resultado
+    
+    @classmethod
+    def recalcular_fichas(cls, fichas_ids):
+        """
+        Vuelve a calcular los últimos signos vitales de las fichas desde la
+        tabla (al eliminar una lectura y en el comando recalcular_ultimos_signos).
+        
+        Returns:
+            int: Fichas actualizadas
+        """
+        from .alerta_temprana import evaluar_fichas
+        
+        ultima = cls.objects.filter(ficha_id=models.OuterRef('ficha_id')).order_by('-timestamp', '-id')
+        ultimas = {
+            signos.ficha_id: signos
+            for signos in cls.objects.filter(ficha_id__in=fichas_ids, id=models.Subquery(ultima.values('id')[:1]))
+        }
+        # Alerta temprana de todas las fichas con una sola carga de sus ventanas
+        resultados = evaluar_fichas({ficha_id: signos.timestamp for ficha_id, signos in ultimas.items()})
+        fichas = list(FichaEmergencia.objects.filter(id__in=fichas_ids).only('id'))
+        for ficha in fichas:
+            signos = ultimas.get(ficha.id)
+            ficha.ultimos_signos_vitales = signos.resumen() if signos else None
+            ficha.ultimos_signos_fecha = signos.timestamp if signos else None
+            ficha.alerta_signos = resultados.get(ficha.id)
+        FichaEmergencia.objects.bulk_update(
+            fichas, ['ultimos_signos_vitales', 'ultimos_signos_fecha', 'alerta_signos'], batch_size=500
+        )
+        return len(fichas)
     
     class Meta:
         verbose_name = 'Signos Vitales'
         verbose_name_plural = 'Signos Vitales'
         ordering = ['-timestamp']
+        # (fecha, id) para la paginación por cursor
+        indexes = [
+            models.Index(fields=['-timestamp', '-id']),
+            models.Index(fields=['ficha', '-timestamp', '-id']),
+        ]
     
     def __str__(self):
         return f"Signos Vitales - Ficha #{self.ficha.id} - {self.timestamp.strftime('%d/%m/%Y %H:%M')}"
@@ -370,31 +532,27 @@ class Diagnostico(models.Model):
     
     @classmethod
     def generar_codigo_unico(cls):
-        """Genera un código único en formato DX-YYYYMMDD-XXXX"""
-        from django.utils import timezone
-        fecha_hoy = timezone.now().strftime('%Y%m%d')
-        prefijo = f"DX-{fecha_hoy}-"
-        
-        # Buscar el último diagnóstico del día
-        ultimo = cls.objects.filter(
-            codigo_diagnostico__startswith=prefijo
-        ).order_by('-codigo_diagnostico').first()
-        
-        if ultimo and ultimo.codigo_diagnostico:
-            try:
-                ultimo_numero = int(ultimo.codigo_diagnostico.split('-')[-1])
-                nuevo_numero = ultimo_numero + 1
-            except (ValueError, IndexError):
-                nuevo_numero = 1
-        else:
-            nuevo_numero = 1
-        
-        return f"{prefijo}{nuevo_numero:04d}"
+        """Genera un código único en formato DX-YYYYMMDD-XXXX (ver codigos_diagnostico)"""
+        from .codigos_diagnostico import reservar
+        return reservar()[0]
     
     def __str__(self):
         return f"Diagnóstico {self.codigo_diagnostico or self.diagnostico_cie10} - Ficha #{self.ficha.id}"
 
 
+class SecuenciaDiagnostico(models.Model):
+    """Último correlativo de código de diagnóstico usado en cada día"""
+    fecha = models.DateField(unique=True)
+    ultimo = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        verbose_name = 'Secuencia de Diagnósticos'
+        verbose_name_plural = 'Secuencias de Diagnósticos'
+    
+    def __str__(self):
+        return f"{self.fecha}: {self.ultimo}"
+
+
 class SolicitudExamen(models.Model):
     """Solicitud de exámenes médicos"""
     ESTADO_CHOICES = [
@@ -500,22 +658,36 @@ class Cama(models.Model):
     def __str__(self):
         return f"Cama {self.numero} ({self.get_tipo_display()}) - {self.get_estado_display()}"
     
+    def save(self, *args, **kwargs):
+        from .ocupacion_camas import invalidar
+        super().save(*args, **kwargs)
+        # Estadísticas de ocupación en caché (ver ocupacion_camas.py)
+        invalidar()
+    
+    def delete(self, *args, **kwargs):
+        from .ocupacion_camas import invalidar
+        resultado = super().delete(*args, **kwargs)
+        invalidar()
+        return resultado
+    
     def liberar(self):
-        """Libera la cama para nuevo uso"""
+        """Libera la cama para nuevo uso (solo si sigue asignada a la misma ficha)"""
+        from .ocupacion_camas import invalidar
+        Cama.objects.filter(pk=self.pk, ficha_actual_id=self.ficha_actual_id).update(
+            estado='disponible', ficha_actual=None, fecha_asignacion=None,
+            asignado_por=None, fecha_actualizacion=timezone.now()
+        )
         self.estado = 'disponible'
         self.ficha_actual = None
         self.fecha_asignacion = None
         self.asignado_por = None
-        self.save()
+        invalidar()
     
     def asignar(self, ficha, usuario):
-        """Asigna la cama a una ficha"""
-        from django.utils import timezone
-        self.estado = 'ocupada'
-        self.ficha_actual = ficha
-        self.fecha_asignacion = timezone.now()
-        self.asignado_por = usuario
-        self.save()
+        """Asigna la cama a una ficha con bloqueo de fila (ver asignacion_camas.py)"""
+        from .asignacion_camas import asignar
+        asignar(self.pk, ficha, usuario)
+        self.refresh_from_db()
 
 
 class AuditLog(models.Model):
@@ -537,14 +709,15 @@ class AuditLog(models.Model):
     detalles = models.JSONField(blank=True, null=True, help_text="Detalles adicionales de la acción")
     ip_address = models.GenericIPAddressField(blank=True, null=True)
     user_agent = models.TextField(blank=True, null=True)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Se fija al registrar la acción, no al insertar (la escritura es en lotes)
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
     
     class Meta:
         verbose_name = 'Log de Auditoría'
         verbose_name_plural = 'Logs de Auditoría'
         ordering = ['-timestamp']
         indexes = [
-            models.Index(fields=['-timestamp']),
+            models.Index(fields=['-timestamp', '-id']),
             models.Index(fields=['usuario', '-timestamp']),
             models.Index(fields=['modelo', '-timestamp']),
         ]
@@ -554,6 +727,63 @@ class AuditLog(models.Model):
         return f"{usuario_str} - {self.get_accion_display()} - {self.modelo} #{self.objeto_id or 'N/A'} - {self.timestamp.strftime('%d/%m/%Y %H:%M')}"
 
 
+class AuditDailyRollup(models.Model):
+    """
+    Conteo diario de acciones de auditoría por (fecha, acción, modelo, usuario).
+    Se actualiza al escribir cada lote de AuditLog y permite armar el
+    dashboard y los reportes de actividad sin recorrer la tabla de logs.
+    """
+    fecha = models.DateField()
+    accion = models.CharField(max_length=20, choices=AuditLog.ACCION_CHOICES)
+    modelo = models.CharField(max_length=100)
+    usuario = models.ForeignKey(Usuario, on_delete=models.SET_NULL, null=True, blank=True, related_name='resumen_auditoria')
+    # usuario_id con 0 para las acciones sin usuario: en un índice único los
+    # NULL no se consideran iguales, y MySQL no tiene índices parciales
+    usuario_clave = models.PositiveIntegerField(default=0, editable=False)
+    total = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        verbose_name = 'Resumen Diario de Auditoría'
+        verbose_name_plural = 'Resúmenes Diarios de Auditoría'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['fecha', 'accion', 'modelo', 'usuario_clave'],
+                name='unique_rollup_fecha_accion_modelo_usuario_clave'
+            )
+        ]
+        indexes = [
+            models.Index(fields=['usuario', 'fecha']),
+        ]
+    
+    def __str__(self):
+        return f"{self.fecha} - {self.accion} - {self.modelo}: {self.total}"
+    
+    @classmethod
+    def acumular(cls, registros):
+        """
+        Suma un lote de AuditLog a los conteos diarios.
+        Hace un UPDATE por clave distinta del lote (no por registro).
+        """
+        from django.db import IntegrityError, transaction
+        from django.db.models import F
+        
+        conteos = {}
+        for registro in registros:
+            clave = (timezone.localtime(registro.timestamp).date(), registro.accion, registro.modelo, registro.usuario_id)
+            conteos[clave] = conteos.get(clave, 0) + 1
+        
+        for (fecha, accion, modelo, usuario_id), cantidad in conteos.items():
+            filtro = {'fecha': fecha, 'accion': accion, 'modelo': modelo, 'usuario_clave': usuario_id or 0}
+            if cls.objects.filter(**filtro).update(total=F('total') + cantidad):
+                continue
+            try:
+                with transaction.atomic():
+                    cls.objects.create(usuario_id=usuario_id, total=cantidad, **filtro)
+            except IntegrityError:
+                # Otro proceso creó la fila entre el UPDATE y el INSERT
+                cls.objects.filter(**filtro).update(total=F('total') + cantidad)
+
+
 def archivo_upload_path(instance, filename):
     """Genera la ruta de subida para archivos adjuntos"""
     import os
@@ -656,7 +886,7 @@ class MensajeChat(models.Model):
         verbose_name_plural = 'Mensajes de Chat'
         ordering = ['fecha_envio']
         indexes = [
-            models.Index(fields=['ficha', 'fecha_envio']),
+            models.Index(fields=['ficha', 'fecha_envio', 'id']),
         ]
     
     def __str__(self):
@@ -840,12 +1070,16 @@ class Notificacion(models.Model):
         verbose_name_plural = 'Notificaciones'
         indexes = [
             models.Index(fields=['usuario', 'leida']),
-            models.Index(fields=['usuario', 'fecha_creacion']),
+            models.Index(fields=['usuario', '-fecha_creacion', '-id']),
         ]
     
     def __str__(self):
         return f"{self.get_tipo_display()} - {self.usuario.username}"
     
+    # Segundos que se mantiene el contador de no leídas en caché antes de
+    # recalcularlo: acota el desfase si algún cambio no pasó por ajustar_no_leidas
+    CACHE_NO_LEIDAS_TIMEOUT = 60
+    
     def marcar_leida(self):
         """Marca la notificación como leída"""
         from django.utils import timezone
@@ -853,11 +1087,88 @@ class Notificacion(models.Model):
             self.leida = True
             self.fecha_leida = timezone.now()
             self.save(update_fields=['leida', 'fecha_leida'])
+            Notificacion.ajustar_no_leidas({self.usuario_id: -1})
+    
+    @staticmethod
+    def _clave_no_leidas(usuario_id):
+        return f'notificaciones_no_leidas_{usuario_id}'
+    
+    @staticmethod
+    def _cache_compartida():
+        """
+        Indica si la caché es compartida entre procesos. La caché en memoria
+        es propia de cada worker y ahí los contadores se desfasarían.
+        """
+        from django.core.cache import caches
+        from django.core.cache.backends.dummy import DummyCache
+        from django.core.cache.backends.locmem import LocMemCache
+        return not isinstance(caches['default'], (LocMemCache, DummyCache))
+    
+    @classmethod
+    def conteo_no_leidas(cls, usuario_id):
+        """
+        Conteo de notificaciones no leídas de un usuario.
+        Se lee del caché y solo se recalcula desde la BD si no está. Sin
+        caché compartida se cuenta siempre en la BD.
+        """
+        from django.core.cache import cache
+        if not cls._cache_compartida():
+            return cls.objects.filter(usuario_id=usuario_id, leida=False).count()
+        clave = cls._clave_no_leidas(usuario_id)
+        conteo = cache.get(clave)
+        if conteo is None:
+            conteo = cls.objects.filter(usuario_id=usuario_id, leida=False).count()
+            cache.add(clave, conteo, cls.CACHE_NO_LEIDAS_TIMEOUT)
+        return conteo
+    
+    @classmethod
+    def ajustar_no_leidas(cls, deltas):
+        """
+        Ajusta los contadores en caché al confirmarse la transacción.
+        
+        Args:
+            deltas: Diccionario {usuario_id: cantidad}, positiva al crear
+                notificaciones y negativa al marcarlas como leídas.
+        """
+        from django.core.cache import cache
+        from django.db import transaction
+        
+        if not cls._cache_compartida():
+            return
+        
+        def aplicar():
+            for usuario_id, delta in deltas.items():
+                if not delta:
+                    continue
+                clave = cls._clave_no_leidas(usuario_id)
+                try:
+                    conteo = cache.incr(clave, delta) if delta > 0 else cache.decr(clave, -delta)
+                except ValueError:
+                    # No está en caché, pero una lectura en curso pudo contar antes de este
+                    # cambio y guardarlo luego: se borra para que se recalcule
+                    cache.delete(clave)
+                    continue
+                if conteo < 0:
+                    cache.delete(clave)
+        
+        transaction.on_commit(aplicar)
+    
+    @classmethod
+    def invalidar_no_leidas(cls, usuario_ids):
+        """Descarta los contadores en caché al confirmarse la transacción"""
+        from django.core.cache import cache
+        from django.db import transaction
+        
+        if not cls._cache_compartida():
+            return
+        claves = [cls._clave_no_leidas(usuario_id) for usuario_id in usuario_ids]
+        transaction.on_commit(lambda: cache.delete_many(claves))
     
     @classmethod
     def crear_notificacion(cls, usuario, tipo, titulo, mensaje, ficha=None, prioridad='media', datos_extra=None):
         """Helper para crear notificaciones"""
-        return cls.objects.create(
+        from .eventos import publicar_notificaciones
+        notificacion = cls.objects.create(
             usuario=usuario,
             tipo=tipo,
             titulo=titulo,
@@ -866,11 +1177,14 @@ class Notificacion(models.Model):
             prioridad=prioridad,
             datos_extra=datos_extra or {}
         )
+        cls.ajustar_no_leidas({usuario.id: 1})
+        publicar_notificaciones([notificacion])
+        return notificacion
     
     @classmethod
-    def notificar_rol(cls, rol, tipo, titulo, mensaje, ficha=None, prioridad='media', datos_extra=None):
-        """Crear notificación para todos los usuarios de un rol"""
-        usuarios = Usuario.objects.filter(rol=rol, is_active=True)
+    def _notificar_usuarios(cls, usuarios, tipo, titulo, mensaje, ficha=None, prioridad='media', datos_extra=None):
+        """Crea la misma notificación para varios usuarios y la publica por rol"""
+        from .eventos import publicar_notificaciones_por_rol
         notificaciones = []
         for usuario in usuarios:
             notificaciones.append(cls(
@@ -882,24 +1196,32 @@ class Notificacion(models.Model):
                 prioridad=prioridad,
                 datos_extra=datos_extra or {}
             ))
-        return cls.objects.bulk_create(notificaciones)
+        if not notificaciones:
+            return []
+        
+        # En MySQL bulk_create no asigna los ids: el evento por rol no los
+        # necesita, cada consumidor lee sus notificaciones desde su cursor
+        creadas = cls.objects.bulk_create(notificaciones)
+        
+        deltas = {}
+        for notificacion in creadas:
+            deltas[notificacion.usuario_id] = deltas.get(notificacion.usuario_id, 0) + 1
+        cls.ajustar_no_leidas(deltas)
+        
+        publicar_notificaciones_por_rol(creadas)
+        return creadas
+    
+    @classmethod
+    def notificar_rol(cls, rol, tipo, titulo, mensaje, ficha=None, prioridad='media', datos_extra=None):
+        """Crear notificación para todos los usuarios de un rol"""
+        usuarios = Usuario.objects.filter(rol=rol, is_active=True)
+        return cls._notificar_usuarios(usuarios, tipo, titulo, mensaje, ficha, prioridad, datos_extra)
     
     @classmethod
     def notificar_roles(cls, roles, tipo, titulo, mensaje, ficha=None, prioridad='media', datos_extra=None):
         """Crear notificación para todos los usuarios de varios roles"""
         usuarios = Usuario.objects.filter(rol__in=roles, is_active=True)
-        notificaciones = []
-        for usuario in usuarios:
-            notificaciones.append(cls(
-                usuario=usuario,
-                tipo=tipo,
-                titulo=titulo,
-                mensaje=mensaje,
-                ficha=ficha,
-                prioridad=prioridad,
-                datos_extra=datos_extra or {}
-            ))
-        return cls.objects.bulk_create(notificaciones)
+        return cls._notificar_usuarios(usuarios, tipo, titulo, mensaje, ficha, prioridad, datos_extra)
     
     @classmethod
     def notificar_rol_en_turno(cls, rol, tipo, titulo, mensaje, ficha=None, prioridad='media', datos_extra=None):
@@ -916,18 +1238,7 @@ class Notificacion(models.Model):
         ).values_list('usuario', flat=True)
         
         usuarios = Usuario.objects.filter(id__in=usuarios_en_turno)
-        notificaciones = []
-        for usuario in usuarios:
-            notificaciones.append(cls(
-                usuario=usuario,
-                tipo=tipo,
-                titulo=titulo,
-                mensaje=mensaje,
-                ficha=ficha,
-                prioridad=prioridad,
-                datos_extra=datos_extra or {}
-            ))
-        return cls.objects.bulk_create(notificaciones)
+        return cls._notificar_usuarios(usuarios, tipo, titulo, mensaje, ficha, prioridad, datos_extra)
     
     @classmethod
     def notificar_roles_en_turno(cls, roles, tipo, titulo, mensaje, ficha=None, prioridad='media', datos_extra=None):
@@ -944,18 +1255,17 @@ class Notificacion(models.Model):
         ).values_list('usuario', flat=True)
         
         usuarios = Usuario.objects.filter(id__in=usuarios_en_turno)
-        notificaciones = []
-        for usuario in usuarios:
-            notificaciones.append(cls(
-                usuario=usuario,
-                tipo=tipo,
-                titulo=titulo,
-                mensaje=mensaje,
-                ficha=ficha,
-                prioridad=prioridad,
-                datos_extra=datos_extra or {}
-            ))
-        return cls.objects.bulk_create(notificaciones)
+        return cls._notificar_usuarios(usuarios, tipo, titulo, mensaje, ficha, prioridad, datos_extra)
+
+
+@receiver(post_delete, sender=Notificacion)
+def _notificacion_eliminada(sender, instance, **kwargs):
+    """
+    Descarta el contador de no leídas al eliminar una notificación no leída,
+    también en eliminaciones en cascada (ficha o usuario) y por QuerySet.
+    """
+    if not instance.leida:
+        Notificacion.invalidar_no_leidas([instance.usuario_id])
 
 
 class ConfiguracionTurno(models.Model):
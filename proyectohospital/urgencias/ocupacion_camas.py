@@ -0,0 +1,91 @@
+"""
+Estadísticas de ocupación de camas.
+
+Una sola consulta agrupada por tipo, estado, piso y sala entrega la
+cantidad de camas de cada combinación (unas decenas de filas aunque el
+hospital tenga cientos de camas); los totales generales, por tipo, por piso
+y por sala se suman en Python.
+
+El resultado queda en caché hasta que cambia una cama: Cama.save() (que
+usan asignar, liberar, marcar_lista, cambiar_estado y la creación de camas)
+y las eliminaciones llaman a invalidar(), que borra la caché al confirmarse
+la transacción.
+
+Configuración (settings):
+    CAMAS_ESTADISTICAS_CACHE_SEGUNDOS: Duración máxima en caché (por si una
+        cama cambia por fuera de la aplicación).
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+CLAVE = 'camas:estadisticas'
+# Estado de la cama -> contador en la respuesta
+CAMPO_ESTADO = {
+    'ocupada': 'ocupadas',
+    'disponible': 'disponibles',
+    'reservada': 'reservadas',
+    'mantenimiento': 'mantenimiento',
+    'limpieza': 'limpieza',
+}
+
+
+def invalidar():
+    """Descarta las estadísticas en caché al confirmarse la transacción"""
+    transaction.on_commit(lambda: cache.delete(CLAVE))
+
+
+def _grupo():
+    return {'total': 0, **{campo: 0 for campo in CAMPO_ESTADO.values()}}
+
+
+def _porcentaje(grupo):
+    grupo['porcentaje_ocupacion'] = round((grupo['ocupadas'] / grupo['total'] * 100) if grupo['total'] > 0 else 0, 1)
+    return grupo
+
+
+def calcular():
+    """Estadísticas desde la base de datos (una consulta)"""
+    from django.db.models import Count
+    from .models import Cama
+
+    filas = (
+        Cama.objects.order_by()
+        .values('tipo', 'estado', 'piso', 'sala')
+        .annotate(cantidad=Count('id'))
+    )
+
+    general = _grupo()
+    por_tipo = {tipo: _grupo() for tipo, _ in Cama.TIPO_CHOICES}
+    por_piso = {}
+    por_sala = {}
+    for fila in filas:
+        campo = CAMPO_ESTADO.get(fila['estado'])
+        piso = str(fila['piso']) if fila['piso'] is not None else 'sin_piso'
+        sala = fila['sala'] or 'sin_sala'
+        grupos = [
+            general,
+            por_tipo.setdefault(fila['tipo'], _grupo()),
+            por_piso.setdefault(piso, _grupo()),
+            por_sala.setdefault(sala, _grupo()),
+        ]
+        for grupo in grupos:
+            grupo['total'] += fila['cantidad']
+            if campo:
+                grupo[campo] += fila['cantidad']
+
+    return {
+        **_porcentaje(general),
+        'por_tipo': {tipo: _porcentaje(grupo) for tipo, grupo in por_tipo.items()},
+        'por_piso': {piso: _porcentaje(grupo) for piso, grupo in sorted(por_piso.items())},
+        'por_sala': {sala: _porcentaje(grupo) for sala, grupo in sorted(por_sala.items())},
+    }
+
+
+def obtener():
+    """Estadísticas desde la caché, calculándolas si no están"""
+    datos = cache.get(CLAVE)
+    if datos is None:
+        datos = calcular()
+        cache.set(CLAVE, datos, getattr(settings, 'CAMAS_ESTADISTICAS_CACHE_SEGUNDOS', 300))
+    return datos
@@ -0,0 +1,48 @@
+"""
+Paginación por cursor para los listados de mayor volumen.
+
+PageNumberPagination hace un COUNT(*) de toda la tabla en cada página y
+recorre con OFFSET todas las filas anteriores, por lo que las páginas
+profundas del historial son cada vez más lentas. Con cursor cada página
+continúa desde la fecha e id del último registro entregado, usando el
+índice compuesto (fecha, id) del modelo: la página 1000 cuesta lo mismo
+que la primera.
+
+La respuesta trae 'next' y 'previous' (URLs con ?cursor=) y 'results';
+no incluye 'count'.
+"""
+from rest_framework.pagination import CursorPagination
+
+
+class CursorPaginacion(CursorPagination):
+    """Base: 100 registros por página, ajustable con ?page_size= hasta 500"""
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+class AuditLogPaginacion(CursorPaginacion):
+    ordering = ('-timestamp', '-id')
+
+
+class SignosVitalesPaginacion(CursorPaginacion):
+    ordering = ('-timestamp', '-id')
+
+
+class MensajeChatPaginacion(CursorPaginacion):
+    # El chat se lee en orden cronológico
+    ordering = ('fecha_envio', 'id')
+
+
+class NotificacionPaginacion(CursorPaginacion):
+    ordering = ('-fecha_creacion', '-id')
+
+
+class FichaEmergenciaPaginacion(CursorPaginacion):
+    ordering = ('-fecha_registro', '-id')
+
+
+class HistorialPacientePaginacion(FichaEmergenciaPaginacion):
+    # Resúmenes de atenciones de un paciente, de la más reciente a la más antigua
+    page_size = 20
+    max_page_size = 100
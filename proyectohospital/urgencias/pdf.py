@@ -0,0 +1,466 @@
+"""
+Servicio de renderizado de documentos PDF.
+
+WeasyPrint se ejecuta en un pool de procesos para no bloquear el hilo de la
+request con trabajo de CPU, y los PDF generados se guardan en disco. La
+clave de caché es un hash de la versión de los datos del documento (las
+filas de ficha, paciente, diagnóstico, etc. que aparecen en él) junto con
+la plantilla y su CSS: una descarga repetida se sirve directo desde disco
+(con ETag / 304) sin armar el contexto completo ni renderizar el HTML, y
+cualquier cambio en esos datos genera un PDF nuevo.
+
+Cada proceso del pool carga una sola vez la configuración de fuentes y las
+hojas de estilo ya parseadas (templates/pdf/css/), en lugar de hacerlo en
+cada documento. calentar() deja todo listo al iniciar el servidor.
+
+Configuración (settings):
+    PDF_WORKERS: Procesos del pool (0 renderiza en el mismo proceso).
+    PDF_RENDER_TIMEOUT: Segundos máximos de espera por un PDF (luego
+        renderizar_pdf lanza TimeoutError).
+    PDF_CACHE_DIR: Directorio de la caché de PDF.
+    PDF_CACHE_DIAS: Antigüedad con que limpiar_cache descarta un PDF.
+    PDF_PRECALENTAR: Calentar plantillas, estilos y pool al iniciar el servidor.
+"""
+import hashlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from pathlib import Path
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.template.loader import get_template, render_to_string
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+PLANTILLAS = [
+    'pdf/alta_medica.html',
+    'pdf/ficha_emergencia.html',
+    'pdf/orden_examenes.html',
+    'pdf/receta_medica.html',
+]
+
+DIRECTORIO_ESTILOS = Path(__file__).resolve().parent / 'templates' / 'pdf' / 'css'
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+# Fuentes y hojas de estilo parseadas del proceso (se cargan una vez)
+_motor = {'fuentes': None, 'estilos': {}}
+
+_metricas = {}
+_metricas_lock = threading.Lock()
+
+
+def _ruta_estilo(plantilla):
+    return DIRECTORIO_ESTILOS / f'{Path(plantilla).stem}.css'
+
+
+@lru_cache(maxsize=None)
+def _huella_estilo(plantilla):
+    """Hash del CSS de la plantilla (un cambio de estilos invalida la caché de PDF)"""
+    return hashlib.sha256(_ruta_estilo(plantilla).read_bytes()).hexdigest()
+
+
+@lru_cache(maxsize=None)
+def _huella_plantilla(plantilla):
+    """Hash del HTML de la plantilla (un cambio de la plantilla invalida la caché de PDF)"""
+    return hashlib.sha256(get_template(plantilla).template.source.encode('utf-8')).hexdigest()
+
+
+def _cargar_motor():
+    """Crea la configuración de fuentes y parsea todas las hojas de estilo"""
+    from weasyprint import CSS, HTML
+    from weasyprint.text.fonts import FontConfiguration
+
+    inicio = time.perf_counter()
+    fuentes = FontConfiguration()
+    estilos = {
+        plantilla: CSS(filename=str(_ruta_estilo(plantilla)), font_config=fuentes)
+        for plantilla in PLANTILLAS
+    }
+    # Un documento mínimo obliga a cargar fontconfig/pango antes del primer PDF real
+    HTML(string='<p>.</p>').write_pdf(stylesheets=list(estilos.values()), font_config=fuentes)
+
+    _motor['fuentes'] = fuentes
+    _motor['estilos'] = estilos
+    logger.info('Motor PDF listo en %.2fs (pid %s)', time.perf_counter() - inicio, os.getpid())
+
+
+def _renderizar(html_string, plantilla):
+    """
+    Genera el PDF (se ejecuta dentro de un proceso del pool).
+
+    Returns:
+        tuple: (bytes del PDF, segundos de renderizado)
+    """
+    from weasyprint import HTML
+
+    if _motor['fuentes'] is None:
+        _cargar_motor()
+
+    inicio = time.perf_counter()
+    pdf_file = HTML(string=html_string).write_pdf(
+        stylesheets=[_motor['estilos'][plantilla]],
+        font_config=_motor['fuentes'],
+    )
+    return pdf_file, time.perf_counter() - inicio
+
+
+def _get_pool():
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            # spawn: los procesos no heredan hilos ni conexiones del proceso web
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.PDF_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_cargar_motor,
+            )
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def _reiniciar_pool(roto):
+    """Descarta el pool caído; si otro hilo ya lo reemplazó no se toca el nuevo"""
+    global _pool
+    with _pool_lock:
+        if _pool is roto:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def _registrar_metrica(plantilla, segundos_render, segundos_total):
+    with _metricas_lock:
+        metrica = _metricas.setdefault(plantilla, {
+            'documentos': 0, 'render_total': 0.0, 'render_max': 0.0, 'espera_total': 0.0,
+        })
+        metrica['documentos'] += 1
+        metrica['render_total'] += segundos_render
+        metrica['render_max'] = max(metrica['render_max'], segundos_render)
+        metrica['espera_total'] += segundos_total - segundos_render
+
+
+def metricas():
+    """
+    Tiempos de renderizado del proceso actual por plantilla.
+    'render' es el tiempo de WeasyPrint; 'espera' el tiempo en cola del pool.
+    """
+    with _metricas_lock:
+        return {
+            plantilla: {
+                'documentos': metrica['documentos'],
+                'render_promedio_ms': round(metrica['render_total'] / metrica['documentos'] * 1000, 1),
+                'render_max_ms': round(metrica['render_max'] * 1000, 1),
+                'espera_promedio_ms': round(metrica['espera_total'] / metrica['documentos'] * 1000, 1),
+            }
+            for plantilla, metrica in _metricas.items()
+        }
+
+
+def calentar():
+    """
+    Compila las plantillas PDF y arranca el pool con los motores cargados,
+    para que el primer documento no pague el costo de inicialización.
+    """
+    for plantilla in PLANTILLAS:
+        _huella_plantilla(plantilla)
+        _huella_estilo(plantilla)
+
+    workers = getattr(settings, 'PDF_WORKERS', 0)
+    if not workers:
+        _cargar_motor()
+        return
+    pool = _get_pool()
+    # Cada proceso ejecuta _cargar_motor al iniciar; no hace falta esperar
+    for _ in range(workers):
+        pool.submit(os.getpid)
+
+
+def renderizar_pdf(html_string, plantilla):
+    """Renderiza HTML a PDF en el pool de procesos y retorna los bytes"""
+    inicio = time.perf_counter()
+    if not getattr(settings, 'PDF_WORKERS', 0):
+        pdf_file, segundos = _renderizar(html_string, plantilla)
+    else:
+        pool = _get_pool()
+        try:
+            futuro = pool.submit(_renderizar, html_string, plantilla)
+            pdf_file, segundos = futuro.result(timeout=getattr(settings, 'PDF_RENDER_TIMEOUT', 60))
+        except TimeoutError:
+            # Si aún está en cola no se renderiza; si ya empezó, el proceso lo termina igual
+            futuro.cancel()
+            logger.warning('PDF %s sin terminar tras PDF_RENDER_TIMEOUT', plantilla)
+            raise
+        except BrokenProcessPool:
+            logger.exception('El pool de PDF se cayó; se renderiza en el proceso actual')
+            _reiniciar_pool(pool)
+            pdf_file, segundos = _renderizar(html_string, plantilla)
+    _registrar_metrica(plantilla, segundos, time.perf_counter() - inicio)
+    return pdf_file
+
+
+def _directorio_cache():
+    return Path(getattr(settings, 'PDF_CACHE_DIR', Path(settings.BASE_DIR) / 'pdf_cache'))
+
+
+def _ruta_cache(clave):
+    return _directorio_cache() / clave[:2] / f'{clave}.pdf'
+
+
+def version_de(*partes):
+    """
+    Versión de los datos de un documento para clave_documento.
+
+    Args:
+        partes: Instancias de modelo (se toman todos sus campos, sin
+            consultas adicionales), None o valores simples (p. ej. un
+            conteo de filas relacionadas o la edad del paciente)
+    """
+    return [
+        [getattr(parte, campo.attname) for campo in parte._meta.concrete_fields]
+        if hasattr(parte, '_meta') else parte
+        for parte in partes
+    ]
+
+
+def clave_documento(plantilla, version):
+    """
+    Clave hex del documento: plantilla, su CSS y la versión de sus datos
+    (ver version_de). No requiere renderizar el HTML.
+    """
+    datos = json.dumps(version, cls=DjangoJSONEncoder, default=str)
+    return hashlib.sha256(
+        f'{plantilla}\0{_huella_plantilla(plantilla)}\0{_huella_estilo(plantilla)}\0{datos}'.encode('utf-8')
+    ).hexdigest()
+
+
+def _html(plantilla, contexto):
+    if callable(contexto):
+        contexto = contexto()
+    return render_to_string(plantilla, {**contexto, 'fecha_actual': timezone.localtime().strftime('%d/%m/%Y %H:%M')})
+
+
+def _leer_cache(clave):
+    try:
+        return _ruta_cache(clave).read_bytes()
+    except FileNotFoundError:
+        return None
+
+
+def _guardar_cache(clave, pdf_file):
+    # Escritura atómica: otro proceso puede estar generando el mismo documento
+    ruta = _ruta_cache(clave)
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    descriptor, temporal = tempfile.mkstemp(dir=ruta.parent, suffix='.tmp')
+    with os.fdopen(descriptor, 'wb') as archivo:
+        archivo.write(pdf_file)
+    os.replace(temporal, ruta)
+
+
+def limpiar_cache(antes_de):
+    """
+    Elimina de la caché los PDF (y temporales abandonados) modificados antes
+    de `antes_de`, junto con los subdirectorios que queden vacíos.
+
+    Args:
+        antes_de: Timestamp (segundos desde epoch) de corte
+
+    Returns:
+        int: Cantidad de archivos eliminados
+    """
+    directorio = _directorio_cache()
+    if not directorio.is_dir():
+        return 0
+    eliminados = 0
+    for subdirectorio in directorio.iterdir():
+        if not subdirectorio.is_dir():
+            continue
+        for ruta in subdirectorio.iterdir():
+            try:
+                if ruta.stat().st_mtime < antes_de:
+                    ruta.unlink()
+                    eliminados += 1
+            except FileNotFoundError:
+                continue  # Otro proceso lo reemplazó o eliminó
+        try:
+            subdirectorio.rmdir()
+        except OSError:
+            pass  # Aún tiene archivos
+    return eliminados
+
+
+def obtener_pdf(plantilla, clave, contexto):
+    """
+    PDF del documento desde la caché en disco o recién renderizado.
+    La fecha de emisión que queda impresa es la de la primera generación.
+
+    Args:
+        contexto: Contexto de la plantilla, o función que lo arma; solo se
+            usa si el documento no está en caché
+    """
+    pdf_file = _leer_cache(clave)
+    if pdf_file is None:
+        pdf_file = renderizar_pdf(_html(plantilla, contexto), plantilla)
+        _guardar_cache(clave, pdf_file)
+    return pdf_file
+
+
+def generar_lote(documentos, en_vuelo=None):
+    """
+    Genera varios PDF en paralelo en el pool, manteniendo el orden.
+
+    Solo hay `en_vuelo` documentos pendientes a la vez (por defecto el doble
+    de procesos del pool), así el lote no queda completo en memoria.
+
+    La respuesta ya empezó a enviarse cuando se genera cada documento, así
+    que un error no corta el lote: si el pool se cae el documento se
+    renderiza en el proceso actual, y los que no se pudieron generar (p. ej.
+    por PDF_RENDER_TIMEOUT) se listan al final en errores.txt.
+
+    Args:
+        documentos: Iterable de (nombre, plantilla, contexto, clave), con
+            contexto y clave como en obtener_pdf.
+
+    Yields:
+        tuple: (nombre, bytes del PDF)
+    """
+    from collections import deque
+
+    workers = getattr(settings, 'PDF_WORKERS', 0)
+    limite = en_vuelo or max(workers, 1) * 2
+    timeout = getattr(settings, 'PDF_RENDER_TIMEOUT', 60)
+    pendientes = deque()
+    errores = []
+
+    def enviar(plantilla, contexto, clave):
+        if not workers or _ruta_cache(clave).exists():
+            # Sin pool, o ya en caché: se lee recién al momento de escribirlo
+            return lambda: obtener_pdf(plantilla, clave, contexto)
+        inicio = time.perf_counter()
+        html_string = _html(plantilla, contexto)
+        pool = _get_pool()
+        try:
+            futuro = pool.submit(_renderizar, html_string, plantilla)
+        except BrokenProcessPool:
+            _reiniciar_pool(pool)
+            return lambda: obtener_pdf(plantilla, clave, contexto)
+
+        def resultado():
+            try:
+                pdf_file, segundos = futuro.result(timeout=timeout)
+            except TimeoutError:
+                futuro.cancel()
+                raise
+            except BrokenProcessPool:
+                logger.exception('El pool de PDF se cayó; se renderiza en el proceso actual')
+                _reiniciar_pool(pool)
+                pdf_file, segundos = _renderizar(html_string, plantilla)
+            _registrar_metrica(plantilla, segundos, time.perf_counter() - inicio)
+            _guardar_cache(clave, pdf_file)
+            return pdf_file
+        return resultado
+
+    def intentar(nombre, paso):
+        """Resultado de paso(), o None si falló (queda anotado en errores)"""
+        try:
+            return paso()
+        except TimeoutError:
+            logger.warning('PDF %s del lote sin terminar tras PDF_RENDER_TIMEOUT', nombre)
+            errores.append(f'{nombre}: no se terminó de generar a tiempo')
+        except Exception:
+            logger.exception('No se pudo generar el PDF %s del lote', nombre)
+            errores.append(f'{nombre}: error al generar el documento')
+        return None
+
+    def completar():
+        nombre, resultado = pendientes.popleft()
+        pdf_file = intentar(nombre, resultado)
+        if pdf_file is not None:
+            yield nombre, pdf_file
+
+    for nombre, plantilla, contexto, clave in documentos:
+        resultado = intentar(nombre, lambda: enviar(plantilla, contexto, clave))
+        if resultado is None:
+            continue
+        pendientes.append((nombre, resultado))
+        if len(pendientes) >= limite:
+            yield from completar()
+
+    while pendientes:
+        yield from completar()
+
+    if errores:
+        yield 'errores.txt', ('\n'.join(errores) + '\n').encode('utf-8')
+
+
+class _BufferZip(io.RawIOBase):
+    """Destino de escritura sin seek para ZipFile; se vacía en cada chunk"""
+
+    def __init__(self):
+        self.datos = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, datos):
+        self.datos.extend(datos)
+        return len(datos)
+
+    def vaciar(self):
+        chunk = bytes(self.datos)
+        self.datos.clear()
+        return chunk
+
+
+def zip_en_stream(archivos):
+    """
+    Arma un ZIP a medida que llegan los archivos, para StreamingHttpResponse.
+
+    Args:
+        archivos: Iterable de (nombre, bytes). Los PDF ya vienen comprimidos,
+            por lo que se guardan sin volver a comprimir.
+
+    Yields:
+        bytes: Trozos consecutivos del ZIP
+    """
+    buffer = _BufferZip()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_STORED) as archivo_zip:
+        for nombre, contenido in archivos:
+            archivo_zip.writestr(nombre, contenido)
+            yield buffer.vaciar()
+    yield buffer.vaciar()
+
+
+async def en_async(trozos):
+    """
+    Recorre un iterable síncrono desde un hilo de trabajo, para
+    StreamingHttpResponse bajo ASGI.
+
+    Con un iterador síncrono Django lo consume completo antes de enviar el
+    primer byte; así cada trozo (y el renderizado que lo produce) se envía
+    apenas está listo.
+    """
+    from asgiref.sync import sync_to_async
+
+    iterador = iter(trozos)
+    fin = object()
+    siguiente = sync_to_async(next)
+    try:
+        while (trozo := await siguiente(iterador, fin)) is not fin:
+            yield trozo
+    finally:
+        # Si el cliente corta la descarga, cerrar el generador (y el lote) en el mismo hilo
+        if hasattr(iterador, 'close'):
+            await sync_to_async(iterador.close)()
@@ -6,4 +6,6 @@ from . import consumers
 
 websocket_urlpatterns = [
     re_path(r'ws/chat/(?P<ficha_id>\d+)/$', consumers.ChatConsumer.as_asgi()),
+    re_path(r'ws/notificaciones/$', consumers.NotificacionConsumer.as_asgi()),
+    re_path(r'ws/signos-vitales/(?P<ficha_id>\d+)/$', consumers.SignosVitalesConsumer.as_asgi()),
 ]
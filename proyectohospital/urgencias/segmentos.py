@@ -0,0 +1,27 @@
+"""
+Reducciones de NumPy por segmentos de una serie, sin recorrer las filas en
+Python. Las usan alerta_temprana (ventanas de tendencia de cada ficha) y
+serie_signos (tramos de tiempo de un gráfico).
+"""
+import numpy as np
+
+
+def por_segmento(ufunc, valores, inicios, finales):
+    """
+    Reduce valores[inicios[i]:finales[i] + 1] para cada i.
+
+    Args:
+        ufunc: Función universal de NumPy (np.add, np.fmin, np.fmax, ...)
+        inicios, finales: Índices inclusive de segmentos no vacíos,
+            disjuntos y ordenados
+
+    Returns:
+        ndarray: Un valor por segmento
+    """
+    # reduceat reduce entre índices consecutivos: se intercalan inicio y
+    # fin + 1 y se descartan las reducciones entre segmentos
+    extendidos = np.append(valores, 0)
+    indices = np.empty(2 * len(inicios), dtype=np.intp)
+    indices[0::2] = inicios
+    indices[1::2] = finales + 1
+    return ufunc.reduceat(extendidos, indices)[0::2]
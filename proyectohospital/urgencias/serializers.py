@@ -1,10 +1,34 @@
 from rest_framework import serializers
 from django.contrib.auth import authenticate
+from django.db.models import Prefetch
 from .models import (Usuario, Paciente, FichaEmergencia, SignosVitales, SolicitudMedicamento, 
                      Anamnesis, Triage, Diagnostico, SolicitudExamen, AuditLog, ConfiguracionHospital, Cama,
                      ArchivoAdjunto, MensajeChat, Notificacion, NotaEvolucion, Turno, ConfiguracionTurno)
 
 
+def validar_rut_unico(value, modelo, instancia=None):
+    """
+    Valida el dígito verificador y que el RUT no exista escrito en otro
+    formato. Retorna el RUT en formato canónico.
+    
+    Un RUT que no cambia se acepta tal cual (hay registros anteriores a la
+    validación del módulo 11).
+    """
+    from .utils import formatear_rut, normalizar_rut, rut_valido
+    
+    if instancia is not None and value == instancia.rut:
+        return value
+    if not rut_valido(value):
+        raise serializers.ValidationError('RUT inválido')
+    numero, dv = normalizar_rut(value)
+    existentes = modelo.objects.filter(rut_numero=numero)
+    if instancia is not None:
+        existentes = existentes.exclude(pk=instancia.pk)
+    if existentes.exists():
+        raise serializers.ValidationError(f'Ya existe un registro con el RUT {formatear_rut(numero, dv)}')
+    return formatear_rut(numero, dv)
+
+
 class UsuarioSerializer(serializers.ModelSerializer):
     """Serializer para el modelo Usuario"""
     nombre_completo = serializers.SerializerMethodField()
@@ -22,6 +46,9 @@ class UsuarioSerializer(serializers.ModelSerializer):
     def get_nombre_completo(self, obj):
         return obj.get_full_name()
     
+    def validate_rut(self, value):
+        return validar_rut_unico(value, Usuario, self.instance)
+    
     def create(self, validated_data):
         password = validated_data.pop('password', None)
         usuario = Usuario(**validated_data)
@@ -80,6 +107,11 @@ class PacienteSerializer(serializers.ModelSerializer):
         fields = '__all__'
         read_only_fields = ['id', 'fecha_registro']
     
+    def validate_rut(self, value):
+        if not value:
+            return value
+        return validar_rut_unico(value, Paciente, self.instance)
+    
     def validate(self, data):
         # Si es paciente NN, no requiere RUT
         if data.get('es_nn'):
@@ -156,6 +188,24 @@ class SignosVitalesSerializer(serializers.ModelSerializer):
         return value
 
 
+class SignosVitalesLecturaSerializer(SignosVitalesSerializer):
+    """Lectura de un monitor dentro de un lote (la ficha se indica una vez por lote)"""
+    timestamp = serializers.DateTimeField(required=False)
+    
+    class Meta(SignosVitalesSerializer.Meta):
+        fields = None
+        exclude = ['ficha']
+        read_only_fields = ['id', 'escala_glasgow']
+    
+    def validate_timestamp(self, value):
+        from datetime import timedelta
+        from django.utils import timezone
+        # Tolerancia para relojes de monitores levemente adelantados
+        if value > timezone.now() + timedelta(minutes=1):
+            raise serializers.ValidationError('La hora de la lectura no puede estar en el futuro')
+        return value
+
+
 class SignosVitalesNestedSerializer(serializers.ModelSerializer):
     """Serializer para crear signos vitales anidados (dentro de ficha)"""
     
@@ -378,6 +428,180 @@ class FichaEmergenciaSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'fecha_registro', 'fecha_actualizacion']
 
 
+RELACIONES_FICHA = ('signos_vitales', 'solicitudes_medicamentos', 'solicitudes_examenes',
+                    'anamnesis', 'triage', 'diagnostico')
+
+
+def optimizar_fichas(queryset, expandir=RELACIONES_FICHA):
+    """
+    Carga de una vez todo lo que serializan los serializers de ficha.
+
+    Las relaciones uno a uno van en el mismo JOIN y las listas en un prefetch
+    cada una (con sus usuarios ya unidos), así un listado hace siempre la
+    misma cantidad de consultas sin importar cuántas fichas tenga la página.
+
+    Args:
+        queryset: QuerySet de FichaEmergencia
+        expandir: Relaciones completas que se van a serializar. Los
+            últimos signos vitales ya vienen en la ficha, por lo que sin
+            signos_vitales no se consulta esa tabla.
+    """
+    queryset = queryset.select_related(
+        'paciente', 'paramedico', 'medico_asignado', 'triage__realizado_por', 'cama_asignada'
+    )
+
+    if 'signos_vitales' in expandir:
+        queryset = queryset.prefetch_related('signos_vitales')
+    if 'solicitudes_medicamentos' in expandir:
+        queryset = queryset.prefetch_related(Prefetch(
+            'solicitudes_medicamentos',
+            queryset=SolicitudMedicamento.objects.select_related('paramedico', 'medico'),
+        ))
+    if 'solicitudes_examenes' in expandir:
+        queryset = queryset.prefetch_related(Prefetch(
+            'solicitudes_examenes',
+            queryset=SolicitudExamen.objects.select_related('medico'),
+        ))
+    if 'anamnesis' in expandir:
+        queryset = queryset.select_related('anamnesis__tens')
+    if 'diagnostico' in expandir:
+        queryset = queryset.select_related('diagnostico__medico')
+    return queryset
+
+
+class PacienteResumenSerializer(serializers.ModelSerializer):
+    """Datos mínimos del paciente para listados"""
+    
+    class Meta:
+        model = Paciente
+        fields = ['id', 'rut', 'nombres', 'apellidos', 'sexo', 'edad', 'es_nn', 'id_temporal']
+
+
+class SignosVitalesResumenSerializer(serializers.ModelSerializer):
+    """Últimos signos vitales de una ficha (se guardan en FichaEmergencia.ultimos_signos_vitales)"""
+    
+    class Meta:
+        model = SignosVitales
+        fields = ['id', 'presion_sistolica', 'presion_diastolica', 'frecuencia_cardiaca',
+                  'frecuencia_respiratoria', 'saturacion_o2', 'temperatura', 'escala_glasgow',
+                  'eva', 'timestamp']
+
+
+def _parametro_lista(valor):
+    """Convierte 'a,b, c' en {'a', 'b', 'c'}"""
+    return {parte.strip() for parte in (valor or '').split(',') if parte.strip()}
+
+
+class FichaEmergenciaListSerializer(serializers.ModelSerializer):
+    """
+    Serializer compacto para listados y tableros de fichas.
+    
+    Por defecto entrega el resumen del paciente, los últimos signos vitales
+    con su alerta (guardados en la misma ficha), el nivel y color del triage
+    y la cama. Las relaciones completas se piden
+    con ?expand=signos_vitales,triage,... (o ?expand=* para la ficha completa)
+    y ?fields=id,estado,... limita los campos devueltos.
+    """
+    EXPANDIBLES = {
+        'signos_vitales': lambda: SignosVitalesSerializer(many=True, read_only=True),
+        'solicitudes_medicamentos': lambda: SolicitudMedicamentoSerializer(many=True, read_only=True),
+        'solicitudes_examenes': lambda: SolicitudExamenSerializer(many=True, read_only=True),
+        'anamnesis': lambda: AnamnesisSerializer(read_only=True),
+        'triage': lambda: TriageSerializer(read_only=True),
+        'diagnostico': lambda: DiagnosticoSerializer(read_only=True),
+    }
+    
+    paciente = PacienteResumenSerializer(read_only=True)
+    paramedico_nombre = serializers.CharField(source='paramedico.get_full_name', read_only=True)
+    medico_asignado_nombre = serializers.CharField(source='medico_asignado.get_full_name', read_only=True, allow_null=True)
+    triage_nivel_esi = serializers.SerializerMethodField()
+    triage_color = serializers.SerializerMethodField()
+    cama_asignada = CamaSimpleSerializer(read_only=True)
+    
+    class Meta:
+        model = FichaEmergencia
+        fields = ['id', 'paciente', 'paramedico', 'paramedico_nombre', 'medico_asignado',
+                  'medico_asignado_nombre', 'motivo_consulta', 'estado', 'prioridad', 'eta',
+                  'fecha_registro', 'fecha_actualizacion', 'fecha_llegada_hospital',
+                  'ultima_actividad', 'ultimos_signos_vitales', 'alerta_signos',
+                  'triage_nivel_esi', 'triage_color', 'cama_asignada']
+        read_only_fields = fields
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None:
+            return
+    
+        for nombre in self.expansiones(request):
+            self.fields[nombre] = self.EXPANDIBLES[nombre]()
+    
+        campos = _parametro_lista(request.query_params.get('fields'))
+        if campos:
+            for nombre in set(self.fields) - campos:
+                self.fields.pop(nombre)
+    
+    @classmethod
+    def expansiones(cls, request):
+        """Relaciones pedidas en ?expand= que este serializer sabe expandir"""
+        pedidas = _parametro_lista(request.query_params.get('expand'))
+        if '*' in pedidas:
+            return set(cls.EXPANDIBLES)
+        return pedidas & set(cls.EXPANDIBLES)
+    
+    def _triage(self, obj):
+        try:
+            return obj.triage
+        except Triage.DoesNotExist:
+            return None
+    
+    def get_triage_nivel_esi(self, obj):
+        triage = self._triage(obj)
+        return triage.nivel_esi if triage else None
+    
+    def get_triage_color(self, obj):
+        triage = self._triage(obj)
+        return triage.get_color_prioridad() if triage else None
+
+
+class DiagnosticoResumenSerializer(serializers.ModelSerializer):
+    """Diagnóstico de una atención en el historial del paciente"""
+    
+    class Meta:
+        model = Diagnostico
+        fields = ['codigo_diagnostico', 'diagnostico_cie10', 'descripcion', 'tipo_alta', 'fecha_diagnostico']
+
+
+class FichaHistorialSerializer(serializers.ModelSerializer):
+    """
+    Resumen de una atención para el historial del paciente: sin las
+    relaciones completas (se piden con /pacientes/{id}/historial/{ficha_id}/).
+    Consultar con select_related('medico_asignado', 'triage', 'diagnostico').
+    """
+    medico_asignado_nombre = serializers.CharField(source='medico_asignado.get_full_name', read_only=True, allow_null=True)
+    triage_nivel_esi = serializers.SerializerMethodField()
+    diagnostico = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = FichaEmergencia
+        fields = ['id', 'estado', 'prioridad', 'motivo_consulta', 'fecha_registro', 'fecha_llegada_hospital',
+                  'ultima_actividad', 'medico_asignado_nombre', 'ultimos_signos_vitales', 'triage_nivel_esi',
+                  'diagnostico']
+        read_only_fields = fields
+    
+    def get_triage_nivel_esi(self, obj):
+        try:
+            return obj.triage.nivel_esi
+        except Triage.DoesNotExist:
+            return None
+    
+    def get_diagnostico(self, obj):
+        try:
+            return DiagnosticoResumenSerializer(obj.diagnostico).data
+        except Diagnostico.DoesNotExist:
+            return None
+
+
 class FichaEmergenciaCreateSerializer(serializers.ModelSerializer):
     """Serializer simplificado para crear fichas de emergencia"""
     signos_vitales_data = SignosVitalesNestedSerializer(write_only=True)
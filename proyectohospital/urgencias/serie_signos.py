@@ -0,0 +1,184 @@
+"""
+Serie de signos vitales de una ficha reducida para gráficos.
+
+Una estadía larga en UCI acumula miles de lecturas; el gráfico no necesita
+más puntos que píxeles. La serie se entrega en columnas (un arreglo por
+signo) y reducida en el servidor a un número de puntos pedido:
+
+    minmax: la estadía se divide en tramos de igual duración y cada tramo
+        entrega el mínimo, máximo y promedio de cada signo (no se pierden
+        los picos).
+    lttb: Largest-Triangle-Three-Buckets; elige lecturas reales que
+        conservan la forma de la curva de REFERENCIA_LTTB, y entrega todos
+        los signos de esas lecturas.
+
+El resultado se guarda en caché por ficha, método, puntos y rango. La
+clave incluye la cantidad de lecturas y el último id de la ficha, por lo
+que una lectura nueva (o eliminada) genera otra clave; la corrección de
+una lectura existente se refleja al expirar la caché.
+
+Configuración (settings):
+    SIGNOS_SERIE_CACHE_SEGUNDOS: Duración de la serie en caché.
+"""
+import numpy as np
+
+from .segmentos import por_segmento
+
+# Nombre en la respuesta: (columna del modelo, decimales)
+SERIES = {
+    'fc': ('frecuencia_cardiaca', 0),
+    'pa_sistolica': ('presion_sistolica', 0),
+    'pa_diastolica': ('presion_diastolica', 0),
+    'fr': ('frecuencia_respiratoria', 0),
+    'spo2': ('saturacion_o2', 0),
+    'temp': ('temperatura', 1),
+    'glasgow': ('escala_glasgow', 0),
+}
+
+METODOS = ('minmax', 'lttb')
+PUNTOS_POR_DEFECTO = 500
+PUNTOS_MAXIMOS = 5000
+REFERENCIA_LTTB = 'fc'
+
+
+def _cargar(ficha_id, desde=None, hasta=None):
+    """Lecturas de la ficha en orden cronológico: (segundos, valores por serie)"""
+    from .models import SignosVitales
+
+    lecturas = SignosVitales.objects.filter(ficha_id=ficha_id)
+    if desde:
+        lecturas = lecturas.filter(timestamp__gte=desde)
+    if hasta:
+        lecturas = lecturas.filter(timestamp__lte=hasta)
+    filas = list(
+        lecturas.order_by('timestamp', 'id')
+        .values_list('timestamp', *(columna for columna, _ in SERIES.values()))
+    )
+    segundos = np.fromiter((fila[0].timestamp() for fila in filas), dtype=np.float64, count=len(filas))
+    # None (Glasgow sin registrar) queda como NaN
+    valores = np.array([fila[1:] for fila in filas], dtype=np.float64).reshape(len(filas), len(SERIES))
+    return segundos, dict(zip(SERIES, valores.T))
+
+
+def _lista(valores, decimales):
+    """Arreglo a lista JSON con NaN como None (enteros si no hay decimales)"""
+    convertir = int if decimales == 0 else float
+    return [None if valor != valor else convertir(valor) for valor in np.round(valores, decimales).tolist()]
+
+
+def _milisegundos(segundos):
+    return np.round(segundos * 1000).astype(np.int64).tolist()
+
+
+def tramos(segundos, puntos):
+    """
+    Divide la serie en `puntos` tramos de igual duración.
+
+    Returns:
+        tuple: (inicios, finales) de los tramos con lecturas (índices inclusive)
+    """
+    bordes = np.linspace(segundos[0], segundos[-1], puntos + 1)
+    tramo = np.minimum(np.searchsorted(bordes, segundos, side='right') - 1, puntos - 1)
+    inicios = np.flatnonzero(np.r_[True, tramo[1:] != tramo[:-1]])
+    finales = np.r_[inicios[1:] - 1, len(segundos) - 1]
+    return inicios, finales
+
+
+def minmax(segundos, series, puntos):
+    """Mínimo, máximo y promedio de cada serie por tramo de tiempo"""
+    if len(segundos) <= puntos:
+        inicios = finales = np.arange(len(segundos))
+    else:
+        inicios, finales = tramos(segundos, puntos)
+    cantidad = finales - inicios + 1
+    resultado = {'timestamps': _milisegundos(por_segmento(np.add, segundos, inicios, finales) / cantidad)}
+    for nombre, valores in series.items():
+        decimales = SERIES[nombre][1]
+        presentes = ~np.isnan(valores)
+        suma = por_segmento(np.add, np.where(presentes, valores, 0), inicios, finales)
+        con_valor = por_segmento(np.add, presentes.astype(np.float64), inicios, finales)
+        with np.errstate(invalid='ignore'):
+            promedio = suma / con_valor
+        resultado[nombre] = {
+            # fmin/fmax ignoran NaN salvo que todo el tramo lo sea
+            'min': _lista(por_segmento(np.fmin, valores, inicios, finales), decimales),
+            'max': _lista(por_segmento(np.fmax, valores, inicios, finales), decimales),
+            'avg': _lista(promedio, max(decimales, 1)),
+        }
+    return resultado
+
+
+def lttb(x, y, puntos):
+    """
+    Índices elegidos por Largest-Triangle-Three-Buckets.
+
+    Se conservan la primera y la última lectura; de cada tramo intermedio
+    se elige la que forma el triángulo de mayor área con la elegida en el
+    tramo anterior y el promedio del tramo siguiente.
+    """
+    n = len(x)
+    if puntos >= n:
+        return np.arange(n)
+    if puntos < 3:
+        # Sin tramos intermedios quedan solo los extremos
+        return np.array([0, n - 1][:puntos], dtype=np.intp)
+
+    bordes = np.linspace(1, n - 1, puntos - 1).astype(np.intp)
+    elegidos = np.empty(puntos, dtype=np.intp)
+    elegidos[0], elegidos[-1] = 0, n - 1
+    anterior = 0
+    for i in range(puntos - 2):
+        inicio, fin = bordes[i], bordes[i + 1]
+        if i + 2 < len(bordes):
+            siguiente_x = x[fin:bordes[i + 2]].mean()
+            siguiente_y = y[fin:bordes[i + 2]].mean()
+        else:
+            siguiente_x, siguiente_y = x[-1], y[-1]
+        area = np.abs(
+            (x[anterior] - siguiente_x) * (y[inicio:fin] - y[anterior])
+            - (x[anterior] - x[inicio:fin]) * (siguiente_y - y[anterior])
+        )
+        anterior = inicio + int(np.argmax(area))
+        elegidos[i + 1] = anterior
+    return elegidos
+
+
+def _lttb(segundos, series, puntos):
+    elegidos = lttb(segundos, series[REFERENCIA_LTTB], puntos)
+    resultado = {'timestamps': _milisegundos(segundos[elegidos])}
+    for nombre, valores in series.items():
+        resultado[nombre] = _lista(valores[elegidos], SERIES[nombre][1])
+    return resultado
+
+
+def calcular(ficha_id, puntos=PUNTOS_POR_DEFECTO, metodo='minmax', desde=None, hasta=None):
+    """Serie reducida de la ficha, sin caché"""
+    segundos, series = _cargar(ficha_id, desde, hasta)
+    datos = {'ficha': ficha_id, 'metodo': metodo, 'lecturas': len(segundos)}
+    if not len(segundos):
+        datos.update({'puntos': 0, 'timestamps': []})
+        datos.update({nombre: [] if metodo == 'lttb' else {'min': [], 'max': [], 'avg': []} for nombre in SERIES})
+        return datos
+
+    datos.update(minmax(segundos, series, puntos) if metodo == 'minmax' else _lttb(segundos, series, puntos))
+    datos['puntos'] = len(datos['timestamps'])
+    return datos
+
+
+def obtener(ficha_id, puntos=PUNTOS_POR_DEFECTO, metodo='minmax', desde=None, hasta=None):
+    """Serie reducida de la ficha desde la caché (ver calcular)"""
+    from django.conf import settings
+    from django.core.cache import cache
+    from django.db.models import Count, Max
+    from .models import SignosVitales
+
+    estado = SignosVitales.objects.filter(ficha_id=ficha_id).aggregate(n=Count('id'), ultimo=Max('id'))
+    clave = ':'.join(str(parte) for parte in (
+        'signos:serie', ficha_id, estado['n'], estado['ultimo'], metodo, puntos,
+        desde.isoformat() if desde else '', hasta.isoformat() if hasta else '',
+    ))
+    datos = cache.get(clave)
+    if datos is None:
+        datos = calcular(ficha_id, puntos, metodo, desde, hasta)
+        cache.set(clave, datos, getattr(settings, 'SIGNOS_SERIE_CACHE_SEGUNDOS', 600))
+    return datos
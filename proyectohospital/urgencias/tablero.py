@@ -0,0 +1,210 @@
+"""
+Tablero del servicio de urgencias: fichas activas agrupadas por estado.
+
+En lugar de que cada cliente consulte en_ruta, en_hospital, hospitalizados,
+etc. por separado, el tablero mantiene en caché una foto de todas las
+fichas activas con un número de versión. Cada escritura que cambia una
+ficha (creación, estado, médico, triage, cama, signos vitales) registra un
+cambio con la versión siguiente, y el cliente que ya tiene la versión N
+recibe solo los cambios posteriores.
+
+Cada cambio contiene la ficha completa en su forma compacta, con su puntaje
+de alerta temprana (o None si dejó de estar activa), por lo que aplicarlo
+dos veces no tiene efecto: el cliente quita la ficha de su grupo anterior y
+la agrega en el de su estado actual.
+
+Configuración (settings):
+    TABLERO_HISTORIAL_SEGUNDOS: Tiempo que se guarda cada cambio en caché.
+    TABLERO_MAX_CAMBIOS: Sobre esta cantidad de cambios se envía la foto completa.
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+# Estados que aparecen en el tablero (los demás son fichas cerradas)
+ESTADOS_TABLERO = ('en_ruta', 'en_hospital', 'atendido', 'hospitalizado', 'uci')
+
+CLAVE_VERSION = 'tablero:version'
+CLAVE_FOTO = 'tablero:foto'
+
+
+def _clave_cambio(version):
+    return f'tablero:cambio:{version}'
+
+
+def _timeout():
+    return getattr(settings, 'TABLERO_HISTORIAL_SEGUNDOS', 3600)
+
+
+def version_actual():
+    """Última versión publicada del tablero"""
+    version = cache.get(CLAVE_VERSION)
+    if version is None:
+        # Si la caché se vació, la numeración parte desde el reloj para quedar
+        # siempre por sobre las versiones que tengan los clientes
+        cache.add(CLAVE_VERSION, int(time.time() * 1000), None)
+        version = cache.get(CLAVE_VERSION)
+    return version
+
+
+def _serializar(fichas):
+    """Fichas en forma compacta con su puntaje de alerta temprana"""
+    from .serializers import FichaEmergenciaListSerializer
+
+    datos = FichaEmergenciaListSerializer(fichas, many=True).data
+    for dato in datos:
+        # Evaluado al registrar la última lectura (FichaEmergencia.alerta_signos)
+        dato['alerta_temprana'] = dato.pop('alerta_signos')
+    return datos
+
+
+def _fichas_activas():
+    from .models import FichaEmergencia
+    from .serializers import optimizar_fichas
+    return optimizar_fichas(FichaEmergencia.objects.filter(estado__in=ESTADOS_TABLERO), ())
+
+
+def registrar_cambio(*fichas_ids):
+    """
+    Publica el estado actual de las fichas al confirmarse la transacción.
+
+    Se llama desde las escrituras que cambian lo que muestra el tablero.
+    """
+    fichas_ids = {ficha_id for ficha_id in fichas_ids if ficha_id}
+    if fichas_ids:
+        transaction.on_commit(lambda: _publicar(fichas_ids))
+
+
+def _publicar(fichas_ids):
+    try:
+        # La versión se reserva antes de leer la ficha: si dos escrituras
+        # compiten, la versión mayor siempre lleva el estado más nuevo
+        versiones = {ficha_id: _incrementar_version() for ficha_id in sorted(fichas_ids)}
+        activas = {
+            dato['id']: dato
+            for dato in _serializar(_fichas_activas().filter(id__in=fichas_ids))
+        }
+        cache.set_many({
+            _clave_cambio(version): {
+                'version': version,
+                'ficha_id': ficha_id,
+                'estado': activas[ficha_id]['estado'] if ficha_id in activas else None,
+                'ficha': activas.get(ficha_id),
+            }
+            for ficha_id, version in versiones.items()
+        }, _timeout())
+    except Exception:
+        logger.exception('No se pudo actualizar el tablero para las fichas %s', sorted(fichas_ids))
+
+
+def _incrementar_version():
+    version_actual()
+    try:
+        return cache.incr(CLAVE_VERSION)
+    except ValueError:
+        # La clave expiró entre ambas llamadas
+        return version_actual()
+
+
+def cambios_desde(version, hasta=None):
+    """
+    Cambios posteriores a `version`, en orden.
+
+    Returns:
+        list o None si ya no están todos en caché (el cliente debe pedir la
+        foto completa). Si el cambio más reciente aún se está escribiendo,
+        se devuelven solo los anteriores a él.
+    """
+    hasta = version_actual() if hasta is None else hasta
+    if version > hasta or hasta - version > getattr(settings, 'TABLERO_MAX_CAMBIOS', 500):
+        return None
+
+    versiones = range(version + 1, hasta + 1)
+    guardados = cache.get_many([_clave_cambio(v) for v in versiones])
+    cambios = []
+    for v in versiones:
+        cambio = guardados.get(_clave_cambio(v))
+        if cambio is None:
+            break
+        cambios.append(cambio)
+
+    if versiones and not cambios:
+        return None
+    return cambios
+
+
+def aplicar_cambios(estados, cambios):
+    """Aplica cambios a un diccionario {estado: [fichas]} (más recientes primero)"""
+    ids = {cambio['ficha_id'] for cambio in cambios}
+    for estado in estados:
+        estados[estado] = [ficha for ficha in estados[estado] if ficha['id'] not in ids]
+
+    ultimos = {cambio['ficha_id']: cambio for cambio in cambios}
+    for cambio in ultimos.values():
+        if cambio['ficha'] is not None:
+            estados[cambio['estado']].append(cambio['ficha'])
+
+    for estado in estados:
+        estados[estado].sort(key=lambda ficha: ficha['id'], reverse=True)
+    return estados
+
+
+def _construir_foto():
+    version = version_actual()
+    estados = {estado: [] for estado in ESTADOS_TABLERO}
+    for dato in _serializar(_fichas_activas().order_by('-id')):
+        estados[dato['estado']].append(dato)
+    return {'version': version, 'estados': estados}
+
+
+def foto():
+    """
+    Foto completa del tablero en su versión más reciente.
+
+    Se parte de la foto en caché y se le aplican los cambios posteriores;
+    solo si faltan cambios se vuelve a armar desde la base de datos.
+    """
+    actual = version_actual()
+    guardada = cache.get(CLAVE_FOTO)
+    if guardada is not None and guardada['version'] == actual:
+        return guardada
+
+    cambios = cambios_desde(guardada['version'], actual) if guardada is not None else None
+    if cambios:
+        guardada = {
+            'version': cambios[-1]['version'],
+            'estados': aplicar_cambios(guardada['estados'], cambios),
+        }
+    else:
+        guardada = _construir_foto()
+    cache.set(CLAVE_FOTO, guardada, _timeout())
+    return guardada
+
+
+def obtener(desde=None):
+    """
+    Respuesta del tablero para un cliente.
+
+    Args:
+        desde: Versión que ya tiene el cliente (None para la foto completa)
+
+    Returns:
+        dict: {'version', 'completo': False, 'cambios'} si se pueden enviar
+        solo los cambios, o {'version', 'completo': True, 'estados'}.
+    """
+    if desde is not None:
+        cambios = cambios_desde(desde)
+        if cambios is not None:
+            return {
+                'version': cambios[-1]['version'] if cambios else desde,
+                'completo': False,
+                'cambios': cambios,
+            }
+
+    datos = foto()
+    return {'version': datos['version'], 'completo': True, 'estados': datos['estados']}
@@ -1,3 +1,1289 @@
-from django.test import TestCase
+import threading
 
-# Create your tests here.
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from .models import (Usuario, Paciente, FichaEmergencia, SignosVitales, SolicitudMedicamento,
+                     Anamnesis, Triage, Diagnostico, SolicitudExamen, Cama, SecuenciaDiagnostico, Notificacion)
+
+# Auditoría síncrona en los tests: los registros se verifican al terminar cada request
+auditoria_sincrona = override_settings(AUDIT_LOG_ASYNC=False)
+
+
+@auditoria_sincrona
+class ConsultasListadoFichasTest(TestCase):
+    """Los listados de fichas hacen una cantidad fija de consultas por página"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.medico = Usuario.objects.create_user(
+            username='medico', password='x', rut='11111111-1', rol='medico', email='medico@hospital.cl'
+        )
+        cls.paramedico = Usuario.objects.create_user(
+            username='paramedico', password='x', rut='22222222-2', rol='paramedico', email='paramedico@hospital.cl'
+        )
+        cls.tens = Usuario.objects.create_user(
+            username='tens', password='x', rut='33333333-3', rol='tens', email='tens@hospital.cl'
+        )
+        cls.numero = 0
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.medico)
+    
+    def crear_ficha(self, estado='en_hospital', con_triage=True):
+        """Ficha con todas sus relaciones cargadas"""
+        ConsultasListadoFichasTest.numero += 1
+        numero = self.numero
+        paciente = Paciente.objects.create(
+            rut=f'{numero}-K', nombres=f'Paciente {numero}', apellidos='Prueba',
+            sexo='Masculino', fecha_nacimiento='1980-01-01'
+        )
+        ficha = FichaEmergencia.objects.create(
+            paciente=paciente, paramedico=self.paramedico, medico_asignado=self.medico,
+            motivo_consulta='Dolor torácico', circunstancias='-', sintomas='-',
+            nivel_consciencia='Alerta', estado=estado, prioridad='C2'
+        )
+        for frecuencia in (80, 95):
+            SignosVitales.objects.create(
+                ficha=ficha, presion_sistolica=120, presion_diastolica=80, frecuencia_cardiaca=frecuencia,
+                frecuencia_respiratoria=16, saturacion_o2=98, temperatura=36.5
+            )
+        SolicitudMedicamento.objects.create(
+            ficha=ficha, paramedico=self.paramedico, medico=self.medico,
+            medicamento='Aspirina', dosis='500 mg', justificacion='-'
+        )
+        SolicitudExamen.objects.create(
+            ficha=ficha, medico=self.medico, tipo_examen='laboratorio',
+            examenes_especificos='Hemograma', justificacion='-'
+        )
+        Anamnesis.objects.create(
+            ficha=ficha, tens=self.tens, historia_enfermedad_actual='-', antecedentes_medicos='-'
+        )
+        if con_triage:
+            Triage.objects.create(ficha=ficha, realizado_por=self.tens, nivel_esi=2, motivo_consulta_triage='-')
+        Diagnostico.objects.create(ficha=ficha, medico=self.medico, diagnostico_cie10='I20', descripcion='-',
+                                   indicaciones_medicas='-')
+        Cama.objects.create(numero=f'C-{numero}', tipo='box', estado='ocupada', ficha_actual=ficha)
+        return ficha
+    
+    def contar_consultas(self, url):
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(consultas)
+    
+    def assertConsultasConstantes(self, url, estado='en_hospital', con_triage=True):
+        self.crear_ficha(estado, con_triage)
+        con_una = self.contar_consultas(url)
+        for _ in range(4):
+            self.crear_ficha(estado, con_triage)
+        self.assertEqual(self.contar_consultas(url), con_una, url)
+        return con_una
+    
+    def test_listado_compacto(self):
+        # Solo las fichas: los últimos signos vitales vienen en la misma fila
+        # (la paginación por cursor no hace COUNT)
+        self.assertEqual(self.assertConsultasConstantes('/api/fichas/'), 1)
+        with CaptureQueriesContext(connection) as consultas:
+            self.client.get('/api/fichas/')
+        self.assertNotIn(SignosVitales._meta.db_table, consultas[0]['sql'])
+    
+    def test_ultimos_signos_en_ficha(self):
+        ficha = self.crear_ficha()
+        ultima = ficha.signos_vitales.order_by('-timestamp', '-id').first()
+        datos = self.client.get('/api/fichas/').json()['results'][0]
+        self.assertEqual(datos['ultimos_signos_vitales']['id'], ultima.id)
+        self.assertEqual(datos['ultimos_signos_vitales']['frecuencia_cardiaca'], 95)
+        self.assertEqual(datos['alerta_signos']['news2'], 1)  # FC 95
+        
+        # Al eliminar la última lectura queda la anterior
+        ultima.delete()
+        datos = self.client.get('/api/fichas/').json()['results'][0]
+        self.assertEqual(datos['ultimos_signos_vitales']['frecuencia_cardiaca'], 80)
+    
+    def test_listado_expandido(self):
+        # + signos vitales, medicamentos y exámenes
+        self.assertEqual(self.assertConsultasConstantes('/api/fichas/?expand=*'), 4)
+    
+    def test_acciones_por_estado(self):
+        for accion, estado in [('en_ruta', 'en_ruta'), ('en_hospital', 'en_hospital'),
+                               ('hospitalizados', 'hospitalizado'), ('en_uci', 'uci'),
+                               ('derivados', 'derivado'), ('fallecidos', 'fallecido'),
+                               ('dados_de_alta', 'dado_de_alta'), ('atendidas', 'atendido')]:
+            with self.subTest(accion=accion):
+                self.assertEqual(self.assertConsultasConstantes(f'/api/fichas/{accion}/', estado), 1)
+                self.assertEqual(self.contar_consultas(f'/api/fichas/{accion}/?expand=*'), 4)
+    
+    def test_triage_pendientes(self):
+        self.assertEqual(self.assertConsultasConstantes('/api/triage/pendientes/', con_triage=False), 1)
+    
+    def test_historial_paciente(self):
+        # Paciente, página de resúmenes y totales agrupados
+        ficha = self.crear_ficha()
+        url = f'/api/pacientes/{ficha.paciente_id}/historial/'
+        con_una = self.contar_consultas(url)
+        for _ in range(4):
+            otra = self.crear_ficha()
+            otra.paciente = ficha.paciente
+            otra.save()
+        self.assertEqual(self.contar_consultas(url), con_una)
+        self.assertEqual(con_una, 3)
+        
+        datos = self.client.get(url).json()
+        self.assertEqual(datos['totales']['atenciones'], 5)
+        self.assertNotIn('signos_vitales', datos['fichas'][0])
+        
+        # El detalle de una atención se pide aparte
+        detalle = self.client.get(f'{url}{ficha.id}/').json()
+        self.assertEqual(len(detalle['signos_vitales']), 2)
+
+
+@auditoria_sincrona
+class EstadisticasCamasTest(TestCase):
+    """Las estadísticas de camas salen de una consulta agrupada y quedan en caché"""
+    
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(Usuario.objects.create_user(
+            username='tens', password='x', rut='33333333-3', rol='tens', email='tens@hospital.cl'
+        ))
+        for numero, tipo, piso in [('B-1', 'box', 1), ('B-2', 'box', 1), ('U-1', 'uci', 2)]:
+            Cama.objects.create(numero=numero, tipo=tipo, piso=piso, sala=f'Sala {piso}')
+    
+    def estadisticas(self):
+        with CaptureQueriesContext(connection) as consultas:
+            datos = self.client.get('/api/camas/estadisticas/').json()
+        return datos, len(consultas)
+    
+    def test_una_consulta_y_cache(self):
+        datos, consultas = self.estadisticas()
+        self.assertEqual(consultas, 1)
+        self.assertEqual(datos['total'], 3)
+        self.assertEqual(datos['por_tipo']['box']['disponibles'], 2)
+        self.assertEqual(datos['por_piso']['2']['total'], 1)
+        self.assertEqual(datos['por_sala']['Sala 1']['total'], 2)
+        self.assertEqual(self.estadisticas()[1], 0)
+    
+    def test_invalidacion(self):
+        self.estadisticas()
+        cama = Cama.objects.get(numero='U-1')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/camas/{cama.id}/cambiar_estado/', {'estado': 'mantenimiento'})
+        datos, consultas = self.estadisticas()
+        self.assertEqual(consultas, 1)
+        self.assertEqual(datos['por_tipo']['uci']['mantenimiento'], 1)
+        self.assertEqual(datos['porcentaje_ocupacion'], 0)
+
+
+
+@auditoria_sincrona
+class InventarioCamasTest(TestCase):
+    """Las camas se crean y eliminan en bloque con un número fijo de consultas"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(Usuario.objects.create_user(
+            username='admin', password='x', rut='44444444-4', rol='administrador', email='admin@hospital.cl'
+        ))
+    
+    def test_patron_en_bloque(self):
+        Cama.objects.create(numero='BOX-02', tipo='box')
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.post('/api/camas/inventario/', {
+                'patron': {'tipo': 'box', 'cantidad': 600, 'inicio': 3, 'digitos': 3, 'piso': 1}
+            }, format='json')
+        self.assertEqual(respuesta.status_code, 201)
+        self.assertEqual(respuesta.json()['resumen']['desde'], 'BOX-003')
+        self.assertEqual(Cama.objects.filter(piso=1).count(), 600)
+        # INSERT en lotes (SQLite limita los parámetros por consulta: lotes más chicos que LOTE)
+        self.assertLess(len(consultas), 20)
+        
+        ids = list(Cama.objects.values_list('id', flat=True))
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.post('/api/camas/eliminar_multiple/', {'ids': ids}, format='json')
+        self.assertEqual(respuesta.json()['mensaje'], 'Se eliminaron 601 camas')
+        self.assertLess(len(consultas), 20)
+    
+    def test_csv_con_errores_no_crea_ninguna(self):
+        Cama.objects.create(numero='UCI-01', tipo='uci')
+        texto = 'numero,tipo,piso,sala\nUCI-01,uci,3,UCI\nUCI-02,uci,3,UCI\nX-1,quirofano,1,\n'
+        respuesta = self.client.post('/api/camas/inventario/', {'csv': texto}, format='json')
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual([(error['fila'], error['numero']) for error in respuesta.json()['error']],
+                         [(3, 'X-1'), (1, 'UCI-01')])
+        self.assertEqual(Cama.objects.count(), 1)
+        
+        respuesta = self.client.post('/api/camas/crear_multiple/', {'tipo': 'uci', 'cantidad': 3}, format='json')
+        self.assertEqual([cama['numero'] for cama in respuesta.json()['camas']], ['UCI-02', 'UCI-03', 'UCI-04'])
+
+
+
+def crear_fichas(paramedico, cantidad, prioridad='C3', estado='en_hospital'):
+    """Fichas mínimas (sin signos vitales ni triage) con un paciente cada una"""
+    fichas = []
+    for _ in range(cantidad):
+        paciente = Paciente.objects.create(nombres='Paciente', apellidos='Prueba', sexo='Femenino')
+        fichas.append(FichaEmergencia.objects.create(
+            paciente=paciente, paramedico=paramedico, motivo_consulta='-', circunstancias='-',
+            sintomas='-', nivel_consciencia='Alerta', estado=estado, prioridad=prioridad
+        ))
+    return fichas
+
+
+@auditoria_sincrona
+class AsignacionCamasTest(TestCase):
+    """La asignación automática elige cama por tipo, piso y gravedad"""
+    
+    def setUp(self):
+        self.tens = Usuario.objects.create_user(
+            username='tens', password='x', rut='33333333-3', rol='tens', email='tens@hospital.cl'
+        )
+        for numero, tipo, piso in [('B-1', 'box', 1), ('B-2', 'box', 2), ('U-1', 'uci', 3)]:
+            Cama.objects.create(numero=numero, tipo=tipo, piso=piso)
+    
+    def test_lote_por_gravedad(self):
+        from .asignacion_camas import asignar_lote
+        
+        leve, = crear_fichas(self.tens, 1, prioridad='C4')
+        grave, = crear_fichas(self.tens, 1, prioridad='C1')
+        otra, = crear_fichas(self.tens, 1, prioridad='C5')
+        uci, = crear_fichas(self.tens, 1, estado='uci')
+        resultado = asignar_lote([leve.id, grave.id, otra.id, uci.id], self.tens)
+        
+        asignadas = {ficha.id: cama.numero for ficha, cama in resultado['asignadas']}
+        # El más grave recibe la cama del piso más bajo; la ficha en UCI, cama UCI
+        self.assertEqual(asignadas, {grave.id: 'B-1', leve.id: 'B-2', uci.id: 'U-1'})
+        self.assertEqual([ficha.id for ficha in resultado['sin_cama']], [otra.id])
+    
+    def test_piso_preferido(self):
+        from .asignacion_camas import asignar_lote
+        
+        ficha, = crear_fichas(self.tens, 1)
+        resultado = asignar_lote([ficha.id], self.tens, piso=2)
+        self.assertEqual(resultado['asignadas'][0][1].numero, 'B-2')
+    
+    def test_cama_ocupada(self):
+        primera, segunda = crear_fichas(self.tens, 2)
+        cama = Cama.objects.get(numero='B-1')
+        client = APIClient()
+        client.force_authenticate(self.tens)
+        self.assertEqual(client.post(f'/api/camas/{cama.id}/asignar/', {'ficha_id': primera.id}).status_code, 200)
+        self.assertEqual(client.post(f'/api/camas/{cama.id}/asignar/', {'ficha_id': segunda.id}).status_code, 400)
+
+
+def en_paralelo(funcion, argumentos):
+    """Ejecuta funcion(argumento) en un hilo por argumento, todos a la vez"""
+    barrera = threading.Barrier(len(argumentos))
+    resultados, errores = [], []
+    
+    def trabajador(argumento):
+        try:
+            barrera.wait()
+            resultados.append(funcion(argumento))
+        except Exception as e:
+            errores.append(e)
+        finally:
+            connection.close()
+    
+    hilos = [threading.Thread(target=trabajador, args=(argumento,)) for argumento in argumentos]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    return resultados, errores
+
+
+@auditoria_sincrona
+class AsignacionCamasConcurrenteTest(TransactionTestCase):
+    """
+    Prueba de carga: muchas asignaciones simultáneas nunca dejan una cama
+    con dos fichas ni una ficha con dos camas.
+    
+    Necesita conexiones concurrentes reales (MySQL, o SQLite en archivo con
+    transacciones IMMEDIATE); se omite con SQLite en memoria.
+    """
+    HILOS = 12
+    CAMAS = 5
+    
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('Requiere una base de datos con conexiones concurrentes')
+        self.tens = Usuario.objects.create_user(
+            username='tens', password='x', rut='33333333-3', rol='tens', email='tens@hospital.cl'
+        )
+        self.fichas = crear_fichas(self.tens, self.HILOS)
+        for numero in range(self.CAMAS):
+            Cama.objects.create(numero=f'B-{numero}', tipo='box', piso=1)
+    
+    def assertSinDoblesReservas(self):
+        ocupadas = list(Cama.objects.filter(ficha_actual__isnull=False).values_list('estado', 'ficha_actual_id'))
+        self.assertTrue(all(estado == 'ocupada' for estado, _ in ocupadas))
+        self.assertEqual(len({ficha_id for _, ficha_id in ocupadas}), len(ocupadas))
+        return len(ocupadas)
+    
+    def test_asignacion_automatica_simultanea(self):
+        from .asignacion_camas import asignar_lote
+        
+        resultados, errores = en_paralelo(
+            lambda ficha: asignar_lote([ficha.id], self.tens), self.fichas
+        )
+        self.assertEqual(errores, [])
+        asignadas = [cama.pk for resultado in resultados for _, cama in resultado['asignadas']]
+        self.assertEqual(len(asignadas), self.CAMAS)
+        self.assertEqual(len(set(asignadas)), self.CAMAS)
+        self.assertEqual(sum(len(resultado['sin_cama']) for resultado in resultados), self.HILOS - self.CAMAS)
+        self.assertEqual(self.assertSinDoblesReservas(), self.CAMAS)
+    
+    def test_misma_cama_simultanea(self):
+        from .asignacion_camas import asignar
+        
+        cama = Cama.objects.first()
+        resultados, errores = en_paralelo(
+            lambda ficha: asignar(cama.pk, ficha, self.tens), self.fichas
+        )
+        self.assertEqual(len(resultados), 1)
+        self.assertEqual(len(errores), self.HILOS - 1)
+        self.assertTrue(all(isinstance(error, ValueError) for error in errores))
+        self.assertEqual(self.assertSinDoblesReservas(), 1)
+
+
+@auditoria_sincrona
+class CodigosDiagnosticoTest(TestCase):
+    """Los códigos DX-YYYYMMDD-XXXX salen de un contador por día"""
+    
+    def setUp(self):
+        self.medico = Usuario.objects.create_user(
+            username='medico', password='x', rut='22222222-2', rol='medico', email='medico@hospital.cl'
+        )
+        self.fichas = crear_fichas(self.medico, 3)
+    
+    def diagnosticar(self, ficha):
+        return Diagnostico.objects.create(
+            ficha=ficha, medico=self.medico, diagnostico_cie10='R07.4', descripcion='-', indicaciones_medicas='-'
+        )
+    
+    def test_correlativo_y_bloque(self):
+        from django.utils import timezone
+        from .codigos_diagnostico import formatear, reservar
+        
+        hoy = timezone.now().date()
+        # Código emitido antes de existir el contador: se continúa desde él
+        Diagnostico.objects.filter(pk=self.diagnosticar(self.fichas[0]).pk).update(codigo_diagnostico=formatear(hoy, 41))
+        SecuenciaDiagnostico.objects.all().delete()
+        
+        self.assertEqual(self.diagnosticar(self.fichas[1]).codigo_diagnostico, formatear(hoy, 42))
+        self.assertEqual(reservar(3), [formatear(hoy, numero) for numero in (43, 44, 45)])
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertEqual(self.diagnosticar(self.fichas[2]).codigo_diagnostico, formatear(hoy, 46))
+        # Ya no se buscan los códigos del día: solo el UPDATE del contador y su lectura
+        self.assertFalse(any('LIKE' in consulta['sql'] for consulta in consultas))
+
+
+@auditoria_sincrona
+class CodigosDiagnosticoConcurrenteTest(TransactionTestCase):
+    """Altas simultáneas nunca reciben el mismo código (ver AsignacionCamasConcurrenteTest)"""
+    HILOS = 10
+    
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('Requiere una base de datos con conexiones concurrentes')
+    
+    def test_reservas_simultaneas(self):
+        from .codigos_diagnostico import reservar
+        
+        resultados, errores = en_paralelo(lambda cantidad: reservar(cantidad), [1, 2] * (self.HILOS // 2))
+        self.assertEqual(errores, [])
+        codigos = [codigo for resultado in resultados for codigo in resultado]
+        self.assertEqual(len(set(codigos)), len(codigos))
+        self.assertEqual(sorted(int(codigo[-4:]) for codigo in codigos), list(range(1, len(codigos) + 1)))
+
+
+@auditoria_sincrona
+class RutNormalizadoTest(TestCase):
+    """RUT normalizado: dígito verificador, búsqueda exacta y duplicados anteriores a la normalización"""
+    
+    def setUp(self):
+        self.admin = Usuario.objects.create_user(
+            username='admin', password='x', rut='44444444-4', rol='administrador', email='admin@hospital.cl'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+    
+    def test_digito_verificador_y_formato(self):
+        from .utils import digito_verificador, normalizar_rut, rut_valido
+        
+        self.assertEqual(digito_verificador(12345678), '5')
+        self.assertEqual(digito_verificador(10000013), 'K')
+        self.assertEqual(normalizar_rut('12.345.678-5'), normalizar_rut(' 123456785 '))
+        self.assertFalse(rut_valido('12.345.678-9'))
+        paciente = Paciente.objects.create(rut='123456785', nombres='Ana', apellidos='Soto', sexo='Femenino')
+        self.assertEqual((paciente.rut, paciente.rut_numero, paciente.rut_dv), ('12.345.678-5', 12345678, '5'))
+    
+    def test_duplicado_anterior_se_puede_editar_y_se_fusiona_tras_revisarlo(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from django.core.management.base import CommandError
+        from .models import AuditLog
+        
+        original = Paciente.objects.create(rut='12.345.678-5', nombres='Ana', apellidos='Soto', sexo='Femenino')
+        duplicado = Paciente.objects.create(nombres='Ana', apellidos='Soto', sexo='Femenino')
+        otro_dv = Paciente.objects.create(nombres='Ana', apellidos='Soto', sexo='Femenino')
+        # Como los dejó la migración 0027: sin rut_numero. '-3' no es el dígito de 12.345.678
+        Paciente.objects.filter(pk=duplicado.pk).update(rut='12345678-5', rut_numero=None, rut_dv='')
+        Paciente.objects.filter(pk=otro_dv.pk).update(rut='12345678-3', rut_numero=None, rut_dv='')
+        duplicado.refresh_from_db()
+        ficha = crear_fichas(self.admin, 1)[0]
+        FichaEmergencia.objects.filter(pk=ficha.pk).update(paciente=duplicado)
+        
+        duplicado.nombres = 'Ana María'
+        duplicado.save()
+        duplicado.refresh_from_db()
+        self.assertEqual((duplicado.rut, duplicado.rut_numero), ('12345678-5', None))
+        
+        salida = StringIO()
+        call_command('revisar_ruts_duplicados', stdout=salida)
+        self.assertIn(f'#{duplicado.id} 12345678-5', salida.getvalue())
+        self.assertNotIn(f'#{otro_dv.id} ', salida.getvalue())
+        self.assertEqual(Paciente.objects.count(), 4)
+        
+        with self.assertRaises(CommandError):
+            call_command('revisar_ruts_duplicados', fusionar=[otro_dv.id], stdout=StringIO())
+        call_command('revisar_ruts_duplicados', fusionar=[duplicado.id], stdout=StringIO())
+        self.assertFalse(Paciente.objects.filter(pk=duplicado.pk).exists())
+        self.assertTrue(Paciente.objects.filter(pk=otro_dv.pk).exists())
+        self.assertEqual(FichaEmergencia.objects.get(pk=ficha.pk).paciente_id, original.pk)
+        registro = AuditLog.objects.get(modelo='Paciente', objeto_id=original.pk)
+        self.assertEqual(registro.detalles['fusion_duplicados'][0]['id'], duplicado.pk)
+    
+    def test_busqueda_de_usuarios_numerica(self):
+        Usuario.objects.create_user(
+            username='tens', password='x', rut='33333333-3', rol='tens', email='tens1236@hospital.cl'
+        )
+        # '1236' tiene dígito verificador válido (123-6) pero no es el RUT de nadie
+        respuesta = self.client.get('/api/usuarios/', {'search': '1236'}).json()
+        usuarios = respuesta['results'] if isinstance(respuesta, dict) else respuesta
+        self.assertEqual([usuario['username'] for usuario in usuarios], ['tens'])
+        respuesta = self.client.get('/api/usuarios/', {'search': '33.333.333-3'}).json()
+        usuarios = respuesta['results'] if isinstance(respuesta, dict) else respuesta
+        self.assertEqual([usuario['username'] for usuario in usuarios], ['tens'])
+
+
+@auditoria_sincrona
+class AuditLogArchivoTest(TestCase):
+    """El listado de auditoría continúa en el archivo mensual al agotarse la tabla, con el mismo cursor"""
+    
+    def setUp(self):
+        import tempfile
+        from datetime import timedelta
+        from django.test import override_settings
+        from django.utils import timezone
+        from .models import AuditLog
+        
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        ajustes = override_settings(AUDIT_LOG_ARCHIVE_DIR=directorio.name, AUDIT_LOG_RETENTION_DAYS=30)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        
+        self.admin = Usuario.objects.create_user(
+            username='admin', password='x', rut='44444444-4', rol='administrador', email='admin@hospital.cl'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        ahora = timezone.now()
+        for dias in (1, 2, 3, 40, 41, 70, 71):
+            registro = AuditLog.objects.create(usuario=self.admin, accion='editar', modelo='Paciente', objeto_id=dias)
+            AuditLog.objects.filter(pk=registro.pk).update(timestamp=ahora - timedelta(days=dias))
+    
+    def test_paginas_de_tabla_y_archivo(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from .auditoria import archivar
+        from .models import AuditLog
+        
+        self.assertEqual(archivar(), 4)
+        self.assertEqual(AuditLog.objects.count(), 3)
+        
+        url = f'/api/audit-logs/?fecha_desde={(timezone.now() - timedelta(days=90)).date()}&page_size=2'
+        objetos, paginas = [], 0
+        while url:
+            with CaptureQueriesContext(connection) as consultas:
+                datos = self.client.get(url).json()
+            self.assertEqual(set(datos), {'next', 'previous', 'results'})
+            # Sin N+1 sobre el usuario de cada registro
+            self.assertLessEqual(len(consultas), 1)
+            objetos += [registro['objeto_id'] for registro in datos['results']]
+            url, paginas = datos['next'], paginas + 1
+        self.assertEqual(objetos, [1, 2, 3, 40, 41, 70, 71])
+        self.assertEqual(paginas, 4)
+
+
+@auditoria_sincrona
+class EventosStreamTest(TransactionTestCase):
+    """Al reconectarse al stream SSE se envían los eventos pendientes o un 'resync' si faltan demasiados"""
+    
+    def setUp(self):
+        self.medico = Usuario.objects.create_user(
+            username='medico', password='x', rut='22222222-2', rol='medico', email='medico@hospital.cl'
+        )
+        Notificacion.objects.bulk_create([
+            Notificacion(usuario=self.medico, tipo='sistema', titulo=f'N{numero}', mensaje='-')
+            for numero in range(5)
+        ])
+        self.ids = list(Notificacion.objects.order_by('id').values_list('id', flat=True))
+    
+    def eventos(self, url, cantidad, al_conectar=None):
+        """Los primeros `cantidad` eventos del stream como (evento, datos), ejecutando `al_conectar` tras suscribirse"""
+        import asyncio
+        import json
+        from asgiref.sync import sync_to_async
+        from django.test import AsyncClient
+        
+        async def leer():
+            cliente = AsyncClient()
+            await sync_to_async(cliente.force_login)(self.medico)
+            respuesta = await cliente.get(url)
+            if respuesta.status_code != 200:
+                return respuesta.status_code
+            contenido = respuesta.streaming_content.__aiter__()
+            bloques = [await asyncio.wait_for(contenido.__anext__(), 5)]
+            if al_conectar:
+                await sync_to_async(al_conectar)()
+            bloques += [await asyncio.wait_for(contenido.__anext__(), 5) for _ in range(cantidad)]
+            await contenido.aclose()
+            return bloques[1:]  # el primero es "retry:"
+        
+        bloques = asyncio.run(leer())
+        if isinstance(bloques, int):
+            return bloques
+        eventos = []
+        for bloque in bloques:
+            campos = dict(linea.split(': ', 1) for linea in bloque.decode().strip().split('\n'))
+            eventos.append((campos['event'], json.loads(campos['data'])))
+        return eventos
+    
+    def test_sin_cursor_no_reenvia_el_historial(self):
+        nuevas = []
+        
+        def notificar():
+            nuevas.append(Notificacion.crear_notificacion(self.medico, 'sistema', 'Nueva', '-'))
+        
+        eventos = self.eventos('/api/eventos/', 1, al_conectar=notificar)
+        self.assertEqual([(evento, datos['id']) for evento, datos in eventos], [('notificacion', nuevas[0].id)])
+    
+    def test_notificacion_por_rol_llega_con_el_id_del_usuario(self):
+        from unittest import mock
+        
+        otro = Usuario.objects.create_user(
+            username='otro', password='x', rut='33333333-3', rol='medico', email='otro@hospital.cl'
+        )
+        sin_retorno = mock.patch.object(
+            type(connection.features), 'can_return_rows_from_bulk_insert',
+            new_callable=mock.PropertyMock, return_value=False
+        )
+        
+        def notificar():
+            with sin_retorno:
+                Notificacion.notificar_rol('medico', 'sistema', 'Aviso', 'rol')
+        
+        eventos = self.eventos(f'/api/eventos/?last_notification_id={self.ids[-1]}', 1, al_conectar=notificar)
+        propia = Notificacion.objects.get(usuario=self.medico, mensaje='rol')
+        self.assertEqual([(evento, datos['id']) for evento, datos in eventos], [('notificacion', propia.id)])
+        self.assertTrue(Notificacion.objects.filter(usuario=otro, mensaje='rol').exists())
+    
+    def test_cursor_atrasado_envia_resync(self):
+        from unittest import mock
+        
+        with mock.patch('urgencias.views.SSE_MAX_REPLAY', 2):
+            eventos = self.eventos(f'/api/eventos/?last_notification_id={self.ids[0]}', 3)
+        self.assertEqual(eventos[0], ('resync', {'chat': False, 'notificaciones': True}))
+        self.assertEqual([datos['id'] for _, datos in eventos[1:]], self.ids[-2:])
+        
+        with mock.patch('urgencias.views.SSE_MAX_REPLAY', 10):
+            eventos = self.eventos(f'/api/eventos/?last_notification_id={self.ids[2]}', 2)
+        self.assertEqual([datos['id'] for _, datos in eventos], self.ids[3:])
+    
+    def test_ficha_inexistente(self):
+        self.assertEqual(self.eventos('/api/eventos/?ficha_id=999', 0), 404)
+
+
+@auditoria_sincrona
+class IngestaSignosTest(TestCase):
+    """Carga por lotes de signos vitales: todo o nada y umbrales críticos sobre cada lectura"""
+    
+    def setUp(self):
+        self.paramedico = Usuario.objects.create_user(
+            username='paramedico', password='x', rut='11111111-1', rol='paramedico', email='paramedico@hospital.cl'
+        )
+        self.medico = Usuario.objects.create_user(
+            username='medico', password='x', rut='22222222-2', rol='medico', email='medico@hospital.cl'
+        )
+        self.ficha = crear_fichas(self.paramedico, 1)[0]
+        self.client = APIClient()
+        self.client.force_authenticate(self.paramedico)
+    
+    def lecturas(self, saturaciones):
+        from datetime import timedelta
+        from django.utils import timezone
+        
+        inicio = timezone.now() - timedelta(minutes=10)
+        return [{
+            'presion_sistolica': 120, 'presion_diastolica': 80, 'frecuencia_cardiaca': 80,
+            'frecuencia_respiratoria': 16, 'saturacion_o2': saturacion, 'temperatura': '36.5',
+            'timestamp': (inicio + timedelta(seconds=30 * i)).isoformat(),
+        } for i, saturacion in enumerate(saturaciones)]
+    
+    def test_caida_recuperada_dentro_del_lote_alerta(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            respuesta = self.client.post('/api/signos-vitales/lote/', {
+                'ficha': self.ficha.id, 'lecturas': self.lecturas([97, 82, 84, 95, 97]),
+            }, format='json')
+        self.assertEqual(respuesta.status_code, 201)
+        # La última lectura es normal, pero las del medio cruzan el umbral
+        self.assertEqual(respuesta.json()['alerta_temprana']['alertas'], [])
+        notificacion = Notificacion.objects.get(tipo='signos_criticos', usuario=self.medico)
+        self.assertIn('Hipoxemia severa: SatO2 82%', notificacion.mensaje)
+        self.assertIn('Hipoxemia severa: SatO2 84%', notificacion.mensaje)
+    
+    def test_lote_invalido_no_guarda_ninguna(self):
+        lecturas = self.lecturas([97, 96])
+        lecturas[1]['frecuencia_cardiaca'] = 500
+        respuesta = self.client.post('/api/signos-vitales/lote/', {
+            'ficha': self.ficha.id, 'lecturas': lecturas,
+        }, format='json')
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertIn('frecuencia_cardiaca', str(respuesta.json()))
+        self.assertFalse(SignosVitales.objects.filter(ficha=self.ficha).exists())
+        self.assertFalse(Notificacion.objects.exists())
+
+
+@auditoria_sincrona
+class AlertaTempranaTest(TestCase):
+    """NEWS2/qSOFA en los bordes de cada tramo, reglas de tendencia y recálculo en lote"""
+    
+    def serie(self, *filas):
+        """Arreglos como los de alerta_temprana._cargar a partir de (ficha, minuto, {columna: valor})"""
+        import numpy as np
+        from datetime import datetime, timedelta, timezone as tz
+        from . import alerta_temprana
+        
+        normales = {'frecuencia_respiratoria': 16, 'saturacion_o2': 98, 'presion_sistolica': 120,
+                    'presion_diastolica': 80, 'frecuencia_cardiaca': 80, 'temperatura': 37, 'escala_glasgow': 15}
+        inicio = datetime(2025, 1, 1, tzinfo=tz.utc)
+        fichas = np.array([ficha for ficha, _, _ in filas], dtype=np.int64)
+        segundos = np.array([minuto * 60.0 for _, minuto, _ in filas])
+        valores = np.array([[{**normales, **cambios}[columna] for columna in alerta_temprana.COLUMNAS]
+                            for _, _, cambios in filas], dtype=np.float64)
+        fechas = [inicio + timedelta(minutes=minuto) for _, minuto, _ in filas]
+        return fichas, segundos, valores, fechas
+    
+    def test_bordes_news2_y_qsofa(self):
+        from . import alerta_temprana
+        
+        # (columna, valor en el borde superior del tramo, puntos; el valor siguiente cae en el tramo vecino)
+        casos = [
+            ('frecuencia_respiratoria', 8, 3), ('frecuencia_respiratoria', 9, 1),
+            ('frecuencia_respiratoria', 20, 0), ('frecuencia_respiratoria', 21, 2),
+            ('frecuencia_respiratoria', 25, 3), ('saturacion_o2', 91, 3), ('saturacion_o2', 96, 0),
+            ('presion_sistolica', 90, 3), ('presion_sistolica', 219, 0), ('presion_sistolica', 220, 3),
+            ('frecuencia_cardiaca', 40, 3), ('frecuencia_cardiaca', 91, 1), ('frecuencia_cardiaca', 131, 3),
+            ('temperatura', 35.0, 3), ('temperatura', 38.1, 1), ('temperatura', 39.1, 2),
+        ]
+        _, _, valores, _ = self.serie(*[(1, i, {columna: valor}) for i, (columna, valor, _) in enumerate(casos)])
+        componentes, total, qsofa = alerta_temprana.puntuar(valores)
+        for i, (columna, valor, puntos) in enumerate(casos):
+            self.assertEqual(componentes[columna][i], puntos, f'{columna}={valor}')
+        
+        _, _, valores, _ = self.serie(
+            (1, 0, {'frecuencia_respiratoria': 21, 'presion_sistolica': 101}),
+            (1, 1, {'frecuencia_respiratoria': 22, 'presion_sistolica': 100}),
+            (1, 2, {'frecuencia_respiratoria': 22, 'presion_sistolica': 100, 'escala_glasgow': 14}),
+            (1, 3, {'escala_glasgow': float('nan')}),
+        )
+        componentes, total, qsofa = alerta_temprana.puntuar(valores)
+        self.assertEqual(qsofa.tolist(), [0, 2, 3, 0])
+        # Glasgow sin registrar cuenta como alerta
+        self.assertEqual(componentes['conciencia'].tolist(), [0, 0, 3, 0])
+    
+    def test_tendencias_dentro_de_la_ventana(self):
+        from . import alerta_temprana
+        
+        resultados = alerta_temprana.evaluar(*self.serie(
+            # Ficha 1: SatO2 cae 4 puntos en 10 minutos
+            (1, 0, {'saturacion_o2': 98}), (1, 10, {'saturacion_o2': 94}),
+            # Ficha 2: la misma caída, pero el máximo quedó fuera de la ventana de 15 minutos
+            (2, 0, {'saturacion_o2': 98}), (2, 16, {'saturacion_o2': 96}), (2, 20, {'saturacion_o2': 94}),
+            # Ficha 3: FC sube 30 lpm en 30 minutos
+            (3, 0, {'frecuencia_cardiaca': 80}), (3, 30, {'frecuencia_cardiaca': 110}),
+        ))
+        self.assertIn('SatO2 bajando 4 puntos en 15 min', resultados[1]['alertas'])
+        self.assertEqual(resultados[2]['alertas'], [])
+        self.assertIn('FC subiendo 30 lpm en 30 min', resultados[3]['alertas'])
+        self.assertEqual(resultados[3]['pendientes_por_hora']['frecuencia_cardiaca'], 60.0)
+    
+    def test_recalculo_en_lote_coincide_con_el_incremental(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from .alerta_temprana import evaluar_ficha
+        
+        paramedico = Usuario.objects.create_user(
+            username='paramedico', password='x', rut='11111111-1', rol='paramedico', email='paramedico@hospital.cl'
+        )
+        fichas = crear_fichas(paramedico, 3)
+        inicio = timezone.now() - timedelta(hours=2)
+        for n, ficha in enumerate(fichas):
+            for minuto, saturacion in enumerate([98, 97, 93 - n]):
+                SignosVitales.objects.create(
+                    ficha=ficha, presion_sistolica=120, presion_diastolica=80, frecuencia_cardiaca=80 + 10 * n,
+                    frecuencia_respiratoria=16, saturacion_o2=saturacion, temperatura=37,
+                    timestamp=inicio + timedelta(minutes=5 * minuto + 50 * n),
+                )
+        FichaEmergencia.objects.filter(id__in=[ficha.id for ficha in fichas]).update(alerta_signos=None)
+        
+        SignosVitales.recalcular_fichas([ficha.id for ficha in fichas])
+        for ficha in fichas:
+            ficha.refresh_from_db()
+            ultima = ficha.signos_vitales.latest('timestamp')
+            esperado = evaluar_ficha(ficha.id, hasta=ultima.timestamp)
+            # alerta_signos es JSON: la fecha queda como texto
+            self.assertEqual(ficha.alerta_signos.pop('timestamp')[:19], esperado.pop('timestamp').isoformat()[:19])
+            self.assertEqual(ficha.alerta_signos, esperado)
+            self.assertTrue(any('SatO2 bajando' in alerta for alerta in esperado['alertas']))
+
+
+@auditoria_sincrona
+class LotePDFStreamTest(TestCase):
+    """El ZIP de documentos se entrega por trozos también bajo ASGI y sin cortarse por un documento fallido"""
+    
+    def test_en_async_entrega_cada_trozo_al_producirse(self):
+        import asyncio
+        import io
+        import zipfile
+        from .pdf import en_async, zip_en_stream
+        
+        producidos = []
+        
+        def archivos():
+            for i in range(3):
+                producidos.append(i)
+                yield f'doc_{i}.pdf', b'%PDF-' + bytes([i]) * 100
+        
+        async def consumir():
+            trozos = []
+            async for trozo in en_async(zip_en_stream(archivos())):
+                # Cada trozo llega antes de generar el archivo siguiente
+                trozos.append((trozo, len(producidos)))
+            return trozos
+        
+        trozos = asyncio.run(consumir())
+        self.assertEqual([producido for _, producido in trozos[:3]], [1, 2, 3])
+        with zipfile.ZipFile(io.BytesIO(b''.join(trozo for trozo, _ in trozos))) as archivo_zip:
+            self.assertEqual(archivo_zip.namelist(), ['doc_0.pdf', 'doc_1.pdf', 'doc_2.pdf'])
+    
+    def test_documento_fallido_no_corta_el_lote(self):
+        import io
+        import tempfile
+        import zipfile
+        from concurrent.futures import Future
+        from concurrent.futures.process import BrokenProcessPool
+        from unittest import mock
+        from .pdf import generar_lote, zip_en_stream
+        
+        listo, caido, colgado = Future(), Future(), Future()
+        listo.set_result((b'%PDF-listo', 0.0))
+        caido.set_exception(BrokenProcessPool())
+        pool = mock.Mock()
+        pool.submit.side_effect = [listo, caido, colgado]
+        
+        documentos = [(f'{nombre}.pdf', 'pdf/receta_medica.html', {}, f'{numero:02d}' * 32)
+                      for numero, nombre in enumerate(['listo', 'caido', 'colgado'])]
+        with tempfile.TemporaryDirectory() as directorio, \
+                override_settings(PDF_CACHE_DIR=directorio, PDF_WORKERS=2, PDF_RENDER_TIMEOUT=0.01), \
+                mock.patch('urgencias.pdf._get_pool', return_value=pool), \
+                mock.patch('urgencias.pdf._html', return_value='<html></html>'), \
+                mock.patch('urgencias.pdf._renderizar', return_value=(b'%PDF-local', 0.0)) as renderizar:
+            contenido = b''.join(zip_en_stream(generar_lote(documentos)))
+        
+        # El pool caído se renderiza en el proceso; el que no termina queda en errores.txt
+        renderizar.assert_called_once_with('<html></html>', 'pdf/receta_medica.html')
+        with zipfile.ZipFile(io.BytesIO(contenido)) as archivo_zip:
+            self.assertEqual(archivo_zip.namelist(), ['listo.pdf', 'caido.pdf', 'errores.txt'])
+            self.assertEqual(archivo_zip.read('caido.pdf'), b'%PDF-local')
+            self.assertIn('colgado.pdf', archivo_zip.read('errores.txt').decode())
+
+
+@auditoria_sincrona
+class DocumentosPDFCacheTest(TestCase):
+    """La caché de PDF se consulta por la versión de los datos, sin renderizar la plantilla"""
+    
+    def setUp(self):
+        import tempfile
+        from unittest import mock
+        from .models import Diagnostico
+        
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        ajustes = override_settings(PDF_CACHE_DIR=directorio.name, PDF_WORKERS=0)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        
+        # WeasyPrint no participa: solo interesa cuándo se renderiza
+        self.renderizar = mock.patch('urgencias.pdf._renderizar', return_value=(b'%PDF-1.7', 0.0)).start()
+        self.addCleanup(mock.patch.stopall)
+        
+        self.medico = Usuario.objects.create_user(
+            username='medico', password='x', rut='22222222-2', rol='medico', email='medico@hospital.cl'
+        )
+        self.ficha = crear_fichas(self.medico, 1)[0]
+        self.diagnostico = Diagnostico.objects.create(
+            ficha=self.ficha, medico=self.medico, diagnostico_cie10='J18.9', descripcion='Neumonía',
+            indicaciones_medicas='Reposo', medicamentos_prescritos='Amoxicilina'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.medico)
+    
+    def test_descarga_repetida_no_renderiza(self):
+        from unittest import mock
+        
+        url = f'/api/documentos/receta/{self.ficha.id}/'
+        primera = self.client.get(url)
+        self.assertEqual(primera.status_code, 200)
+        self.assertEqual(self.renderizar.call_count, 1)
+        
+        with mock.patch('urgencias.pdf.render_to_string') as render_to_string:
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=primera['ETag']).status_code, 304)
+            repetida = self.client.get(url)
+        self.assertEqual(repetida.content, b'%PDF-1.7')
+        self.assertEqual(repetida['ETag'], primera['ETag'])
+        render_to_string.assert_not_called()
+        self.assertEqual(self.renderizar.call_count, 1)
+        
+        # El diagnóstico no tiene fecha de modificación: igual cambia la versión
+        self.diagnostico.indicaciones_medicas = 'Reposo y control en 48 horas'
+        self.diagnostico.save()
+        nueva = self.client.get(url, HTTP_IF_NONE_MATCH=primera['ETag'])
+        self.assertEqual(nueva.status_code, 200)
+        self.assertNotEqual(nueva['ETag'], primera['ETag'])
+        self.assertEqual(self.renderizar.call_count, 2)
+    
+    def test_timeout_de_renderizado_responde_503(self):
+        from unittest import mock
+        from .models import AuditLog
+        
+        with mock.patch('urgencias.pdf.renderizar_pdf', side_effect=TimeoutError):
+            respuesta = self.client.get(f'/api/documentos/ficha/{self.ficha.id}/')
+        self.assertEqual(respuesta.status_code, 503)
+        self.assertIn('intente nuevamente', respuesta.json()['error'])
+        self.assertFalse(AuditLog.objects.filter(accion='generar_pdf').exists())
+    
+    def test_limpiar_cache_elimina_solo_los_antiguos(self):
+        import os
+        import time
+        from io import StringIO
+        from pathlib import Path
+        from django.conf import settings
+        from django.core.management import call_command
+        
+        self.client.get(f'/api/documentos/receta/{self.ficha.id}/')
+        self.client.get(f'/api/documentos/ficha/{self.ficha.id}/')
+        antiguo, reciente = sorted(Path(settings.PDF_CACHE_DIR).glob('*/*.pdf'))
+        hace_40_dias = time.time() - 40 * 86400
+        os.utime(antiguo, (hace_40_dias, hace_40_dias))
+        
+        call_command('limpiar_cache_pdf', dias=30, stdout=StringIO())
+        self.assertEqual(sorted(Path(settings.PDF_CACHE_DIR).glob('*/*.pdf')), [reciente])
+        if antiguo.parent != reciente.parent:
+            self.assertFalse(antiguo.parent.exists())
+
+
+@auditoria_sincrona
+class SerieSignosTest(TestCase):
+    """Reducción de la serie de signos vitales: tramos minmax y selección LTTB"""
+    
+    def test_minmax_por_tramos_de_igual_duracion(self):
+        import numpy as np
+        from .serie_signos import SERIES, minmax
+        
+        segundos = np.arange(100, dtype=np.float64) * 60
+        series = {nombre: np.full(100, np.nan) for nombre in SERIES}
+        series['fc'] = np.arange(100, dtype=np.float64)
+        # Glasgow solo en el primer tramo: los demás quedan sin dato
+        series['glasgow'][:10] = 15
+        
+        resultado = minmax(segundos, series, 10)
+        self.assertEqual(resultado['fc']['min'], list(range(0, 100, 10)))
+        self.assertEqual(resultado['fc']['max'], list(range(9, 100, 10)))
+        self.assertEqual(resultado['fc']['avg'], [4.5 + 10 * i for i in range(10)])
+        self.assertEqual(resultado['timestamps'][0], 270000)
+        self.assertEqual(resultado['glasgow']['max'], [15] + [None] * 9)
+    
+    def test_lttb_conserva_extremos_y_picos(self):
+        import numpy as np
+        from .serie_signos import lttb
+        
+        x = np.arange(1000, dtype=np.float64)
+        y = np.full(1000, 80.0)
+        y[437] = 160
+        
+        elegidos = lttb(x, y, 20).tolist()
+        self.assertEqual(len(elegidos), 20)
+        self.assertEqual((elegidos[0], elegidos[-1]), (0, 999))
+        self.assertEqual(elegidos, sorted(set(elegidos)))
+        self.assertIn(437, elegidos)
+        # Sin tramos intermedios solo quedan la primera y la última lectura
+        self.assertEqual(lttb(x, y, 2).tolist(), [0, 999])
+        self.assertEqual(lttb(x[:5], y[:5], 20).tolist(), [0, 1, 2, 3, 4])
+    
+    def test_api_respeta_los_puntos_pedidos(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        
+        medico = Usuario.objects.create_user(
+            username='medico', password='x', rut='22222222-2', rol='medico', email='medico@hospital.cl'
+        )
+        ficha = crear_fichas(medico, 1)[0]
+        inicio = timezone.now() - timedelta(hours=5)
+        SignosVitales.objects.bulk_create([
+            SignosVitales(
+                ficha=ficha, presion_sistolica=120, presion_diastolica=80, frecuencia_cardiaca=70 + i % 7,
+                frecuencia_respiratoria=16, saturacion_o2=98, temperatura=37, timestamp=inicio + timedelta(minutes=i)
+            ) for i in range(300)
+        ])
+        client = APIClient()
+        client.force_authenticate(medico)
+        
+        for metodo in ('lttb', 'minmax'):
+            for puntos in (2, 50):
+                datos = client.get('/api/signos-vitales/serie/', {
+                    'ficha': ficha.id, 'metodo': metodo, 'puntos': puntos,
+                }).json()
+                self.assertEqual((datos['lecturas'], datos['puntos']), (300, puntos), metodo)
+        self.assertEqual(client.get('/api/signos-vitales/serie/', {'ficha': ficha.id, 'puntos': 1}).status_code, 400)
+
+
+@auditoria_sincrona
+class BusquedaPacientesTest(TestCase):
+    """Búsqueda por palabras normalizadas: todas deben coincidir y las completas van primero"""
+    
+    def setUp(self):
+        self.crear = lambda **campos: Paciente.objects.create(sexo='Femenino', **campos)
+    
+    def buscar(self, q):
+        from .busqueda_pacientes import buscar
+        return [paciente.id for paciente in buscar(q)]
+    
+    def test_normalizacion_de_nombres_y_rut(self):
+        from .busqueda_pacientes import palabras_busqueda
+        
+        paciente = self.crear(nombres='José Ángel', apellidos='Pérez-Soto', rut='12.345.678-5')
+        self.assertEqual(palabras_busqueda('  PÉREZ-soto, José '), ['perez', 'soto', 'jose'])
+        for q in ('jose perez', 'ANGEL SOTO', 'pérez-sot', '12345678-5', '12.345.678', '123456'):
+            self.assertEqual(self.buscar(q), [paciente.id], q)
+        self.assertEqual(self.buscar('jose gonzalez'), [])
+    
+    def test_palabra_completa_antes_que_prefijo_y_luego_recientes(self):
+        antigua = self.crear(nombres='Ana', apellidos='Rojas')
+        prefijo = self.crear(nombres='Anabel', apellidos='Rojas')
+        reciente = self.crear(nombres='Ana', apellidos='Rojas')
+        otra = self.crear(nombres='Ana', apellidos='Muñoz')
+        
+        self.assertEqual(self.buscar('ana rojas'), [reciente.id, antigua.id, prefijo.id])
+        self.assertEqual(self.buscar('ana'), [otra.id, reciente.id, antigua.id, prefijo.id])
+    
+    def test_candidatos_limitados_por_la_palabra_mas_larga(self):
+        from unittest import mock
+        
+        ids = [self.crear(nombres='Camila', apellidos=f'Fuentes{i}').id for i in range(5)]
+        exacta = self.crear(nombres='Camila', apellidos='Fuentes').id
+        with mock.patch('urgencias.busqueda_pacientes.MAX_CANDIDATOS', 3):
+            # La coincidencia completa entra aunque haya más pacientes con el prefijo
+            self.assertEqual(self.buscar('camila fuentes'), [exacta, ids[4], ids[3]])
+
+
+@auditoria_sincrona
+class TableroTest(TestCase):
+    """Versiones del tablero: cambios incrementales, huecos en la caché y su aplicación"""
+    
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.addCleanup(cache.clear)
+    
+    def guardar_cambios(self, *cambios):
+        from django.core.cache import cache
+        from .tablero import _clave_cambio
+        cache.set_many({_clave_cambio(cambio['version']): cambio for cambio in cambios})
+    
+    def test_aplicar_cambios_mueve_quita_y_es_idempotente(self):
+        from .tablero import aplicar_cambios
+        
+        estados = {'en_ruta': [{'id': 3}, {'id': 1}], 'en_hospital': [{'id': 2}], 'uci': []}
+        cambios = [
+            {'version': 11, 'ficha_id': 1, 'estado': 'en_hospital', 'ficha': {'id': 1, 'estado': 'en_hospital'}},
+            {'version': 12, 'ficha_id': 2, 'estado': None, 'ficha': None},
+            {'version': 13, 'ficha_id': 1, 'estado': 'uci', 'ficha': {'id': 1, 'estado': 'uci'}},
+            {'version': 14, 'ficha_id': 4, 'estado': 'en_ruta', 'ficha': {'id': 4}},
+        ]
+        esperado = {'en_ruta': [{'id': 4}, {'id': 3}], 'en_hospital': [], 'uci': [{'id': 1, 'estado': 'uci'}]}
+        self.assertEqual(aplicar_cambios(estados, cambios), esperado)
+        self.assertEqual(aplicar_cambios(estados, cambios), esperado)
+    
+    def test_cambios_desde_con_huecos(self):
+        from .tablero import cambios_desde
+        
+        self.guardar_cambios(*[
+            {'version': version, 'ficha_id': version, 'estado': 'en_ruta', 'ficha': {'id': version}}
+            for version in (101, 102, 104)
+        ])
+        self.assertEqual([cambio['version'] for cambio in cambios_desde(100, 104)], [101, 102])
+        self.assertEqual(cambios_desde(104, 104), [])
+        # Falta el primer cambio pendiente: el cliente debe pedir la foto completa
+        self.assertIsNone(cambios_desde(102, 104))
+        self.assertIsNone(cambios_desde(105, 104))
+        with override_settings(TABLERO_MAX_CAMBIOS=2):
+            self.assertIsNone(cambios_desde(100, 104))
+    
+    def test_cliente_al_dia_con_cambios_o_foto(self):
+        from django.core.cache import cache
+        from .tablero import _clave_cambio, obtener, registrar_cambio
+        
+        paramedico = Usuario.objects.create_user(
+            username='paramedico', password='x', rut='11111111-1', rol='paramedico', email='paramedico@hospital.cl'
+        )
+        primera, segunda = crear_fichas(paramedico, 2, estado='en_ruta')
+        inicial = obtener()
+        self.assertEqual([ficha['id'] for ficha in inicial['estados']['en_ruta']], [segunda.id, primera.id])
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            FichaEmergencia.objects.filter(id=primera.id).update(estado='en_hospital')
+            registrar_cambio(primera.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            FichaEmergencia.objects.filter(id=segunda.id).update(estado='dado_de_alta')
+            registrar_cambio(segunda.id)
+        
+        respuesta = obtener(inicial['version'])
+        self.assertFalse(respuesta['completo'])
+        self.assertEqual(
+            [(cambio['ficha_id'], cambio['estado']) for cambio in respuesta['cambios']],
+            [(primera.id, 'en_hospital'), (segunda.id, None)]
+        )
+        self.assertEqual(respuesta['version'], inicial['version'] + 2)
+        completo = obtener()
+        self.assertEqual(completo['version'], respuesta['version'])
+        self.assertEqual(completo['estados']['en_ruta'], [])
+        self.assertEqual([ficha['id'] for ficha in completo['estados']['en_hospital']], [primera.id])
+        
+        cache.delete(_clave_cambio(inicial['version'] + 1))
+        self.assertTrue(obtener(inicial['version'])['completo'])
+
+
+@auditoria_sincrona
+class DuplicadosNNTest(TestCase):
+    """Candidatos NN para un paciente recién identificado y fusión de sus fichas"""
+    
+    def setUp(self):
+        from datetime import date
+        
+        self.paramedico = Usuario.objects.create_user(
+            username='paramedico', password='x', rut='11111111-1', rol='paramedico', email='paramedico@hospital.cl'
+        )
+        hoy = date.today()
+        self.nacimiento = hoy.replace(year=hoy.year - 40, day=min(hoy.day, 28))
+    
+    def crear_nn(self, numero, **campos):
+        return Paciente.objects.create(
+            nombres='Paciente', apellidos='NN', es_nn=True, id_temporal=f'NN-{numero}', **campos
+        )
+    
+    def test_similitud_difusa_de_nombres(self):
+        from .duplicados_nn import similitud_nombre
+        
+        self.assertEqual(similitud_nombre(['juan', 'perez'], ['juan', 'perez', 'moreno']), 1.0)
+        # 'peres' sigue siendo parecido a 'perez'; 'gonzalez' no aporta
+        self.assertAlmostEqual(similitud_nombre(['juan', 'perez'], ['juan', 'peres']), 0.9)
+        self.assertEqual(similitud_nombre(['juan', 'gonzalez'], ['pedro', 'perez']), 0.0)
+        self.assertEqual(similitud_nombre([], ['juan']), 0.0)
+    
+    def test_candidatos_ordenados_por_puntaje_dentro_del_bloqueo(self):
+        from .duplicados_nn import candidatos
+        
+        parecido = self.crear_nn(1, sexo='Masculino', edad_aproximada=40, caracteristicas='Dice llamarse Juan Peres')
+        sin_nombre = self.crear_nn(2, sexo='Masculino', edad_aproximada=42, caracteristicas='Tatuaje en el brazo')
+        sin_edad = self.crear_nn(3, sexo='Masculino', caracteristicas='Juan, cicatriz en la frente')
+        self.crear_nn(4, sexo='Femenino', edad_aproximada=40, caracteristicas='Dice llamarse Juan Perez')
+        self.crear_nn(5, sexo='Masculino', edad_aproximada=70, caracteristicas='Dice llamarse Juan Perez')
+        
+        resultados = candidatos(nombres='Juan', apellidos='Pérez', fecha_nacimiento=self.nacimiento, sexo='Masculino')
+        self.assertEqual([resultado['paciente'].id for resultado in resultados], [parecido.id, sin_edad.id, sin_nombre.id])
+        self.assertEqual(resultados[0]['diferencia_edad'], 0)
+        self.assertIsNone(resultados[1]['diferencia_edad'])
+        self.assertGreater(resultados[0]['similitud_nombre'], 0.75)
+        
+        # El RUT anotado en el NN es coincidencia segura aunque no se parezca el nombre
+        anotado = self.crear_nn(6, sexo='Masculino', rut='12.345.678-5')
+        resultado = candidatos(nombres='Pedro', sexo='Masculino', rut_numero=12345678)[0]
+        self.assertEqual((resultado['paciente'].id, resultado['puntaje']), (anotado.id, 1.0))
+    
+    def test_fusionar_traspasa_fichas_y_elimina_los_nn(self):
+        from .duplicados_nn import fusionar
+        from .models import AuditLog, PacienteToken
+        
+        identificado = Paciente.objects.create(
+            nombres='Juan', apellidos='Pérez', sexo='Masculino', rut='12.345.678-5', fecha_nacimiento=self.nacimiento
+        )
+        nn = [self.crear_nn(numero, sexo='Masculino') for numero in (1, 2)]
+        fichas = crear_fichas(self.paramedico, 3)
+        FichaEmergencia.objects.filter(id__in=[fichas[0].id, fichas[1].id]).update(paciente=nn[0])
+        FichaEmergencia.objects.filter(id=fichas[2].id).update(paciente=nn[1])
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            resultado = fusionar(identificado, [nn[1].id, nn[0].id, nn[0].id], usuario=self.paramedico)
+        self.assertEqual(resultado['fusionados'], [nn[0].id, nn[1].id])
+        self.assertEqual(sorted(resultado['fichas']), [ficha.id for ficha in fichas])
+        self.assertEqual(FichaEmergencia.objects.filter(paciente=identificado).count(), 3)
+        self.assertFalse(Paciente.objects.filter(es_nn=True).exists())
+        self.assertFalse(PacienteToken.objects.filter(paciente_id__in=[paciente.id for paciente in nn]).exists())
+        registro = AuditLog.objects.get(modelo='Paciente', objeto_id=identificado.id)
+        self.assertEqual([dato['id_temporal'] for dato in registro.detalles['fusion_nn']], ['NN-1', 'NN-2'])
+        
+        otro = Paciente.objects.create(nombres='Pedro', apellidos='Soto', sexo='Masculino')
+        with self.assertRaises(ValueError):
+            fusionar(identificado, [otro.id])
+        with self.assertRaises(ValueError):
+            fusionar(identificado, [identificado.id])
+        self.assertTrue(Paciente.objects.filter(id=otro.id).exists())
+
+
+@auditoria_sincrona
+class NotificacionesPorRolTest(TestCase):
+    """Las notificaciones masivas se publican con un solo evento por rol, sin ids ni otros destinatarios"""
+    
+    def test_un_evento_por_rol_sin_retorno_de_bulk_insert(self):
+        from unittest import mock
+        
+        for numero, (rut, rol) in enumerate([('22222222-2', 'medico'), ('33333333-3', 'medico'), ('44444444-4', 'enfermera')]):
+            Usuario.objects.create_user(
+                username=f'usuario{numero}', password='x', rut=rut, rol=rol, email=f'usuario{numero}@hospital.cl'
+            )
+        
+        # Como en MySQL: el INSERT múltiple no retorna los ids
+        sin_retorno = mock.patch.object(
+            type(connection.features), 'can_return_rows_from_bulk_insert',
+            new_callable=mock.PropertyMock, return_value=False
+        )
+        with sin_retorno, mock.patch('urgencias.eventos.publicar') as publicar:
+            Notificacion.notificar_roles(['medico', 'enfermera'], 'sistema', 'Aviso', 'nuevo')
+        
+        self.assertEqual(Notificacion.objects.filter(mensaje='nuevo').count(), 3)
+        eventos = dict(publicar.call_args.args[0])
+        self.assertEqual(sorted(eventos), ['rol_enfermera', 'rol_medico'])
+        for evento in eventos.values():
+            self.assertEqual(set(evento), {'type', 'notificacion'})
+            self.assertEqual(evento['type'], 'notificacion_rol')
+            self.assertIsNone(evento['notificacion']['id'])
+            self.assertEqual(evento['notificacion']['mensaje'], 'nuevo')
+
+
+@auditoria_sincrona
+class ContadorNoLeidasTest(TestCase):
+    """El contador de no leídas en caché no se desfasa con eliminaciones en cascada ni entre procesos"""
+    
+    def setUp(self):
+        self.medico = Usuario.objects.create_user(
+            username='medico', password='x', rut='22222222-2', rol='medico', email='medico@hospital.cl'
+        )
+    
+    def test_eliminacion_en_cascada_descarta_el_contador(self):
+        import tempfile
+        
+        ficha, = crear_fichas(self.medico, 1)
+        with tempfile.TemporaryDirectory() as directorio, override_settings(CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directorio}
+        }):
+            with self.captureOnCommitCallbacks(execute=True):
+                Notificacion.crear_notificacion(self.medico, 'sistema', 'Aviso', '-', ficha=ficha)
+                Notificacion.crear_notificacion(self.medico, 'sistema', 'Aviso', '-')
+            self.assertEqual(Notificacion.conteo_no_leidas(self.medico.id), 2)
+            
+            with self.captureOnCommitCallbacks(execute=True):
+                ficha.delete()
+            self.assertEqual(Notificacion.conteo_no_leidas(self.medico.id), 1)
+            
+            with self.captureOnCommitCallbacks(execute=True):
+                Notificacion.objects.filter(usuario=self.medico).delete()
+            self.assertEqual(Notificacion.conteo_no_leidas(self.medico.id), 0)
+    
+    def test_sin_cache_compartida_se_cuenta_en_la_bd(self):
+        Notificacion.conteo_no_leidas(self.medico.id)
+        Notificacion.objects.create(usuario=self.medico, tipo='sistema', titulo='Aviso', mensaje='-')
+        self.assertEqual(Notificacion.conteo_no_leidas(self.medico.id), 1)
+
+
+@auditoria_sincrona
+class AuditWriterTest(TransactionTestCase):
+    """
+    Un lote de auditoría que falla se reintenta y luego se guarda registro por registro.
+    Sin la transacción de TestCase: el hilo escritor cierra conexiones entre intentos.
+    """
+    
+    def test_registro_invalido_no_descarta_el_lote(self):
+        from unittest import mock
+        from .auditoria import AuditWriter
+        from .models import AuditDailyRollup, AuditLog
+        
+        lote = [AuditLog(accion='crear', modelo='Paciente', objeto_id=numero) for numero in range(5)]
+        lote[2].objeto_id = 'no es un número'
+        with mock.patch('urgencias.auditoria.ESPERA_REINTENTO', 0):
+            AuditWriter()._guardar(lote)
+        self.assertEqual(sorted(AuditLog.objects.values_list('objeto_id', flat=True)), [0, 1, 3, 4])
+        self.assertEqual(AuditDailyRollup.objects.get().total, 4)
+
+
+@auditoria_sincrona
+class ResumenAuditoriaTest(TestCase):
+    """Resumen diario de auditoría: una fila por clave aun sin usuario, y reconstrucción sin perder días archivados"""
+    
+    def setUp(self):
+        import tempfile
+        
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        ajustes = override_settings(AUDIT_LOG_ARCHIVE_DIR=directorio.name)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+    
+    def test_acciones_sin_usuario_comparten_fila(self):
+        from django.db import IntegrityError, transaction
+        from django.utils import timezone
+        from .models import AuditDailyRollup, AuditLog
+        
+        AuditDailyRollup.acumular([AuditLog(accion='crear', modelo='Paciente')])
+        AuditDailyRollup.acumular([AuditLog(accion='crear', modelo='Paciente')] * 2)
+        self.assertEqual(AuditDailyRollup.objects.get().total, 3)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            AuditDailyRollup.objects.create(fecha=timezone.localdate(), accion='crear', modelo='Paciente')
+    
+    def test_reconstruir_conserva_el_resumen_de_dias_archivados(self):
+        from datetime import timedelta
+        from io import StringIO
+        from django.core.management import call_command
+        from django.utils import timezone
+        from .models import AuditDailyRollup, AuditLog
+        
+        hoy = timezone.localdate()
+        # Día cuyos logs ya se archivaron: solo queda su resumen
+        AuditDailyRollup.objects.create(fecha=hoy - timedelta(days=10), accion='crear', modelo='Paciente', total=7)
+        AuditLog.objects.create(accion='crear', modelo='Paciente')
+        
+        salida = StringIO()
+        call_command('reconstruir_resumen_auditoria', desde=str(hoy - timedelta(days=30)), stdout=salida)
+        self.assertIn('archivados', salida.getvalue())
+        self.assertEqual(
+            dict(AuditDailyRollup.objects.values_list('fecha', 'total')),
+            {hoy - timedelta(days=10): 7, hoy: 1}
+        )
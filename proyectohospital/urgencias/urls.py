@@ -29,5 +29,6 @@ urlpatterns = [
     path('logout/', views.logout_view, name='logout'),
     path('current-user/', views.current_user, name='current-user'),
     path('poll/', views.poll_updates, name='poll-updates'),
+    path('eventos/', views.eventos_stream, name='eventos-stream'),
     path('', include(router.urls)),
 ]
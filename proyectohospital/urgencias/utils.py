@@ -1,7 +1,6 @@
 """
 Utilidades compartidas para el proyecto Hospital
 """
-from .models import AuditLog
 
 
 def get_client_ip(request):
@@ -14,22 +13,31 @@ def get_client_ip(request):
     return ip
 
 
-def log_audit(request, accion: str, modelo: str, objeto_id: int = None, detalles: dict = None):
+def log_audit(request, accion: str, modelo: str, objeto_id: int = None, detalles: dict = None, usuario=None):
     """
     Helper para crear registros de auditoría de forma consistente.
     
+    Los registros se escriben en lotes en segundo plano (ver auditoria.py),
+    salvo con AUDIT_LOG_ASYNC = False.
+    
     Args:
         request: Request de Django
         accion: Tipo de acción (crear, modificar, eliminar, ver, etc.)
         modelo: Nombre del modelo afectado
         objeto_id: ID del objeto afectado (opcional)
         detalles: Diccionario con detalles adicionales (opcional)
+        usuario: Usuario que realiza la acción (por defecto request.user)
     
     Returns:
-        AuditLog: El registro de auditoría creado
+        AuditLog: El registro de auditoría (sin id mientras está en cola)
     """
-    return AuditLog.objects.create(
-        usuario=request.user if request.user.is_authenticated else None,
+    from .auditoria import registrar
+    
+    if usuario is None and request.user.is_authenticated:
+        usuario = request.user
+    
+    return registrar(
+        usuario=usuario,
         accion=accion,
         modelo=modelo,
         objeto_id=objeto_id,
@@ -59,6 +67,89 @@ def obtener_nombre_paciente(ficha) -> str:
     return f"{paciente.nombres} {paciente.apellidos}".strip() or "Sin nombre"
 
 
+def normalizar_rut(valor):
+    """
+    Separa un RUT escrito en cualquier formato en cuerpo y dígito verificador.
+
+    Acepta '12.345.678-5', '12345678-5', '123456785' y 'k' minúscula.
+
+    Returns:
+        tuple: (cuerpo: int, dígito verificador: str) o None si no tiene forma de RUT
+    """
+    import re
+
+    limpio = re.sub(r'[.\s-]', '', valor or '').upper()
+    if not re.fullmatch(r'\d{1,8}[\dK]', limpio):
+        return None
+    return int(limpio[:-1]), limpio[-1]
+
+
+def digito_verificador(numero: int) -> str:
+    """Dígito verificador de un cuerpo de RUT (módulo 11)"""
+    suma, factor = 0, 2
+    while numero:
+        suma += (numero % 10) * factor
+        numero //= 10
+        factor = factor + 1 if factor < 7 else 2
+    resto = 11 - suma % 11
+    return {11: '0', 10: 'K'}.get(resto, str(resto))
+
+
+def rut_valido(valor) -> bool:
+    """True si el RUT tiene forma válida y su dígito verificador es correcto"""
+    partes = normalizar_rut(valor)
+    return partes is not None and digito_verificador(partes[0]) == partes[1]
+
+
+def formatear_rut(numero: int, dv: str) -> str:
+    """Formato con el que se guarda y muestra el RUT: '12.345.678-5'"""
+    return f"{numero:,}".replace(',', '.') + f"-{dv}"
+
+
+def asignar_rut(instancia, update_fields=None):
+    """
+    Completa rut_numero y rut_dv desde instancia.rut y deja rut en formato
+    canónico. Se llama en save() de Usuario y Paciente.
+
+    Si otro registro ya tiene ese RUT (duplicados anteriores a la
+    normalización, escritos en otro formato) el RUT se deja tal cual y sin
+    rut_numero: normalizarlo chocaría con las restricciones únicas.
+
+    Returns:
+        update_fields con los campos de RUT agregados si se estaba guardando rut
+    """
+    partes = normalizar_rut(instancia.rut)
+    if partes and partes[0] != instancia.rut_numero:
+        # Solo se consulta cuando el RUT cambia o aún no estaba normalizado
+        otros = type(instancia)._default_manager.filter(rut_numero=partes[0]).exclude(pk=instancia.pk)
+        if otros.exists():
+            partes = None
+    if partes:
+        instancia.rut_numero, instancia.rut_dv = partes
+        instancia.rut = formatear_rut(*partes)
+    else:
+        instancia.rut_numero, instancia.rut_dv = None, ''
+
+    if update_fields is not None and 'rut' in update_fields:
+        return {*update_fields, 'rut_numero', 'rut_dv'}
+    return update_fields
+
+
+def filtro_rut(valor):
+    """
+    Filtro por RUT exacto sobre el índice de rut_numero.
+
+    Returns:
+        Q o None si el valor no es un RUT válido
+    """
+    from django.db.models import Q
+
+    if not rut_valido(valor):
+        return None
+    numero, dv = normalizar_rut(valor)
+    return Q(rut_numero=numero, rut_dv=dv)
+
+
 class SignosVitalesValidationMixin:
     """
     Mixin para validaciones de signos vitales.
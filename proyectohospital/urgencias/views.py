@@ -12,17 +12,23 @@ from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 from django.contrib.auth import login, logout
 from django.middleware.csrf import get_token
 from django.utils import timezone
-from django.db.models import Q
-from django.http import FileResponse, HttpResponse
-from django.template.loader import render_to_string
-from weasyprint import HTML
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.http import parse_etags
+from asgiref.sync import sync_to_async
+import asyncio
 import io
+import json
+import os
 from .models import (Usuario, Paciente, FichaEmergencia, SignosVitales, SolicitudMedicamento, 
-                     Anamnesis, Triage, Diagnostico, SolicitudExamen, AuditLog, ConfiguracionHospital, Cama,
+                     Anamnesis, Triage, Diagnostico, SolicitudExamen, AuditLog, AuditDailyRollup, ConfiguracionHospital, Cama,
                      ArchivoAdjunto, MensajeChat, Notificacion, NotaEvolucion, Turno, ConfiguracionTurno)
 from .serializers import (
     UsuarioSerializer, LoginSerializer, PacienteSerializer, 
-    FichaEmergenciaSerializer, FichaEmergenciaCreateSerializer,
+    FichaEmergenciaSerializer, FichaEmergenciaListSerializer, FichaEmergenciaCreateSerializer, FichaHistorialSerializer,
     SignosVitalesSerializer, SignosVitalesCreateSerializer,
     SolicitudMedicamentoSerializer, AnamnesisSerializer, TriageSerializer,
     DiagnosticoSerializer, SolicitudExamenSerializer, AuditLogSerializer,
@@ -30,8 +36,26 @@ from .serializers import (
     ArchivoAdjuntoSerializer, ArchivoAdjuntoUploadSerializer,
     MensajeChatSerializer, MensajeChatCreateSerializer,
     NotificacionSerializer, NotaEvolucionSerializer, NotaEvolucionCreateSerializer,
-    TurnoSerializer, ConfiguracionTurnoSerializer, TurnoAsignacionMasivaSerializer
+    TurnoSerializer, ConfiguracionTurnoSerializer, TurnoAsignacionMasivaSerializer,
+    optimizar_fichas
 )
+from .paginacion import (
+    AuditLogPaginacion, SignosVitalesPaginacion, MensajeChatPaginacion,
+    NotificacionPaginacion, FichaEmergenciaPaginacion, HistorialPacientePaginacion
+)
+from .eventos import get_layer, grupo_usuario, grupo_rol, grupo_chat, publicar_mensaje
+from .utils import filtro_rut, log_audit
+from .tablero import registrar_cambio as registrar_cambio_tablero, obtener as obtener_tablero
+from .ingesta_signos import validar_lecturas, registrar_lote, notificar_signos_criticos
+from .busqueda_pacientes import buscar as buscar_pacientes
+from .ocupacion_camas import obtener as ocupacion_camas, invalidar as invalidar_ocupacion_camas
+from .asignacion_camas import asignar as asignar_cama, asignar_lote as asignar_camas_lote
+from .inventario_camas import (
+    desde_csv as camas_desde_csv, desde_patron as camas_desde_patron, validar as validar_camas,
+    crear as crear_camas, eliminar as eliminar_camas, resumen as resumen_camas, max_camas as max_camas_inventario
+)
+from .duplicados_nn import candidatos as candidatos_nn, fusionar as fusionar_pacientes
+from .pdf import clave_documento, version_de, obtener_pdf, generar_lote, zip_en_stream, en_async, metricas as metricas_pdf
 
 
 # Función helper para obtener IP del cliente
@@ -63,13 +87,13 @@ def login_view(request):
         login(request, user)
         
         # Registrar login en auditoría
-        AuditLog.objects.create(
+        log_audit(
+            request,
             usuario=user,
             accion='login',
             modelo='Sesion',
             objeto_id=user.id,
-            detalles={'username': user.username, 'rol': user.rol},
-            ip_address=get_client_ip(request)
+            detalles={'username': user.username, 'rol': user.rol}
         )
         
         # Crear respuesta y asegurar que se envíe el CSRF token
@@ -93,13 +117,13 @@ def logout_view(request):
     user = request.user
     
     # Registrar logout en auditoría
-    AuditLog.objects.create(
+    log_audit(
+        request,
         usuario=user,
         accion='logout',
         modelo='Sesion',
         objeto_id=user.id,
-        detalles={'username': user.username},
-        ip_address=get_client_ip(request)
+        detalles={'username': user.username}
     )
     
     logout(request)
@@ -123,8 +147,8 @@ class PacienteViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         """Registrar creación de paciente en auditoría"""
         paciente = serializer.save()
-        AuditLog.objects.create(
-            usuario=self.request.user,
+        log_audit(
+            self.request,
             accion='crear',
             modelo='Paciente',
             objeto_id=paciente.id,
@@ -132,23 +156,21 @@ class PacienteViewSet(viewsets.ModelViewSet):
                 'nombre': f"{paciente.nombres} {paciente.apellidos}",
                 'rut': paciente.rut or 'NN',
                 'es_nn': paciente.es_nn
-            },
-            ip_address=get_client_ip(self.request)
+            }
         )
     
     def perform_update(self, serializer):
         """Registrar actualización de paciente en auditoría"""
         paciente = serializer.save()
-        AuditLog.objects.create(
-            usuario=self.request.user,
+        log_audit(
+            self.request,
             accion='editar',
             modelo='Paciente',
             objeto_id=paciente.id,
             detalles={
                 'nombre': f"{paciente.nombres} {paciente.apellidos}",
                 'rut': paciente.rut or 'NN'
-            },
-            ip_address=get_client_ip(self.request)
+            }
         )
     
     def get_queryset(self):
@@ -157,7 +179,9 @@ class PacienteViewSet(viewsets.ModelViewSet):
         es_nn = self.request.query_params.get('es_nn', None)
         
         if rut:
-            queryset = queryset.filter(rut=rut)
+            # Igualdad sobre el RUT normalizado: acepta cualquier formato
+            filtro = filtro_rut(rut)
+            queryset = queryset.filter(filtro) if filtro else queryset.none()
         if es_nn is not None:
             queryset = queryset.filter(es_nn=es_nn.lower() == 'true')
         
@@ -171,63 +195,168 @@ class PacienteViewSet(viewsets.ModelViewSet):
         if not q:
             return Response({'error': 'Debe proporcionar un término de búsqueda'}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Buscar por RUT exacto primero
-        pacientes = Paciente.objects.filter(rut__iexact=q)
+        # Un RUT válido se busca por igualdad en el índice de rut_numero; si
+        # no, índice de palabras normalizadas (ver busqueda_pacientes)
+        filtro = filtro_rut(q)
+        pacientes = list(Paciente.objects.filter(filtro)) if filtro else []
+        if not pacientes:
+            pacientes = buscar_pacientes(q, limite=10)
         
-        # Si no se encuentra por RUT, buscar por nombre/apellido
-        if not pacientes.exists():
-            pacientes = Paciente.objects.filter(
-                Q(nombres__icontains=q) | 
-                Q(apellidos__icontains=q) |
-                Q(id_temporal__icontains=q)
+        return Response(PacienteSerializer(pacientes, many=True).data)
+    
+    @action(detail=False, methods=['get'])
+    def candidatos_nn(self, request):
+        """
+        Pacientes NN que podrían ser una persona recién identificada.
+        
+        Parámetros: nombres, apellidos, fecha_nacimiento, sexo, rut,
+        dias (ventana de búsqueda) y limite. Ver duplicados_nn.
+        """
+        from django.utils.dateparse import parse_date
+        from .utils import normalizar_rut
+        
+        params = request.query_params
+        try:
+            fecha_nacimiento = parse_date(params['fecha_nacimiento']) if params.get('fecha_nacimiento') else None
+            dias = int(params['dias']) if params.get('dias') else None
+            limite = min(max(int(params.get('limite', 10)), 1), 50)
+        except ValueError:
+            return Response({'error': 'Parámetros inválidos'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        if not (params.get('nombres') or params.get('apellidos') or fecha_nacimiento or params.get('rut')):
+            return Response(
+                {'error': 'Debe indicar nombre, apellido, fecha de nacimiento o RUT'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        rut = normalizar_rut(params.get('rut'))
+        resultados = candidatos_nn(
+            nombres=params.get('nombres', ''),
+            apellidos=params.get('apellidos', ''),
+            fecha_nacimiento=fecha_nacimiento,
+            sexo=params.get('sexo') or None,
+            rut_numero=rut[0] if rut else None,
+            dias=dias,
+            limite=limite
+        )
+        return Response([
+            {**resultado, 'paciente': PacienteSerializer(resultado['paciente']).data}
+            for resultado in resultados
+        ])
+    
+    @action(detail=True, methods=['post'])
+    def fusionar(self, request, pk=None):
+        """
+        Fusiona pacientes NN en este paciente identificado: {"nn": [ids]}.
+        
+        Las fichas de los NN pasan a este paciente y los NN se eliminan.
+        """
+        if request.user.rol not in ['medico', 'administrador']:
+            return Response(
+                {'error': 'No tienes permisos para fusionar pacientes'},
+                status=status.HTTP_403_FORBIDDEN
             )
         
-        # Limitar a 10 resultados
-        pacientes = pacientes[:10]
+        nn_ids = request.data.get('nn')
+        if not isinstance(nn_ids, list) or not all(isinstance(nn_id, int) for nn_id in nn_ids):
+            return Response({'error': 'Se requiere una lista de ids de pacientes NN'}, status=status.HTTP_400_BAD_REQUEST)
         
-        if not pacientes.exists():
-            return Response([], status=status.HTTP_200_OK)
+        try:
+            resultado = fusionar_pacientes(
+                self.get_object(), nn_ids,
+                usuario=request.user,
+                ip_address=get_client_ip(request),
+                user_agent=request.META.get('HTTP_USER_AGENT', '')
+            )
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
-        return Response(PacienteSerializer(pacientes, many=True).data)
+        return Response(resultado)
     
     @action(detail=True, methods=['get'])
     def historial(self, request, pk=None):
-        """Obtener historial completo de un paciente"""
+        """
+        Historial de atenciones del paciente, de la más reciente a la más
+        antigua, como resúmenes paginados por cursor (?cursor=, ?page_size=).
+        
+        La primera página trae además los totales del paciente. El detalle de
+        una atención se pide con /pacientes/{id}/historial/{ficha_id}/.
+        """
         paciente = self.get_object()
         
-        # Obtener todas las fichas del paciente ordenadas por fecha
         fichas = FichaEmergencia.objects.filter(paciente=paciente).select_related(
-            'paramedico', 'anamnesis', 'diagnostico'
-        ).prefetch_related(
-            'signos_vitales', 'solicitudes_medicamentos', 'solicitudes_examenes'
-        ).order_by('-fecha_registro')
-        
-        # Serializar las fichas
-        serializer = FichaEmergenciaSerializer(fichas, many=True)
+            'medico_asignado', 'triage', 'diagnostico'
+        )
+        paginador = HistorialPacientePaginacion()
+        page = paginador.paginate_queryset(fichas, request, view=self)
         
-        return Response({
+        datos = {
             'paciente': PacienteSerializer(paciente).data,
-            'fichas': serializer.data,
-            'total_atenciones': fichas.count()
-        })
+            'fichas': FichaHistorialSerializer(page, many=True).data,
+            'next': paginador.get_next_link(),
+            'previous': paginador.get_previous_link(),
+        }
+        if not request.query_params.get(paginador.cursor_query_param):
+            datos['totales'] = self._totales_historial(paciente)
+            datos['total_atenciones'] = datos['totales']['atenciones']
+        return Response(datos)
+    
+    def _totales_historial(self, paciente):
+        """Totales del historial en una sola consulta agrupada por estado y prioridad"""
+        from django.db.models import Count, Max, Min
+        
+        grupos = (
+            FichaEmergencia.objects.filter(paciente=paciente).order_by()
+            .values('estado', 'prioridad')
+            .annotate(total=Count('id'), primera=Min('fecha_registro'), ultima=Max('fecha_registro'))
+        )
+        totales = {'atenciones': 0, 'por_estado': {}, 'por_prioridad': {},
+                   'primera_atencion': None, 'ultima_atencion': None}
+        for grupo in grupos:
+            totales['atenciones'] += grupo['total']
+            totales['por_estado'][grupo['estado']] = totales['por_estado'].get(grupo['estado'], 0) + grupo['total']
+            totales['por_prioridad'][grupo['prioridad']] = totales['por_prioridad'].get(grupo['prioridad'], 0) + grupo['total']
+            totales['primera_atencion'] = min(filter(None, [totales['primera_atencion'], grupo['primera']]))
+            totales['ultima_atencion'] = max(filter(None, [totales['ultima_atencion'], grupo['ultima']]))
+        return totales
+    
+    @action(detail=True, methods=['get'], url_path=r'historial/(?P<ficha_id>\d+)')
+    def historial_ficha(self, request, pk=None, ficha_id=None):
+        """Atención completa del historial (signos vitales, medicamentos, exámenes...)"""
+        paciente = self.get_object()
+        ficha = optimizar_fichas(
+            FichaEmergencia.objects.filter(paciente=paciente, id=ficha_id)
+        ).first()
+        if ficha is None:
+            return Response({'error': 'Ficha no encontrada'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(FichaEmergenciaSerializer(ficha).data)
 
 
 class FichaEmergenciaViewSet(viewsets.ModelViewSet):
     """ViewSet para gestión de fichas de emergencia"""
     queryset = FichaEmergencia.objects.all()
     permission_classes = [IsAuthenticated]
+    pagination_class = FichaEmergenciaPaginacion
+    
+    # Listados que usan la representación compacta (ver FichaEmergenciaListSerializer)
+    ACCIONES_LISTADO = {'list', 'en_ruta', 'en_hospital', 'atendidas', 'dados_de_alta',
+                        'hospitalizados', 'en_uci', 'derivados', 'fallecidos'}
     
     def get_serializer_class(self):
         if self.action == 'create':
             return FichaEmergenciaCreateSerializer
+        if self.action in self.ACCIONES_LISTADO:
+            return FichaEmergenciaListSerializer
         return FichaEmergenciaSerializer
     
     def get_queryset(self):
-        queryset = FichaEmergencia.objects.select_related(
-            'paciente', 'paramedico'
-        ).prefetch_related(
-            'signos_vitales', 'solicitudes_medicamentos', 'anamnesis', 'diagnostico'
-        )
+        if self.action in self.ACCIONES_LISTADO:
+            queryset = optimizar_fichas(
+                FichaEmergencia.objects.all(),
+                FichaEmergenciaListSerializer.expansiones(self.request)
+            )
+        else:
+            queryset = optimizar_fichas(FichaEmergencia.objects.all())
         
         # Filtros
         estado = self.request.query_params.get('estado', None)
@@ -253,8 +382,8 @@ class FichaEmergenciaViewSet(viewsets.ModelViewSet):
         ficha = serializer.save()
         
         # Registrar en auditoría
-        AuditLog.objects.create(
-            usuario=request.user,
+        log_audit(
+            request,
             accion='crear',
             modelo='FichaEmergencia',
             objeto_id=ficha.id,
@@ -262,8 +391,7 @@ class FichaEmergenciaViewSet(viewsets.ModelViewSet):
                 'paciente': str(ficha.paciente),
                 'prioridad': ficha.prioridad,
                 'motivo': ficha.motivo_consulta[:100]
-            },
-            ip_address=get_client_ip(request)
+            }
         )
         
         # Crear notificaciones para TENS y Médicos
@@ -291,11 +419,35 @@ class FichaEmergenciaViewSet(viewsets.ModelViewSet):
                 prioridad='urgente'
             )
         
+        registrar_cambio_tablero(ficha.id)
+        
         # Devolver la ficha completa con todos los datos
         output_serializer = FichaEmergenciaSerializer(ficha)
         headers = self.get_success_headers(output_serializer.data)
         return Response(output_serializer.data, status=status.HTTP_201_CREATED, headers=headers)
     
+    def perform_update(self, serializer):
+        ficha = serializer.save()
+        registrar_cambio_tablero(ficha.id)
+    
+    def perform_destroy(self, instance):
+        ficha_id = instance.id
+        instance.delete()
+        registrar_cambio_tablero(ficha_id)
+    
+    @action(detail=False, methods=['get'])
+    def tablero(self, request):
+        """
+        Tablero de urgencias: fichas activas agrupadas por estado.
+        Con ?version=N devuelve solo los cambios posteriores a la versión N
+        (o la foto completa si esos cambios ya no están disponibles).
+        """
+        version = request.query_params.get('version')
+        if version is not None and not version.isdigit():
+            return Response({'error': 'version debe ser un número entero'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response(obtener_tablero(int(version) if version is not None else None))
+    
     @action(detail=False, methods=['get'])
     def en_ruta(self, request):
         """Obtener fichas en ruta"""
@@ -410,8 +562,8 @@ class FichaEmergenciaViewSet(viewsets.ModelViewSet):
         ficha.save()
         
         # Registrar cambio de estado en auditoría
-        AuditLog.objects.create(
-            usuario=request.user,
+        log_audit(
+            request,
             accion='alta' if nuevo_estado == 'dado_de_alta' else 'editar',
             modelo='FichaEmergencia',
             objeto_id=ficha.id,
@@ -419,8 +571,7 @@ class FichaEmergenciaViewSet(viewsets.ModelViewSet):
                 'estado_anterior': estado_anterior,
                 'estado_nuevo': nuevo_estado,
                 'paciente': str(ficha.paciente)
-            },
-            ip_address=get_client_ip(request)
+            }
         )
         
         # Si es dado de alta, liberar la cama automáticamente
@@ -442,6 +593,8 @@ class FichaEmergenciaViewSet(viewsets.ModelViewSet):
                     prioridad='baja'
                 )
         
+        registrar_cambio_tablero(ficha.id)
+        
         # Crear notificaciones según el cambio de estado
         paciente_nombre = f"{ficha.paciente.nombres} {ficha.paciente.apellidos}" if not ficha.paciente.es_nn else f"Paciente NN ({ficha.paciente.id_temporal})"
         
@@ -475,10 +628,11 @@ class FichaEmergenciaViewSet(viewsets.ModelViewSet):
         
         ficha.medico_asignado = medico
         ficha.save()
+        registrar_cambio_tablero(ficha.id)
         
         # Notificar al médico
         paciente_nombre = f"{ficha.paciente.nombres} {ficha.paciente.apellidos}" if not ficha.paciente.es_nn else f"Paciente NN ({ficha.paciente.id_temporal})"
-        Notificacion.objects.create(
+        Notificacion.crear_notificacion(
             usuario=medico,
             tipo='asignacion',
             titulo=f'Nuevo paciente asignado',
@@ -488,8 +642,8 @@ class FichaEmergenciaViewSet(viewsets.ModelViewSet):
         )
         
         # Log de auditoría
-        AuditLog.objects.create(
-            usuario=request.user,
+        log_audit(
+            request,
             accion='editar',
             modelo='FichaEmergencia',
             objeto_id=ficha.id,
@@ -497,8 +651,7 @@ class FichaEmergenciaViewSet(viewsets.ModelViewSet):
                 'accion': 'asignar_medico',
                 'medico_id': medico.id,
                 'medico_nombre': medico.get_full_name()
-            },
-            ip_address=get_client_ip(request)
+            }
         )
         
         serializer = self.get_serializer(ficha)
@@ -509,6 +662,7 @@ class SignosVitalesViewSet(viewsets.ModelViewSet):
     """ViewSet para gestión de signos vitales"""
     queryset = SignosVitales.objects.all()
     permission_classes = [IsAuthenticated]
+    pagination_class = SignosVitalesPaginacion
     
     def get_serializer_class(self):
         if self.action == 'create':
@@ -525,55 +679,23 @@ class SignosVitalesViewSet(viewsets.ModelViewSet):
         return queryset
     
     def _detectar_signos_criticos(self, signos):
-        """Detectar si hay signos vitales críticos y retornar lista de alertas"""
-        alertas = []
-        
-        # Frecuencia cardíaca crítica
-        if signos.frecuencia_cardiaca:
-            if signos.frecuencia_cardiaca < 50:
-                alertas.append(f"Bradicardia severa: FC {signos.frecuencia_cardiaca} lpm")
-            elif signos.frecuencia_cardiaca > 120:
-                alertas.append(f"Taquicardia: FC {signos.frecuencia_cardiaca} lpm")
-        
-        # Presión arterial crítica
-        if signos.presion_sistolica:
-            if signos.presion_sistolica < 90:
-                alertas.append(f"Hipotensión: PA {signos.presion_sistolica}/{signos.presion_diastolica} mmHg")
-            elif signos.presion_sistolica > 180:
-                alertas.append(f"Crisis hipertensiva: PA {signos.presion_sistolica}/{signos.presion_diastolica} mmHg")
-        
-        # Saturación de oxígeno crítica
-        if signos.saturacion_o2:
-            if signos.saturacion_o2 < 90:
-                alertas.append(f"Hipoxemia severa: SatO2 {signos.saturacion_o2}%")
-        
-        # Temperatura crítica
-        if signos.temperatura:
-            if signos.temperatura < 35:
-                alertas.append(f"Hipotermia: {signos.temperatura}°C")
-            elif signos.temperatura > 39.5:
-                alertas.append(f"Fiebre alta: {signos.temperatura}°C")
-        
-        # Frecuencia respiratoria crítica
-        if signos.frecuencia_respiratoria:
-            if signos.frecuencia_respiratoria < 10:
-                alertas.append(f"Bradipnea: FR {signos.frecuencia_respiratoria} rpm")
-            elif signos.frecuencia_respiratoria > 30:
-                alertas.append(f"Taquipnea severa: FR {signos.frecuencia_respiratoria} rpm")
-        
-        # Glasgow crítico
-        if signos.escala_glasgow and signos.escala_glasgow <= 8:
-            alertas.append(f"Glasgow crítico: {signos.escala_glasgow}/15")
-        
-        return alertas
+        """
+        Alertas de la lectura: umbrales críticos, NEWS2/qSOFA y tendencias
+        de la última hora de la ficha, evaluadas al guardarla (ver
+        SignosVitales.actualizar_ficha). Una lectura anterior a la última
+        de la ficha no genera alertas.
+        """
+        resultado = getattr(signos, 'alerta_temprana', None)
+        return resultado['alertas'] if resultado else []
     
     def perform_create(self, serializer):
         """Registrar signos vitales en auditoría y notificar si hay críticos"""
         signos = serializer.save()
+        registrar_cambio_tablero(signos.ficha_id)
         
         # Auditoría
-        AuditLog.objects.create(
-            usuario=self.request.user,
+        log_audit(
+            self.request,
             accion='crear',
             modelo='SignosVitales',
             objeto_id=signos.id,
@@ -584,40 +706,79 @@ class SignosVitalesViewSet(viewsets.ModelViewSet):
                 'pa': f"{signos.presion_sistolica}/{signos.presion_diastolica}",
                 'temp': str(signos.temperatura) if signos.temperatura else None,
                 'sat': signos.saturacion_o2
-            },
-            ip_address=get_client_ip(self.request)
+            }
         )
         
         # Detectar signos críticos
         alertas = self._detectar_signos_criticos(signos)
         
         if alertas:
-            # Notificar al médico asignado
-            ficha = signos.ficha
-            paciente_nombre = str(ficha.paciente) if ficha.paciente else f"NN-{ficha.id}"
-            
-            mensaje_alertas = "\n".join([f"⚠️ {a}" for a in alertas])
-            
-            # Si hay médico asignado, notificar solo a él
-            if ficha.medico_asignado:
-                Notificacion.crear_notificacion(
-                    usuario=ficha.medico_asignado,
-                    tipo='signos_criticos',
-                    titulo=f'🚨 Signos Vitales Críticos',
-                    mensaje=f'Paciente: {paciente_nombre}\n{mensaje_alertas}',
-                    ficha=ficha,
-                    prioridad='urgente'
-                )
-            else:
-                # Si no hay médico asignado, notificar a todos los médicos
-                Notificacion.notificar_rol(
-                    rol='medico',
-                    tipo='signos_criticos',
-                    titulo=f'🚨 Signos Vitales Críticos',
-                    mensaje=f'Paciente: {paciente_nombre}\n{mensaje_alertas}',
-                    ficha=ficha,
-                    prioridad='urgente'
-                )
+            notificar_signos_criticos(signos.ficha, alertas)
+    
+    @action(detail=False, methods=['post'])
+    def lote(self, request):
+        """
+        Carga por lotes desde monitores: {"ficha": id, "lecturas": [...]}.
+        
+        Cada lectura lleva su propio timestamp (opcional, por defecto ahora).
+        Se guardan todas o ninguna (ver ingesta_signos).
+        """
+        try:
+            ficha = FichaEmergencia.objects.select_related('paciente', 'medico_asignado').get(
+                id=request.data.get('ficha')
+            )
+        except (FichaEmergencia.DoesNotExist, ValueError, TypeError):
+            return Response({'error': 'Ficha no encontrada'}, status=status.HTTP_404_NOT_FOUND)
+        
+        lecturas, errores = validar_lecturas(request.data.get('lecturas'))
+        if errores:
+            return Response({'error': errores}, status=status.HTTP_400_BAD_REQUEST)
+        
+        resultado = registrar_lote(
+            ficha, lecturas,
+            usuario=request.user,
+            ip_address=get_client_ip(request),
+            user_agent=request.META.get('HTTP_USER_AGENT', '')
+        )
+        return Response(resultado, status=status.HTTP_201_CREATED)
+    
+    @action(detail=False, methods=['get'])
+    def serie(self, request):
+        """
+        Serie de signos vitales de una ficha para gráficos, en columnas.
+        
+        Parámetros:
+            ficha: id de la ficha (obligatorio)
+            puntos: cantidad máxima de puntos (por defecto 500)
+            metodo: minmax (mín/máx/promedio por tramo) o lttb
+            desde / hasta: rango opcional (fecha o fecha-hora)
+        """
+        from .auditoria import parsear_fecha
+        from .serie_signos import METODOS, PUNTOS_POR_DEFECTO, PUNTOS_MAXIMOS, obtener as obtener_serie
+        
+        ficha_id = request.query_params.get('ficha', '')
+        if not ficha_id.isdigit() or not FichaEmergencia.objects.filter(id=ficha_id).exists():
+            return Response({'error': 'Ficha no encontrada'}, status=status.HTTP_404_NOT_FOUND)
+        
+        puntos = request.query_params.get('puntos', str(PUNTOS_POR_DEFECTO))
+        if not puntos.isdigit() or not 2 <= int(puntos) <= PUNTOS_MAXIMOS:
+            return Response(
+                {'error': f'puntos debe ser un entero entre 2 y {PUNTOS_MAXIMOS}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        metodo = request.query_params.get('metodo', 'minmax')
+        if metodo not in METODOS:
+            return Response(
+                {'error': f'metodo debe ser uno de: {", ".join(METODOS)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        return Response(obtener_serie(
+            int(ficha_id), int(puntos), metodo,
+            desde=parsear_fecha(request.query_params.get('desde')),
+            hasta=parsear_fecha(request.query_params.get('hasta'), fin_de_dia=True)
+        ))
 
 
 class SolicitudMedicamentoViewSet(viewsets.ModelViewSet):
@@ -664,8 +825,8 @@ class SolicitudMedicamentoViewSet(viewsets.ModelViewSet):
         solicitud.save()
         
         # Registrar en auditoría
-        AuditLog.objects.create(
-            usuario=request.user,
+        log_audit(
+            request,
             accion='autorizar',
             modelo='SolicitudMedicamento',
             objeto_id=solicitud.id,
@@ -674,8 +835,7 @@ class SolicitudMedicamentoViewSet(viewsets.ModelViewSet):
                 'medicamento': solicitud.medicamento,
                 'dosis': solicitud.dosis,
                 'paciente': str(solicitud.ficha.paciente)
-            },
-            ip_address=get_client_ip(request)
+            }
         )
         
         # Notificar al paramédico que solicitó
@@ -720,8 +880,8 @@ class SolicitudMedicamentoViewSet(viewsets.ModelViewSet):
         solicitud.save()
         
         # Registrar en auditoría
-        AuditLog.objects.create(
-            usuario=request.user,
+        log_audit(
+            request,
             accion='rechazar',
             modelo='SolicitudMedicamento',
             objeto_id=solicitud.id,
@@ -730,8 +890,7 @@ class SolicitudMedicamentoViewSet(viewsets.ModelViewSet):
                 'medicamento': solicitud.medicamento,
                 'motivo': solicitud.respuesta,
                 'paciente': str(solicitud.ficha.paciente)
-            },
-            ip_address=get_client_ip(request)
+            }
         )
         
         # Notificar al paramédico que solicitó
@@ -767,8 +926,8 @@ class AnamnesisViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         """Registrar anamnesis en auditoría"""
         anamnesis = serializer.save()
-        AuditLog.objects.create(
-            usuario=self.request.user,
+        log_audit(
+            self.request,
             accion='crear',
             modelo='Anamnesis',
             objeto_id=anamnesis.id,
@@ -777,23 +936,21 @@ class AnamnesisViewSet(viewsets.ModelViewSet):
                 'paciente': str(anamnesis.ficha.paciente),
                 'alergias': anamnesis.alergias[:50] if anamnesis.alergias else None,
                 'antecedentes': bool(anamnesis.antecedentes_personales)
-            },
-            ip_address=get_client_ip(self.request)
+            }
         )
     
     def perform_update(self, serializer):
         """Registrar actualización de anamnesis en auditoría"""
         anamnesis = serializer.save()
-        AuditLog.objects.create(
-            usuario=self.request.user,
+        log_audit(
+            self.request,
             accion='editar',
             modelo='Anamnesis',
             objeto_id=anamnesis.id,
             detalles={
                 'ficha_id': anamnesis.ficha.id,
                 'paciente': str(anamnesis.ficha.paciente)
-            },
-            ip_address=get_client_ip(self.request)
+            }
         )
 
 
@@ -819,8 +976,8 @@ class TriageViewSet(viewsets.ModelViewSet):
         triage = serializer.save()
         
         # Registrar en auditoría
-        AuditLog.objects.create(
-            usuario=request.user,
+        log_audit(
+            request,
             accion='crear',
             modelo='Triage',
             objeto_id=triage.id,
@@ -829,8 +986,7 @@ class TriageViewSet(viewsets.ModelViewSet):
                 'paciente': str(triage.ficha.paciente),
                 'nivel_esi': triage.nivel_esi,
                 'motivo': triage.motivo_consulta_triage[:100] if triage.motivo_consulta_triage else None
-            },
-            ip_address=get_client_ip(request)
+            }
         )
         
         # Obtener información del paciente
@@ -852,6 +1008,7 @@ class TriageViewSet(viewsets.ModelViewSet):
         }
         ficha.prioridad = prioridad_mapping.get(triage.nivel_esi, ficha.prioridad)
         ficha.save()
+        registrar_cambio_tablero(ficha.id)
         
         # Notificar a médicos
         Notificacion.notificar_rol(
@@ -877,17 +1034,20 @@ class TriageViewSet(viewsets.ModelViewSet):
         headers = self.get_success_headers(serializer.data)
         return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
     
+    def perform_update(self, serializer):
+        triage = serializer.save()
+        registrar_cambio_tablero(triage.ficha_id)
+    
     @action(detail=False, methods=['get'])
     def pendientes(self, request):
         """Obtener fichas que necesitan triage (en_hospital sin triage)"""
-        fichas_sin_triage = FichaEmergencia.objects.filter(
-            estado='en_hospital',
-            triage__isnull=True
-        ).select_related('paciente', 'paramedico').order_by('-fecha_registro')
-        
-        # Devolver serializado
-        from .serializers import FichaEmergenciaSerializer
-        serializer = FichaEmergenciaSerializer(fichas_sin_triage, many=True)
+        fichas_sin_triage = optimizar_fichas(
+            FichaEmergencia.objects.filter(estado='en_hospital', triage__isnull=True),
+            FichaEmergenciaListSerializer.expansiones(request)
+        ).order_by('-fecha_registro')
+        
+        # Devolver serializado (compacto, ?expand= para la ficha completa)
+        serializer = FichaEmergenciaListSerializer(fichas_sin_triage, many=True, context=self.get_serializer_context())
         return Response(serializer.data)
     
     @action(detail=False, methods=['get'])
@@ -935,8 +1095,8 @@ class DiagnosticoViewSet(viewsets.ModelViewSet):
         
         # Registrar en auditoría
         tipo_alta = request.data.get('tipo_alta', 'domicilio')
-        AuditLog.objects.create(
-            usuario=request.user,
+        log_audit(
+            request,
             accion='crear',
             modelo='Diagnostico',
             objeto_id=diagnostico.id,
@@ -946,8 +1106,7 @@ class DiagnosticoViewSet(viewsets.ModelViewSet):
                 'diagnostico_cie10': diagnostico.diagnostico_cie10,
                 'descripcion': diagnostico.descripcion[:100] if diagnostico.descripcion else None,
                 'tipo_alta': tipo_alta
-            },
-            ip_address=get_client_ip(request)
+            }
         )
         
         # Obtener tipo de alta y cambiar estado de la ficha
@@ -970,6 +1129,7 @@ class DiagnosticoViewSet(viewsets.ModelViewSet):
                 nuevo_estado = estado_mapping.get(tipo_alta, 'dado_de_alta')
                 ficha.estado = nuevo_estado
                 ficha.save()
+                registrar_cambio_tablero(ficha.id)
                 
                 # Crear notificaciones según tipo de alta
                 paciente_nombre = f"{ficha.paciente.nombres} {ficha.paciente.apellidos}" if not ficha.paciente.es_nn else f"Paciente NN ({ficha.paciente.id_temporal})"
@@ -1050,8 +1210,8 @@ class SolicitudExamenViewSet(viewsets.ModelViewSet):
         solicitud = serializer.save()
         
         # Registrar en auditoría
-        AuditLog.objects.create(
-            usuario=request.user,
+        log_audit(
+            request,
             accion='crear',
             modelo='SolicitudExamen',
             objeto_id=solicitud.id,
@@ -1060,8 +1220,7 @@ class SolicitudExamenViewSet(viewsets.ModelViewSet):
                 'tipo_examen': solicitud.tipo_examen,
                 'prioridad': solicitud.prioridad,
                 'paciente': str(solicitud.ficha.paciente)
-            },
-            ip_address=get_client_ip(request)
+            }
         )
         
         # Notificar a TENS sobre nuevo examen solicitado
@@ -1109,8 +1268,8 @@ class SolicitudExamenViewSet(viewsets.ModelViewSet):
         solicitud.save()
         
         # Registrar en auditoría
-        AuditLog.objects.create(
-            usuario=request.user,
+        log_audit(
+            request,
             accion='editar',
             modelo='SolicitudExamen',
             objeto_id=solicitud.id,
@@ -1118,8 +1277,7 @@ class SolicitudExamenViewSet(viewsets.ModelViewSet):
                 'ficha_id': solicitud.ficha.id,
                 'tipo_examen': solicitud.tipo_examen,
                 'estado': 'en_proceso'
-            },
-            ip_address=get_client_ip(request)
+            }
         )
         
         serializer = self.get_serializer(solicitud)
@@ -1139,8 +1297,8 @@ class SolicitudExamenViewSet(viewsets.ModelViewSet):
         solicitud.save()
         
         # Registrar en auditoría
-        AuditLog.objects.create(
-            usuario=request.user,
+        log_audit(
+            request,
             accion='completar',
             modelo='SolicitudExamen',
             objeto_id=solicitud.id,
@@ -1148,8 +1306,7 @@ class SolicitudExamenViewSet(viewsets.ModelViewSet):
                 'ficha_id': solicitud.ficha.id,
                 'tipo_examen': solicitud.tipo_examen,
                 'tiene_resultados': bool(resultados)
-            },
-            ip_address=get_client_ip(request)
+            }
         )
         
         # Notificar al médico que solicitó el examen
@@ -1170,38 +1327,112 @@ class SolicitudExamenViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
 
+# Máximo de fichas por exportación ZIP de documentos
+LOTE_PDF_MAX_FICHAS = 500
+
+
 class DocumentosPDFViewSet(viewsets.ViewSet):
     """ViewSet para generación de documentos PDF"""
     permission_classes = [IsAuthenticated]
     
+    def _contexto_ficha(self, ficha):
+        """Contexto del PDF de ficha de emergencia"""
+        signos_vitales = SignosVitales.objects.filter(ficha=ficha).order_by('timestamp')
+        
+        # Intentar obtener el diagnóstico si existe
+        try:
+            diagnostico = Diagnostico.objects.select_related('medico').get(ficha=ficha)
+        except Diagnostico.DoesNotExist:
+            diagnostico = None
+        
+        return {
+            'ficha': ficha,
+            'paciente': ficha.paciente,
+            'signos_vitales': signos_vitales,
+            'diagnostico': diagnostico,
+        }
+    
+    def _contexto_receta(self, ficha):
+        """Contexto del PDF de receta (lanza Diagnostico.DoesNotExist si no hay diagnóstico)"""
+        diagnostico = Diagnostico.objects.select_related('medico').get(ficha=ficha)
+        return {
+            'ficha': ficha,
+            'paciente': ficha.paciente,
+            'diagnostico': diagnostico,
+            'medico': diagnostico.medico,
+        }
+    
+    def _contexto_alta(self, ficha, usuario):
+        """Contexto del PDF de alta médica"""
+        # Intentar obtener el diagnóstico
+        try:
+            diagnostico = Diagnostico.objects.select_related('medico').get(ficha=ficha)
+            medico = diagnostico.medico
+        except Diagnostico.DoesNotExist:
+            diagnostico = None
+            # Usar el usuario actual como médico si no hay diagnóstico
+            medico = usuario
+        
+        return {
+            'ficha': ficha,
+            'paciente': ficha.paciente,
+            'diagnostico': diagnostico,
+            'medico': medico,
+        }
+    
+    def _version(self, context, *extras):
+        """Versión de los datos del documento (ver pdf.version_de), sin renderizar la plantilla"""
+        diagnostico = context.get('diagnostico')
+        medico = context.get('medico') or (diagnostico.medico if diagnostico else None)
+        return version_de(context['ficha'], context['paciente'], context['paciente'].edad, diagnostico, medico, *extras)
+    
+    def _version_ficha(self, context):
+        from django.db.models import Count, Max
+        
+        # Eliminar una lectura que no es la última no cambia la ficha
+        signos = context['signos_vitales'].aggregate(cantidad=Count('id'), ultimo=Max('id'))
+        return self._version(context, signos['cantidad'], signos['ultimo'])
+    
+    def _responder_pdf(self, request, plantilla, version, context, nombre_archivo):
+        """
+        Respuesta PDF servida desde la caché de documentos (ver pdf.py).
+        Si el cliente ya tiene la misma versión (If-None-Match) responde 304.
+        La plantilla solo se renderiza si el PDF no está en caché.
+        """
+        clave = clave_documento(plantilla, version)
+        etag = f'"{clave}"'
+        
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(obtener_pdf(plantilla, clave, context), content_type='application/pdf')
+            response['Content-Disposition'] = f'inline; filename="{nombre_archivo}"'
+        
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+    
+    def _pdf_no_disponible(self):
+        """El pool no terminó el PDF dentro de PDF_RENDER_TIMEOUT"""
+        return Response(
+            {'error': 'El documento está tardando en generarse, intente nuevamente en unos segundos'},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE
+        )
+    
     @action(detail=False, methods=['get'], url_path='ficha/(?P<ficha_id>[^/.]+)')
     def ficha_pdf(self, request, ficha_id=None):
         """Generar PDF de ficha de emergencia completa"""
         try:
             ficha = FichaEmergencia.objects.select_related('paciente').get(id=ficha_id)
-            signos_vitales = SignosVitales.objects.filter(ficha=ficha).order_by('timestamp')
-            
-            # Intentar obtener el diagnóstico si existe
-            try:
-                diagnostico = Diagnostico.objects.select_related('medico').get(ficha=ficha)
-            except Diagnostico.DoesNotExist:
-                diagnostico = None
-            
-            context = {
-                'ficha': ficha,
-                'paciente': ficha.paciente,
-                'signos_vitales': signos_vitales,
-                'diagnostico': diagnostico,
-                'fecha_actual': timezone.now().strftime('%d/%m/%Y %H:%M'),
-            }
+            context = self._contexto_ficha(ficha)
             
-            html_string = render_to_string('pdf/ficha_emergencia.html', context)
-            html = HTML(string=html_string)
-            pdf_file = html.write_pdf()
+            response = self._responder_pdf(
+                request, 'pdf/ficha_emergencia.html', self._version_ficha(context), context, f'ficha_{ficha_id}.pdf'
+            )
             
             # Registrar en auditoría
-            AuditLog.objects.create(
-                usuario=request.user,
+            log_audit(
+                request,
                 accion='generar_pdf',
                 modelo='FichaEmergencia',
                 objeto_id=ficha.id,
@@ -1209,16 +1440,15 @@ class DocumentosPDFViewSet(viewsets.ViewSet):
                     'tipo_documento': 'ficha_emergencia',
                     'paciente_id': ficha.paciente.id,
                     'paciente_nombre': f"{ficha.paciente.nombres} {ficha.paciente.apellidos}" if not ficha.paciente.es_nn else f"NN-{ficha.paciente.id_temporal}",
-                },
-                ip_address=get_client_ip(request)
+                }
             )
             
-            response = HttpResponse(pdf_file, content_type='application/pdf')
-            response['Content-Disposition'] = f'inline; filename="ficha_{ficha_id}.pdf"'
             return response
             
         except FichaEmergencia.DoesNotExist:
             return Response({'error': 'Ficha no encontrada'}, status=status.HTTP_404_NOT_FOUND)
+        except TimeoutError:
+            return self._pdf_no_disponible()
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
@@ -1227,23 +1457,16 @@ class DocumentosPDFViewSet(viewsets.ViewSet):
         """Generar PDF de receta médica"""
         try:
             ficha = FichaEmergencia.objects.select_related('paciente').get(id=ficha_id)
-            diagnostico = Diagnostico.objects.select_related('medico').get(ficha=ficha)
-            
-            context = {
-                'ficha': ficha,
-                'paciente': ficha.paciente,
-                'diagnostico': diagnostico,
-                'medico': diagnostico.medico,
-                'fecha_actual': timezone.now().strftime('%d/%m/%Y %H:%M'),
-            }
+            context = self._contexto_receta(ficha)
+            diagnostico = context['diagnostico']
             
-            html_string = render_to_string('pdf/receta_medica.html', context)
-            html = HTML(string=html_string)
-            pdf_file = html.write_pdf()
+            response = self._responder_pdf(
+                request, 'pdf/receta_medica.html', self._version(context), context, f'receta_{ficha_id}.pdf'
+            )
             
             # Registrar en auditoría
-            AuditLog.objects.create(
-                usuario=request.user,
+            log_audit(
+                request,
                 accion='generar_pdf',
                 modelo='Diagnostico',
                 objeto_id=diagnostico.id,
@@ -1252,58 +1475,62 @@ class DocumentosPDFViewSet(viewsets.ViewSet):
                     'ficha_id': ficha.id,
                     'paciente_nombre': f"{ficha.paciente.nombres} {ficha.paciente.apellidos}" if not ficha.paciente.es_nn else f"NN-{ficha.paciente.id_temporal}",
                     'medico': f"{diagnostico.medico.first_name} {diagnostico.medico.last_name}",
-                },
-                ip_address=get_client_ip(request)
+                }
             )
             
-            response = HttpResponse(pdf_file, content_type='application/pdf')
-            response['Content-Disposition'] = f'inline; filename="receta_{ficha_id}.pdf"'
             return response
             
         except FichaEmergencia.DoesNotExist:
             return Response({'error': 'Ficha no encontrada'}, status=status.HTTP_404_NOT_FOUND)
         except Diagnostico.DoesNotExist:
             return Response({'error': 'No hay diagnóstico para esta ficha'}, status=status.HTTP_404_NOT_FOUND)
+        except TimeoutError:
+            return self._pdf_no_disponible()
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
     @action(detail=False, methods=['get'], url_path='orden-examenes/(?P<ficha_id>[^/.]+)')
     def orden_examenes_pdf(self, request, ficha_id=None):
         """Generar PDF de orden de exámenes"""
+        from django.db.models import Count, Max
+        
         try:
             ficha = FichaEmergencia.objects.select_related('paciente').get(id=ficha_id)
             diagnostico = Diagnostico.objects.select_related('medico').get(ficha=ficha)
             
             # Obtener solicitudes de exámenes si existen
             examenes = SolicitudExamen.objects.filter(ficha=ficha)
-            examenes_list = []
-            for examen in examenes:
-                examenes_list.append({
-                    'nombre': examen.tipo_examen,
-                    'urgente': examen.prioridad == 'alta',
-                    'indicaciones': examen.observaciones
-                })
-            
-            # Si no hay solicitudes específicas, usar el texto del tratamiento/indicaciones
-            examenes_texto = diagnostico.indicaciones_medicas if diagnostico.indicaciones_medicas else ""
+            resumen_examenes = examenes.aggregate(cantidad=Count('id'), ultimo=Max('id'), actualizacion=Max('fecha_actualizacion'))
             
             context = {
                 'ficha': ficha,
                 'paciente': ficha.paciente,
                 'diagnostico': diagnostico,
                 'medico': diagnostico.medico,
-                'examenes_list': examenes_list if examenes_list else None,
-                'examenes_texto': examenes_texto,
-                'fecha_actual': timezone.now().strftime('%d/%m/%Y %H:%M'),
             }
             
-            html_string = render_to_string('pdf/orden_examenes.html', context)
-            html = HTML(string=html_string)
-            pdf_file = html.write_pdf()
+            def contexto_completo():
+                # Solo se arma si el PDF no está en caché
+                examenes_list = [{
+                    'nombre': examen.tipo_examen,
+                    'urgente': examen.prioridad == 'alta',
+                    'indicaciones': examen.observaciones
+                } for examen in examenes]
+                return {
+                    **context,
+                    'examenes_list': examenes_list if examenes_list else None,
+                    # Si no hay solicitudes específicas, usar el texto del tratamiento/indicaciones
+                    'examenes_texto': diagnostico.indicaciones_medicas if diagnostico.indicaciones_medicas else "",
+                }
+            
+            response = self._responder_pdf(
+                request, 'pdf/orden_examenes.html', self._version(context, *resumen_examenes.values()),
+                contexto_completo, f'orden_examenes_{ficha_id}.pdf'
+            )
             
             # Registrar en auditoría
-            AuditLog.objects.create(
-                usuario=request.user,
+            log_audit(
+                request,
                 accion='generar_pdf',
                 modelo='SolicitudExamen',
                 objeto_id=ficha.id,
@@ -1311,19 +1538,18 @@ class DocumentosPDFViewSet(viewsets.ViewSet):
                     'tipo_documento': 'orden_examenes',
                     'ficha_id': ficha.id,
                     'paciente_nombre': f"{ficha.paciente.nombres} {ficha.paciente.apellidos}" if not ficha.paciente.es_nn else f"NN-{ficha.paciente.id_temporal}",
-                    'cantidad_examenes': len(examenes_list),
-                },
-                ip_address=get_client_ip(request)
+                    'cantidad_examenes': resumen_examenes['cantidad'],
+                }
             )
             
-            response = HttpResponse(pdf_file, content_type='application/pdf')
-            response['Content-Disposition'] = f'inline; filename="orden_examenes_{ficha_id}.pdf"'
             return response
             
         except FichaEmergencia.DoesNotExist:
             return Response({'error': 'Ficha no encontrada'}, status=status.HTTP_404_NOT_FOUND)
         except Diagnostico.DoesNotExist:
             return Response({'error': 'No hay diagnóstico para esta ficha'}, status=status.HTTP_404_NOT_FOUND)
+        except TimeoutError:
+            return self._pdf_no_disponible()
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
@@ -1332,31 +1558,15 @@ class DocumentosPDFViewSet(viewsets.ViewSet):
         """Generar PDF de alta médica"""
         try:
             ficha = FichaEmergencia.objects.select_related('paciente').get(id=ficha_id)
+            context = self._contexto_alta(ficha, request.user)
             
-            # Intentar obtener el diagnóstico
-            try:
-                diagnostico = Diagnostico.objects.select_related('medico').get(ficha=ficha)
-                medico = diagnostico.medico
-            except Diagnostico.DoesNotExist:
-                diagnostico = None
-                # Usar el usuario actual como médico si no hay diagnóstico
-                medico = request.user
-            
-            context = {
-                'ficha': ficha,
-                'paciente': ficha.paciente,
-                'diagnostico': diagnostico,
-                'medico': medico,
-                'fecha_actual': timezone.now().strftime('%d/%m/%Y %H:%M'),
-            }
-            
-            html_string = render_to_string('pdf/alta_medica.html', context)
-            html = HTML(string=html_string)
-            pdf_file = html.write_pdf()
+            response = self._responder_pdf(
+                request, 'pdf/alta_medica.html', self._version(context), context, f'alta_{ficha_id}.pdf'
+            )
             
             # Registrar en auditoría
-            AuditLog.objects.create(
-                usuario=request.user,
+            log_audit(
+                request,
                 accion='generar_pdf',
                 modelo='FichaEmergencia',
                 objeto_id=ficha.id,
@@ -1364,18 +1574,127 @@ class DocumentosPDFViewSet(viewsets.ViewSet):
                     'tipo_documento': 'alta_medica',
                     'ficha_id': ficha.id,
                     'paciente_nombre': f"{ficha.paciente.nombres} {ficha.paciente.apellidos}" if not ficha.paciente.es_nn else f"NN-{ficha.paciente.id_temporal}",
-                },
-                ip_address=get_client_ip(request)
+                }
             )
             
-            response = HttpResponse(pdf_file, content_type='application/pdf')
-            response['Content-Disposition'] = f'inline; filename="alta_{ficha_id}.pdf"'
             return response
             
         except FichaEmergencia.DoesNotExist:
             return Response({'error': 'Ficha no encontrada'}, status=status.HTTP_404_NOT_FOUND)
+        except TimeoutError:
+            return self._pdf_no_disponible()
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    
+    @action(detail=False, methods=['get'])
+    def metricas(self, request):
+        """Tiempos de renderizado de PDF del proceso actual (solo administradores)"""
+        if request.user.rol != 'administrador':
+            return Response(
+                {'error': 'No tienes permisos'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        return Response({'pid': os.getpid(), 'plantillas': metricas_pdf()})
+    
+    @action(detail=False, methods=['get'])
+    def lote(self, request):
+        """
+        Exportar en un ZIP los PDF de varias fichas (ej: altas de un turno).
+        Parámetros:
+            fichas: ids separados por coma, o bien
+            fecha_desde / fecha_hasta: fichas dadas de alta en el rango (AAAA-MM-DD)
+            tipos: documentos a incluir separados por coma (default: alta,receta,ficha)
+        """
+        from django.utils.dateparse import parse_date
+        
+        if request.user.rol != 'administrador':
+            return Response(
+                {'error': 'No tienes permisos'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        plantillas = {
+            'alta': 'pdf/alta_medica.html',
+            'receta': 'pdf/receta_medica.html',
+            'ficha': 'pdf/ficha_emergencia.html',
+        }
+        tipos = [tipo.strip() for tipo in request.query_params.get('tipos', 'alta,receta,ficha').split(',') if tipo.strip()]
+        invalidos = [tipo for tipo in tipos if tipo not in plantillas]
+        if not tipos or invalidos:
+            return Response(
+                {'error': f'Tipos de documento inválidos. Opciones: {", ".join(plantillas)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        fichas = FichaEmergencia.objects.select_related('paciente')
+        if request.query_params.get('fichas'):
+            try:
+                ids = [int(ficha_id) for ficha_id in request.query_params['fichas'].split(',') if ficha_id.strip()]
+            except ValueError:
+                return Response({'error': 'fichas debe ser una lista de ids separados por coma'}, status=status.HTTP_400_BAD_REQUEST)
+            fichas = fichas.filter(id__in=ids)
+        else:
+            try:
+                desde = parse_date(request.query_params.get('fecha_desde', ''))
+                hasta = parse_date(request.query_params.get('fecha_hasta', '')) or desde
+            except ValueError:
+                desde = None
+            if desde is None:
+                return Response(
+                    {'error': 'Indique fichas o fecha_desde (AAAA-MM-DD)'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            fichas = fichas.filter(
+                estado='dado_de_alta',
+                fecha_actualizacion__date__gte=desde,
+                fecha_actualizacion__date__lte=hasta
+            )
+        
+        fichas = list(fichas.order_by('id')[:LOTE_PDF_MAX_FICHAS])
+        if not fichas:
+            return Response({'error': 'No hay fichas para exportar'}, status=status.HTTP_404_NOT_FOUND)
+        
+        usuario = request.user
+        contextos = {
+            'alta': lambda ficha: self._contexto_alta(ficha, usuario),
+            'receta': self._contexto_receta,
+            'ficha': self._contexto_ficha,
+        }
+        versiones = {
+            'alta': self._version,
+            'receta': self._version,
+            'ficha': self._version_ficha,
+        }
+        
+        def documentos():
+            for ficha in fichas:
+                for tipo in tipos:
+                    try:
+                        context = contextos[tipo](ficha)
+                    except Diagnostico.DoesNotExist:
+                        continue  # Sin diagnóstico no hay receta
+                    clave = clave_documento(plantillas[tipo], versiones[tipo](context))
+                    yield f'{tipo}_{ficha.id}.pdf', plantillas[tipo], context, clave
+        
+        # Registrar en auditoría
+        log_audit(
+            request,
+            accion='generar_pdf',
+            modelo='FichaEmergencia',
+            detalles={
+                'tipo_documento': 'lote',
+                'tipos': tipos,
+                'fichas': [ficha.id for ficha in fichas],
+            }
+        )
+        
+        trozos = zip_en_stream(generar_lote(documentos()))
+        # Bajo ASGI un iterador síncrono se armaría completo en memoria antes de enviarse
+        if isinstance(request._request, ASGIRequest):
+            trozos = en_async(trozos)
+        response = StreamingHttpResponse(trozos, content_type='application/zip')
+        response['Content-Disposition'] = f'attachment; filename="documentos_{timezone.localdate():%Y%m%d}.zip"'
+        return response
 
 
 class UsuarioViewSet(viewsets.ModelViewSet):
@@ -1397,12 +1716,19 @@ class UsuarioViewSet(viewsets.ModelViewSet):
             if rol:
                 queryset = queryset.filter(rol=rol)
             if search:
-                queryset = queryset.filter(
-                    Q(first_name__icontains=search) |
-                    Q(last_name__icontains=search) |
-                    Q(email__icontains=search) |
-                    Q(rut__icontains=search)
-                )
+                # Un RUT válido se busca por igualdad en el índice de rut_numero;
+                # si no hay coincidencia (p. ej. un fragmento numérico que por
+                # azar tiene dígito verificador válido) se busca por texto
+                filtro = filtro_rut(search)
+                if filtro and queryset.filter(filtro).exists():
+                    queryset = queryset.filter(filtro)
+                else:
+                    queryset = queryset.filter(
+                        Q(first_name__icontains=search) |
+                        Q(last_name__icontains=search) |
+                        Q(email__icontains=search) |
+                        Q(rut__icontains=search)
+                    )
             if activo is not None:
                 queryset = queryset.filter(is_active=(activo.lower() == 'true'))
             
@@ -1422,8 +1748,8 @@ class UsuarioViewSet(viewsets.ModelViewSet):
         usuario = serializer.save()
         
         # Registrar en auditoría
-        AuditLog.objects.create(
-            usuario=request.user,
+        log_audit(
+            request,
             accion='crear',
             modelo='Usuario',
             objeto_id=usuario.id,
@@ -1431,9 +1757,7 @@ class UsuarioViewSet(viewsets.ModelViewSet):
                 'usuario_creado': usuario.get_full_name(),
                 'rol': usuario.rol,
                 'email': usuario.email
-            },
-            ip_address=get_client_ip(request),
-            user_agent=request.META.get('HTTP_USER_AGENT', '')
+            }
         )
         
         headers = self.get_success_headers(serializer.data)
@@ -1454,17 +1778,15 @@ class UsuarioViewSet(viewsets.ModelViewSet):
         usuario = serializer.save()
         
         # Registrar en auditoría
-        AuditLog.objects.create(
-            usuario=request.user,
+        log_audit(
+            request,
             accion='editar',
             modelo='Usuario',
             objeto_id=usuario.id,
             detalles={
                 'usuario_editado': usuario.get_full_name(),
                 'cambios': request.data
-            },
-            ip_address=get_client_ip(request),
-            user_agent=request.META.get('HTTP_USER_AGENT', '')
+            }
         )
         
         return Response(serializer.data)
@@ -1485,14 +1807,12 @@ class UsuarioViewSet(viewsets.ModelViewSet):
         }
         
         # Registrar en auditoría antes de eliminar
-        AuditLog.objects.create(
-            usuario=request.user,
+        log_audit(
+            request,
             accion='eliminar',
             modelo='Usuario',
             objeto_id=instance.id,
-            detalles={'usuario_eliminado': usuario_info},
-            ip_address=get_client_ip(request),
-            user_agent=request.META.get('HTTP_USER_AGENT', '')
+            detalles={'usuario_eliminado': usuario_info}
         )
         
         instance.is_active = False
@@ -1592,13 +1912,14 @@ class AuditLogViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = AuditLog.objects.all()
     serializer_class = AuditLogSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = AuditLogPaginacion
     
     def get_queryset(self):
         # Solo administradores pueden ver logs
         if self.request.user.rol != 'administrador':
             return AuditLog.objects.none()
         
-        queryset = AuditLog.objects.all()
+        queryset = AuditLog.objects.select_related('usuario')
         
         # Filtros
         usuario_id = self.request.query_params.get('usuario', None)
@@ -1612,7 +1933,11 @@ class AuditLogViewSet(viewsets.ReadOnlyModelViewSet):
             if usuario_id.isdigit():
                 queryset = queryset.filter(usuario_id=usuario_id)
             else:
-                queryset = queryset.filter(usuario_nombre__icontains=usuario_id)
+                queryset = queryset.filter(
+                    Q(usuario__username__icontains=usuario_id) |
+                    Q(usuario__first_name__icontains=usuario_id) |
+                    Q(usuario__last_name__icontains=usuario_id)
+                )
         if accion:
             queryset = queryset.filter(accion=accion)
         if modelo:
@@ -1622,7 +1947,70 @@ class AuditLogViewSet(viewsets.ReadOnlyModelViewSet):
         if fecha_hasta:
             queryset = queryset.filter(timestamp__lte=fecha_hasta)
         
-        return queryset.order_by('-timestamp')
+        return queryset.order_by('-timestamp', '-id')
+    
+    def list(self, request, *args, **kwargs):
+        """
+        Lista de logs. Si fecha_desde es anterior a la ventana de retención,
+        al terminarse los registros de la tabla se continúa con los
+        archivados de esos meses, con la misma respuesta por cursor: 'next'
+        lleva ?cursor_archivo= (fecha e id del último registro entregado).
+        """
+        import base64
+        from itertools import islice
+        from django.utils.dateparse import parse_datetime
+        from rest_framework.utils.urls import remove_query_param, replace_query_param
+        from .auditoria import inicio_ventana, leer_archivo, parsear_fecha
+        
+        desde = parsear_fecha(request.query_params.get('fecha_desde'))
+        if request.user.rol != 'administrador' or desde is None or desde >= inicio_ventana():
+            return super().list(request, *args, **kwargs)
+        
+        paginador = self.paginator
+        cursor_archivo = request.query_params.get('cursor_archivo')
+        antes_de = None
+        if cursor_archivo:
+            # La tabla ya se recorrió: solo se sigue leyendo el archivo
+            try:
+                fecha, _, registro_id = base64.urlsafe_b64decode(cursor_archivo.encode()).decode().rpartition('|')
+                antes_de = (parse_datetime(fecha), int(registro_id))
+                if antes_de[0] is None:
+                    raise ValueError()
+            except (ValueError, UnicodeDecodeError):
+                return Response({'error': 'Cursor inválido'}, status=status.HTTP_400_BAD_REQUEST)
+            registros = []
+            tamano = paginador.get_page_size(request)
+            anterior = None
+        else:
+            page = paginador.paginate_queryset(self.filter_queryset(self.get_queryset()), request, view=self)
+            registros = list(self.get_serializer(page, many=True).data)
+            if paginador.has_next:
+                return paginador.get_paginated_response(registros)
+            tamano = paginador.page_size
+            anterior = paginador.get_previous_link()
+        
+        # Tabla agotada: el resto de la página sale del archivo (siempre más
+        # antiguo), leyendo solo los meses necesarios para llenarla
+        faltan = tamano - len(registros)
+        archivados = list(islice(leer_archivo(
+            desde,
+            parsear_fecha(request.query_params.get('fecha_hasta'), fin_de_dia=True),
+            usuario=request.query_params.get('usuario'),
+            accion=request.query_params.get('accion'),
+            modelo=request.query_params.get('modelo'),
+            antes_de=antes_de,
+        ), faltan + 1))
+        registros += archivados[:faltan]
+        
+        siguiente = None
+        if len(archivados) > faltan and registros:
+            ultimo = registros[-1]
+            cursor = base64.urlsafe_b64encode(f"{ultimo['timestamp']}|{ultimo['id']}".encode()).decode()
+            siguiente = replace_query_param(
+                remove_query_param(request.build_absolute_uri(), paginador.cursor_query_param),
+                'cursor_archivo', cursor
+            )
+        return Response({'next': siguiente, 'previous': anterior, 'results': registros})
     
     @action(detail=False, methods=['get'])
     def resumen(self, request):
@@ -1633,19 +2021,78 @@ class AuditLogViewSet(viewsets.ReadOnlyModelViewSet):
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        hoy = timezone.now().date()
-        logs_hoy = AuditLog.objects.filter(timestamp__date=hoy)
+        # Conteos desde el resumen diario: una sola consulta agrupada
+        conteos = dict(
+            AuditDailyRollup.objects.filter(fecha=timezone.localdate())
+            .values('accion')
+            .annotate(cantidad=Sum('total'))
+            .values_list('accion', 'cantidad')
+            .order_by()
+        )
         
         return Response({
-            'total_acciones_hoy': logs_hoy.count(),
+            'total_acciones_hoy': sum(conteos.values()),
             'acciones_por_tipo': {
-                accion[0]: logs_hoy.filter(accion=accion[0]).count()
+                accion[0]: conteos.get(accion[0], 0)
                 for accion in AuditLog.ACCION_CHOICES
             },
             'ultimas_acciones': AuditLogSerializer(
-                AuditLog.objects.all()[:10], many=True
+                AuditLog.objects.select_related('usuario')[:10], many=True
             ).data
         })
+    
+    @action(detail=False, methods=['get'])
+    def actividad(self, request):
+        """
+        Actividad por usuario en un rango de fechas (por defecto los últimos 30 días).
+        Parámetros: fecha_desde, fecha_hasta (AAAA-MM-DD), usuario (id)
+        """
+        from datetime import timedelta
+        from django.utils.dateparse import parse_date
+        
+        if request.user.rol != 'administrador':
+            return Response(
+                {'error': 'No tienes permisos'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        try:
+            hasta = parse_date(request.query_params.get('fecha_hasta', '')) or timezone.localdate()
+            desde = parse_date(request.query_params.get('fecha_desde', '')) or hasta - timedelta(days=30)
+        except ValueError:
+            return Response(
+                {'error': 'Formato de fecha inválido (use AAAA-MM-DD)'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        rollups = AuditDailyRollup.objects.filter(fecha__gte=desde, fecha__lte=hasta)
+        usuario_id = request.query_params.get('usuario')
+        if usuario_id:
+            rollups = rollups.filter(usuario_id=usuario_id)
+        
+        filas = (
+            rollups.values('usuario', 'usuario__first_name', 'usuario__last_name', 'usuario__rol', 'accion')
+            .annotate(cantidad=Sum('total'))
+            .order_by()
+        )
+        
+        actividad = {}
+        for fila in filas:
+            item = actividad.setdefault(fila['usuario'], {
+                'usuario': fila['usuario'],
+                'usuario_nombre': f"{fila['usuario__first_name'] or ''} {fila['usuario__last_name'] or ''}".strip() or 'Sistema',
+                'usuario_rol': fila['usuario__rol'],
+                'total': 0,
+                'por_accion': {},
+            })
+            item['total'] += fila['cantidad']
+            item['por_accion'][fila['accion']] = fila['cantidad']
+        
+        return Response({
+            'fecha_desde': desde,
+            'fecha_hasta': hasta,
+            'usuarios': sorted(actividad.values(), key=lambda item: item['total'], reverse=True),
+        })
 
 
 class ConfiguracionHospitalViewSet(viewsets.ModelViewSet):
@@ -1679,8 +2126,8 @@ class ConfiguracionHospitalViewSet(viewsets.ModelViewSet):
         config.save()
         
         # Registrar en auditoría
-        AuditLog.objects.create(
-            usuario=request.user,
+        log_audit(
+            request,
             accion='editar',
             modelo='ConfiguracionHospital',
             objeto_id=config.id,
@@ -1689,8 +2136,7 @@ class ConfiguracionHospitalViewSet(viewsets.ModelViewSet):
                 'camas_uci': config.camas_uci,
                 'salas_emergencia': config.salas_emergencia,
                 'boxes_atencion': config.boxes_atencion,
-            },
-            ip_address=get_client_ip(request)
+            }
         )
         
         serializer = self.get_serializer(config)
@@ -1723,39 +2169,40 @@ class CamaViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         """Registrar creación en auditoría"""
         cama = serializer.save()
-        AuditLog.objects.create(
-            usuario=self.request.user,
+        log_audit(
+            self.request,
             accion='crear',
             modelo='Cama',
             objeto_id=cama.id,
-            detalles={'numero': cama.numero, 'tipo': cama.tipo},
-            ip_address=get_client_ip(self.request)
+            detalles={'numero': cama.numero, 'tipo': cama.tipo}
         )
     
     def perform_update(self, serializer):
         """Registrar actualización en auditoría"""
+        ficha_anterior_id = serializer.instance.ficha_actual_id
         cama = serializer.save()
-        AuditLog.objects.create(
-            usuario=self.request.user,
+        registrar_cambio_tablero(ficha_anterior_id, cama.ficha_actual_id)
+        log_audit(
+            self.request,
             accion='editar',
             modelo='Cama',
             objeto_id=cama.id,
-            detalles={'numero': cama.numero, 'estado': cama.estado},
-            ip_address=get_client_ip(self.request)
+            detalles={'numero': cama.numero, 'estado': cama.estado}
         )
     
     def perform_destroy(self, instance):
         """Registrar eliminación en auditoría"""
         cama_info = {'numero': instance.numero, 'tipo': instance.tipo}
         cama_id = instance.id
+        ficha_id = instance.ficha_actual_id
         instance.delete()
-        AuditLog.objects.create(
-            usuario=self.request.user,
+        registrar_cambio_tablero(ficha_id)
+        log_audit(
+            self.request,
             accion='eliminar',
             modelo='Cama',
             objeto_id=cama_id,
-            detalles=cama_info,
-            ip_address=get_client_ip(self.request)
+            detalles=cama_info
         )
     
     @action(detail=False, methods=['get'])
@@ -1772,38 +2219,12 @@ class CamaViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['get'])
     def estadisticas(self, request):
-        """Estadísticas de ocupación de camas"""
-        total = Cama.objects.count()
-        ocupadas = Cama.objects.filter(estado='ocupada').count()
-        disponibles = Cama.objects.filter(estado='disponible').count()
-        mantenimiento = Cama.objects.filter(estado='mantenimiento').count()
-        limpieza = Cama.objects.filter(estado='limpieza').count()
-        
-        por_tipo = {}
-        for tipo, _ in Cama.TIPO_CHOICES:
-            tipo_total = Cama.objects.filter(tipo=tipo).count()
-            tipo_ocupadas = Cama.objects.filter(tipo=tipo, estado='ocupada').count()
-            tipo_disponibles = Cama.objects.filter(tipo=tipo, estado='disponible').count()
-            por_tipo[tipo] = {
-                'total': tipo_total,
-                'ocupadas': tipo_ocupadas,
-                'disponibles': tipo_disponibles,
-                'porcentaje_ocupacion': round((tipo_ocupadas / tipo_total * 100) if tipo_total > 0 else 0, 1)
-            }
-        
-        return Response({
-            'total': total,
-            'ocupadas': ocupadas,
-            'disponibles': disponibles,
-            'mantenimiento': mantenimiento,
-            'limpieza': limpieza,
-            'porcentaje_ocupacion': round((ocupadas / total * 100) if total > 0 else 0, 1),
-            'por_tipo': por_tipo
-        })
+        """Estadísticas de ocupación de camas (generales, por tipo, piso y sala)"""
+        return Response(ocupacion_camas())
     
     @action(detail=True, methods=['post'])
     def asignar(self, request, pk=None):
-        """Asignar cama a una ficha"""
+        """Asignar cama a una ficha (con bloqueo de fila, ver asignacion_camas)"""
         cama = self.get_object()
         ficha_id = request.data.get('ficha_id')
         
@@ -1811,23 +2232,18 @@ class CamaViewSet(viewsets.ModelViewSet):
             return Response({'error': 'Debe proporcionar ficha_id'}, status=status.HTTP_400_BAD_REQUEST)
         
         try:
-            ficha = FichaEmergencia.objects.get(id=ficha_id)
-        except FichaEmergencia.DoesNotExist:
+            ficha = FichaEmergencia.objects.select_related('paciente').get(id=ficha_id)
+        except (FichaEmergencia.DoesNotExist, ValueError, TypeError):
             return Response({'error': 'Ficha no encontrada'}, status=status.HTTP_404_NOT_FOUND)
         
-        if cama.estado != 'disponible':
-            return Response({'error': 'La cama no está disponible'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        # Si la ficha ya tiene una cama asignada, liberarla primero
-        cama_anterior = Cama.objects.filter(ficha_actual=ficha).first()
-        if cama_anterior:
-            cama_anterior.liberar()
-        
-        cama.asignar(ficha, request.user)
+        try:
+            cama = asignar_cama(cama.pk, ficha, request.user)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
         # Registrar en auditoría
-        AuditLog.objects.create(
-            usuario=request.user,
+        log_audit(
+            request,
             accion='editar',
             modelo='Cama',
             objeto_id=cama.id,
@@ -1835,39 +2251,131 @@ class CamaViewSet(viewsets.ModelViewSet):
                 'accion': 'asignar',
                 'ficha_id': ficha.id,
                 'paciente': str(ficha.paciente)
-            },
-            ip_address=get_client_ip(request)
+            }
         )
         
-        serializer = self.get_serializer(cama)
+        serializer = self.get_serializer(self.get_queryset().get(pk=cama.pk))
         return Response(serializer.data)
     
+    def _parametros_asignacion(self, request):
+        """tipo y piso opcionales de la asignación automática"""
+        tipo = request.data.get('tipo') or None
+        piso = request.data.get('piso')
+        if tipo is not None and tipo not in dict(Cama.TIPO_CHOICES):
+            raise ValueError(f'Tipo inválido. Debe ser uno de: {[t[0] for t in Cama.TIPO_CHOICES]}')
+        try:
+            piso = int(piso) if piso not in (None, '') else None
+        except (ValueError, TypeError):
+            raise ValueError('El piso debe ser un número')
+        return tipo, piso
+    
+    @action(detail=False, methods=['post'])
+    def asignar_automatica(self, request):
+        """
+        Asigna a la ficha la mejor cama disponible: {"ficha_id", "tipo"?, "piso"?}.
+        
+        El tipo por defecto depende del estado de la ficha (ver asignacion_camas).
+        """
+        try:
+            tipo, piso = self._parametros_asignacion(request)
+            ficha = FichaEmergencia.objects.select_related('paciente').get(id=request.data.get('ficha_id'))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except (FichaEmergencia.DoesNotExist, TypeError):
+            return Response({'error': 'Ficha no encontrada'}, status=status.HTTP_404_NOT_FOUND)
+        
+        resultado = asignar_camas_lote([ficha.id], request.user, tipo=tipo, piso=piso)
+        if not resultado['asignadas']:
+            return Response({'error': 'No hay camas disponibles'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        cama = resultado['asignadas'][0][1]
+        log_audit(
+            request,
+            accion='editar',
+            modelo='Cama',
+            objeto_id=cama.id,
+            detalles={
+                'accion': 'asignar_automatica',
+                'ficha_id': ficha.id,
+                'paciente': str(ficha.paciente)
+            }
+        )
+        return Response(self.get_serializer(self.get_queryset().get(pk=cama.pk)).data)
+    
+    @action(detail=False, methods=['post'])
+    def asignar_lote(self, request):
+        """
+        Ubica varias fichas a la vez (llegada masiva): {"fichas": [ids], "tipo"?, "piso"?}.
+        
+        Los pacientes más graves eligen primero; los que no alcanzan cama
+        vuelven en sin_cama.
+        """
+        fichas_ids = request.data.get('fichas')
+        if not isinstance(fichas_ids, list) or not fichas_ids or not all(isinstance(i, int) for i in fichas_ids):
+            return Response({'error': 'Se requiere una lista de ids de fichas'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            tipo, piso = self._parametros_asignacion(request)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        existentes = set(FichaEmergencia.objects.filter(id__in=fichas_ids).values_list('id', flat=True))
+        if len(existentes) != len(set(fichas_ids)):
+            return Response(
+                {'error': f'Fichas no encontradas: {sorted(set(fichas_ids) - existentes)}'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        resultado = asignar_camas_lote(fichas_ids, request.user, tipo=tipo, piso=piso)
+        asignadas = {ficha.id: cama.pk for ficha, cama in resultado['asignadas']}
+        camas = self.get_queryset().in_bulk(asignadas.values())
+        
+        log_audit(
+            request,
+            accion='editar',
+            modelo='Cama',
+            detalles={
+                'accion': 'asignar_lote',
+                'asignadas': {str(ficha_id): cama_id for ficha_id, cama_id in asignadas.items()},
+                'sin_cama': [ficha.id for ficha in resultado['sin_cama']]
+            }
+        )
+        
+        return Response({
+            'asignadas': [
+                {'ficha_id': ficha_id, 'cama': self.get_serializer(camas[cama_id]).data}
+                for ficha_id, cama_id in asignadas.items()
+            ],
+            'sin_cama': [ficha.id for ficha in resultado['sin_cama']],
+        })
+    
     @action(detail=True, methods=['post'])
     def liberar(self, request, pk=None):
         """Liberar cama"""
-        cama = self.get_object()
-        
-        if cama.estado != 'ocupada':
-            return Response({'error': 'La cama no está ocupada'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        ficha_id = cama.ficha_actual.id if cama.ficha_actual else None
-        cama.estado = 'limpieza'  # Pasa a limpieza primero
-        cama.ficha_actual = None
-        cama.fecha_asignacion = None
-        cama.asignado_por = None
-        cama.save()
+        with transaction.atomic():
+            # Bloqueo de la fila: no se libera una cama que otro acaba de reasignar
+            cama = Cama.objects.select_for_update().get(pk=self.get_object().pk)
+            
+            if cama.estado != 'ocupada':
+                return Response({'error': 'La cama no está ocupada'}, status=status.HTTP_400_BAD_REQUEST)
+            
+            ficha_id = cama.ficha_actual_id
+            cama.estado = 'limpieza'  # Pasa a limpieza primero
+            cama.ficha_actual = None
+            cama.fecha_asignacion = None
+            cama.asignado_por = None
+            cama.save()
+            registrar_cambio_tablero(ficha_id)
         
         # Registrar en auditoría
-        AuditLog.objects.create(
-            usuario=request.user,
+        log_audit(
+            request,
             accion='editar',
             modelo='Cama',
             objeto_id=cama.id,
             detalles={
                 'accion': 'liberar',
                 'ficha_id': ficha_id
-            },
-            ip_address=get_client_ip(request)
+            }
         )
         
         serializer = self.get_serializer(cama)
@@ -1885,13 +2393,12 @@ class CamaViewSet(viewsets.ModelViewSet):
         cama.save()
         
         # Registrar en auditoría
-        AuditLog.objects.create(
-            usuario=request.user,
+        log_audit(
+            request,
             accion='editar',
             modelo='Cama',
             objeto_id=cama.id,
-            detalles={'accion': 'marcar_lista'},
-            ip_address=get_client_ip(request)
+            detalles={'accion': 'marcar_lista'}
         )
         
         serializer = self.get_serializer(cama)
@@ -1916,8 +2423,8 @@ class CamaViewSet(viewsets.ModelViewSet):
         cama.save()
         
         # Registrar en auditoría
-        AuditLog.objects.create(
-            usuario=request.user,
+        log_audit(
+            request,
             accion='editar',
             modelo='Cama',
             objeto_id=cama.id,
@@ -1925,8 +2432,7 @@ class CamaViewSet(viewsets.ModelViewSet):
                 'accion': 'cambiar_estado',
                 'estado_anterior': estado_anterior,
                 'estado_nuevo': nuevo_estado
-            },
-            ip_address=get_client_ip(request)
+            }
         )
         
         serializer = self.get_serializer(cama)
@@ -1941,19 +2447,16 @@ class CamaViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def tipos_disponibles(self, request):
         """Obtener resumen de camas por tipo"""
+        por_tipo = ocupacion_camas()['por_tipo']
         resultado = []
         for tipo, label in Cama.TIPO_CHOICES:
-            camas = Cama.objects.filter(tipo=tipo)
-            total = camas.count()
-            disponibles = camas.filter(estado='disponible').count()
-            ocupadas = camas.filter(estado='ocupada').count()
-            if total > 0:
+            if por_tipo[tipo]['total'] > 0:
                 resultado.append({
                     'tipo': tipo,
                     'label': label,
-                    'total': total,
-                    'disponibles': disponibles,
-                    'ocupadas': ocupadas,
+                    'total': por_tipo[tipo]['total'],
+                    'disponibles': por_tipo[tipo]['disponibles'],
+                    'ocupadas': por_tipo[tipo]['ocupadas'],
                 })
         return Response(resultado)
     
@@ -1976,17 +2479,44 @@ class CamaViewSet(viewsets.ModelViewSet):
         
         total = camas.count()
         camas.delete()
+        invalidar_ocupacion_camas()
         
         # Auditoría
-        AuditLog.objects.create(
-            usuario=request.user,
+        log_audit(
+            request,
             accion='eliminar',
             modelo='Cama',
-            detalles={'accion': 'eliminar_tipo', 'tipo': tipo, 'cantidad': total},
+            detalles={'accion': 'eliminar_tipo', 'tipo': tipo, 'cantidad': total}
         )
         
         return Response({'mensaje': f'Se eliminaron {total} camas de tipo {tipo}', 'eliminadas': total})
     
+    def _crear_camas(self, request, filas, accion):
+        """Valida y crea en bloque; retorna (camas creadas, None) o (None, Response de error)"""
+        from django.db import IntegrityError
+        
+        camas, errores = validar_camas(filas)
+        if errores:
+            return None, Response({'error': errores}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            crear_camas(camas)
+        except IntegrityError:
+            # Otro usuario creó uno de los números entre la validación y el INSERT
+            return None, Response(
+                {'error': 'Uno de los números de cama ya existe; intente nuevamente'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # Un solo registro de auditoría para todo el bloque
+        log_audit(
+            request,
+            accion='crear',
+            modelo='Cama',
+            objeto_id=0,
+            detalles={'accion': accion, **resumen_camas(camas)}
+        )
+        return camas, None
+    
     @action(detail=False, methods=['post'])
     def crear_multiple(self, request):
         """Crear múltiples camas de un tipo"""
@@ -2002,54 +2532,78 @@ class CamaViewSet(viewsets.ModelViewSet):
         
         try:
             cantidad = int(cantidad)
-            if cantidad < 1 or cantidad > 50:
+            if cantidad < 1 or cantidad > max_camas_inventario():
                 raise ValueError()
         except (ValueError, TypeError):
-            return Response({'error': 'La cantidad debe ser un número entre 1 y 50'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        # Obtener el último número de camas de ese tipo
-        prefijo = tipo.upper().replace('_', '-')
-        if tipo == 'cama_general':
-            prefijo = 'CAM'
-        elif tipo == 'box':
-            prefijo = 'BOX'
-        elif tipo == 'uci':
-            prefijo = 'UCI'
-        elif tipo == 'uti':
-            prefijo = 'UTI'
-        
-        camas_existentes = Cama.objects.filter(tipo=tipo).count()
-        
-        camas_creadas = []
-        for i in range(1, cantidad + 1):
-            numero = f"{prefijo}-{(camas_existentes + i):02d}"
-            # Verificar que no exista
-            if Cama.objects.filter(numero=numero).exists():
-                # Buscar el siguiente disponible
-                j = camas_existentes + i
-                while Cama.objects.filter(numero=f"{prefijo}-{j:02d}").exists():
-                    j += 1
-                numero = f"{prefijo}-{j:02d}"
-            
-            cama = Cama.objects.create(numero=numero, tipo=tipo, estado='disponible')
-            camas_creadas.append(cama)
+            return Response(
+                {'error': f'La cantidad debe ser un número entre 1 y {max_camas_inventario()}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
-        # Auditoría
-        AuditLog.objects.create(
-            usuario=request.user,
-            accion='crear',
-            modelo='Cama',
-            objeto_id=0,
-            detalles={'accion': 'crear_multiple', 'tipo': tipo, 'cantidad': cantidad},
-            ip_address=get_client_ip(request)
-        )
+        # Numeración a continuación de las camas existentes de ese tipo
+        camas, error = self._crear_camas(request, camas_desde_patron(tipo, cantidad), 'crear_multiple')
+        if error:
+            return error
         
+        # bulk_create no retorna los ids en MySQL: se releen por número
+        camas_creadas = self.get_queryset().filter(numero__in=[cama.numero for cama in camas])
         serializer = self.get_serializer(camas_creadas, many=True)
         return Response({
             'mensaje': f'Se crearon {cantidad} camas de tipo {tipo}',
             'camas': serializer.data
         })
     
+    @action(detail=False, methods=['post'])
+    def inventario(self, request):
+        """
+        Alta de camas en bloque (solo administradores). Acepta uno de:
+            patron: {"tipo", "cantidad", "prefijo"?, "inicio"?, "digitos"?, "piso"?, "sala"?}
+            camas: [{"numero", "tipo", "piso"?, "sala"?, "observaciones"?}, ...]
+            archivo (multipart) o csv (texto): CSV con encabezado numero,tipo,piso,sala,observaciones
+        
+        Se crean todas o ninguna (ver inventario_camas).
+        """
+        if request.user.rol != 'administrador':
+            return Response({'error': 'Solo administradores pueden crear camas'}, status=status.HTTP_403_FORBIDDEN)
+        
+        try:
+            if 'archivo' in request.FILES:
+                filas = camas_desde_csv(request.FILES['archivo'].read().decode('utf-8'))
+            elif request.data.get('csv'):
+                filas = camas_desde_csv(request.data['csv'])
+            elif isinstance(request.data.get('patron'), dict):
+                patron = request.data['patron']
+                cantidad = int(patron.get('cantidad', 0))
+                if cantidad < 1 or cantidad > max_camas_inventario():
+                    raise ValueError(f'La cantidad debe ser un número entre 1 y {max_camas_inventario()}')
+                if patron.get('tipo') not in dict(Cama.TIPO_CHOICES):
+                    raise ValueError(f'Tipo inválido. Debe ser uno de: {[t[0] for t in Cama.TIPO_CHOICES]}')
+                filas = camas_desde_patron(
+                    patron['tipo'], cantidad,
+                    prefijo=patron.get('prefijo'),
+                    inicio=int(patron['inicio']) if patron.get('inicio') is not None else None,
+                    digitos=int(patron.get('digitos', 2)),
+                    piso=patron.get('piso'),
+                    sala=patron.get('sala')
+                )
+            elif isinstance(request.data.get('camas'), list):
+                filas = [fila for fila in request.data['camas'] if isinstance(fila, dict)]
+            else:
+                raise ValueError('Debe enviar patron, camas, csv o un archivo CSV')
+        except UnicodeDecodeError:
+            return Response({'error': 'El archivo debe estar en UTF-8'}, status=status.HTTP_400_BAD_REQUEST)
+        except (ValueError, TypeError) as e:
+            return Response({'error': str(e) or 'Parámetros inválidos'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        camas, error = self._crear_camas(request, filas, 'inventario')
+        if error:
+            return error
+        
+        return Response({
+            'mensaje': f'Se crearon {len(camas)} camas',
+            'resumen': resumen_camas(camas)
+        }, status=status.HTTP_201_CREATED)
+    
     @action(detail=False, methods=['post'])
     def eliminar_multiple(self, request):
         """Eliminar múltiples camas (solo las que estén disponibles)"""
@@ -2058,27 +2612,23 @@ class CamaViewSet(viewsets.ModelViewSet):
         
         ids = request.data.get('ids', [])
         
-        if not ids:
+        if not ids or not isinstance(ids, list):
             return Response({'error': 'Debe proporcionar lista de IDs'}, status=status.HTTP_400_BAD_REQUEST)
         
-        camas = Cama.objects.filter(id__in=ids, estado='disponible')
-        count = camas.count()
+        count = eliminar_camas(ids)
         
         if count == 0:
             return Response({'error': 'No se encontraron camas disponibles para eliminar'}, status=status.HTTP_400_BAD_REQUEST)
         
         # Auditoría
-        AuditLog.objects.create(
-            usuario=request.user,
+        log_audit(
+            request,
             accion='eliminar',
             modelo='Cama',
             objeto_id=0,
-            detalles={'accion': 'eliminar_multiple', 'ids': ids, 'eliminadas': count},
-            ip_address=get_client_ip(request)
+            detalles={'accion': 'eliminar_multiple', 'ids': ids, 'eliminadas': count}
         )
         
-        camas.delete()
-        
         return Response({'mensaje': f'Se eliminaron {count} camas'})
 
 
@@ -2104,8 +2654,8 @@ class ArchivoAdjuntoViewSet(viewsets.ModelViewSet):
         archivo = serializer.save()
         
         # Registrar en auditoría
-        AuditLog.objects.create(
-            usuario=self.request.user,
+        log_audit(
+            self.request,
             accion='crear',
             modelo='ArchivoAdjunto',
             objeto_id=archivo.id,
@@ -2113,14 +2663,13 @@ class ArchivoAdjuntoViewSet(viewsets.ModelViewSet):
                 'nombre': archivo.nombre_original,
                 'tipo': archivo.tipo,
                 'ficha_id': archivo.ficha_id,
-            },
-            ip_address=get_client_ip(self.request)
+            }
         )
     
     def perform_destroy(self, instance):
         # Registrar en auditoría antes de eliminar
-        AuditLog.objects.create(
-            usuario=self.request.user,
+        log_audit(
+            self.request,
             accion='eliminar',
             modelo='ArchivoAdjunto',
             objeto_id=instance.id,
@@ -2128,8 +2677,7 @@ class ArchivoAdjuntoViewSet(viewsets.ModelViewSet):
                 'nombre': instance.nombre_original,
                 'tipo': instance.tipo,
                 'ficha_id': instance.ficha_id,
-            },
-            ip_address=get_client_ip(self.request)
+            }
         )
         instance.delete()
     
@@ -2147,8 +2695,8 @@ class ArchivoAdjuntoViewSet(viewsets.ModelViewSet):
             archivo = serializer.save()
             
             # Registrar en auditoría
-            AuditLog.objects.create(
-                usuario=request.user,
+            log_audit(
+                request,
                 accion='crear',
                 modelo='ArchivoAdjunto',
                 objeto_id=archivo.id,
@@ -2157,8 +2705,7 @@ class ArchivoAdjuntoViewSet(viewsets.ModelViewSet):
                     'tipo': archivo.tipo,
                     'ficha_id': archivo.ficha_id,
                     'metodo': 'upload_action',
-                },
-                ip_address=get_client_ip(request)
+                }
             )
             
             return Response(ArchivoAdjuntoSerializer(archivo, context={'request': request}).data, status=status.HTTP_201_CREATED)
@@ -2190,6 +2737,7 @@ class MensajeChatViewSet(viewsets.ModelViewSet):
     """ViewSet para gestión de mensajes de chat"""
     queryset = MensajeChat.objects.all()
     serializer_class = MensajeChatSerializer
+    pagination_class = MensajeChatPaginacion
     
     def get_serializer_class(self):
         if self.action == 'create':
@@ -2201,7 +2749,7 @@ class MensajeChatViewSet(viewsets.ModelViewSet):
         ficha_id = self.request.query_params.get('ficha')
         if ficha_id:
             queryset = queryset.filter(ficha_id=ficha_id)
-        return queryset.order_by('fecha_envio')
+        return queryset.order_by('fecha_envio', 'id')
     
     def create(self, request, *args, **kwargs):
         """Override create para devolver el mensaje con el serializer completo"""
@@ -2253,8 +2801,8 @@ class MensajeChatViewSet(viewsets.ModelViewSet):
             )
         
         # Registrar en auditoría
-        AuditLog.objects.create(
-            usuario=request.user,
+        log_audit(
+            request,
             accion='crear',
             modelo='MensajeChat',
             objeto_id=mensaje.id,
@@ -2262,12 +2810,15 @@ class MensajeChatViewSet(viewsets.ModelViewSet):
                 'ficha_id': ficha.id,
                 'contenido_preview': mensaje.contenido[:100] if len(mensaje.contenido) > 100 else mensaje.contenido,
                 'paciente': paciente_nombre,
-            },
-            ip_address=get_client_ip(request)
+            }
         )
         
         # Devolver con el serializer de lectura para incluir autor completo
         read_serializer = MensajeChatSerializer(mensaje, context={'request': request})
+        
+        # Publicar a los clientes conectados (WebSocket del chat y stream SSE)
+        publicar_mensaje(read_serializer.data)
+        
         return Response(read_serializer.data, status=status.HTTP_201_CREATED)
     
     def perform_create(self, serializer):
@@ -2342,8 +2893,8 @@ class NotaEvolucionViewSet(viewsets.ModelViewSet):
         nota = serializer.save()
         
         # Registrar en auditoría
-        AuditLog.objects.create(
-            usuario=request.user,
+        log_audit(
+            request,
             accion='crear',
             modelo='NotaEvolucion',
             objeto_id=nota.id,
@@ -2351,8 +2902,7 @@ class NotaEvolucionViewSet(viewsets.ModelViewSet):
                 'ficha_id': nota.ficha_id,
                 'tipo': nota.tipo,
                 'paciente': f"{nota.ficha.paciente.nombres} {nota.ficha.paciente.apellidos}" if not nota.ficha.paciente.es_nn else f"NN ({nota.ficha.paciente.id_temporal})",
-            },
-            ip_address=get_client_ip(request)
+            }
         )
         
         read_serializer = NotaEvolucionSerializer(nota, context={'request': request})
@@ -2367,8 +2917,8 @@ class NotaEvolucionViewSet(viewsets.ModelViewSet):
         nota = serializer.save()
         
         # Registrar en auditoría
-        AuditLog.objects.create(
-            usuario=request.user,
+        log_audit(
+            request,
             accion='actualizar',
             modelo='NotaEvolucion',
             objeto_id=nota.id,
@@ -2376,8 +2926,7 @@ class NotaEvolucionViewSet(viewsets.ModelViewSet):
                 'ficha_id': nota.ficha_id,
                 'tipo': nota.tipo,
                 'motivo_edicion': nota.motivo_edicion,
-            },
-            ip_address=get_client_ip(request)
+            }
         )
         
         read_serializer = NotaEvolucionSerializer(nota, context={'request': request})
@@ -2419,6 +2968,7 @@ class NotaEvolucionViewSet(viewsets.ModelViewSet):
 class NotificacionViewSet(viewsets.ModelViewSet):
     """ViewSet para gestión de notificaciones"""
     serializer_class = NotificacionSerializer
+    pagination_class = NotificacionPaginacion
     
     def get_queryset(self):
         """Solo notificaciones del usuario actual"""
@@ -2434,7 +2984,7 @@ class NotificacionViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def conteo(self, request):
         """Obtener conteo de notificaciones no leídas"""
-        count = self.get_queryset().filter(leida=False).count()
+        count = Notificacion.conteo_no_leidas(request.user.id)
         return Response({'no_leidas': count})
     
     @action(detail=False, methods=['get'])
@@ -2458,6 +3008,7 @@ class NotificacionViewSet(viewsets.ModelViewSet):
             leida=True, 
             fecha_leida=timezone.now()
         )
+        Notificacion.ajustar_no_leidas({request.user.id: -count})
         return Response({'status': 'ok', 'marcadas': count})
     
     @action(detail=False, methods=['post'])
@@ -2468,13 +3019,23 @@ class NotificacionViewSet(viewsets.ModelViewSet):
             leida=True,
             fecha_leida=timezone.now()
         )
+        Notificacion.ajustar_no_leidas({request.user.id: -count})
         return Response({'status': 'ok', 'marcadas': count})
     
     @action(detail=False, methods=['delete'])
     def eliminar_leidas(self, request):
         """Eliminar todas las notificaciones leídas"""
+        # Solo se eliminan leídas: el contador de no leídas no cambia (ver post_delete en models.py)
         count, _ = self.get_queryset().filter(leida=True).delete()
         return Response({'status': 'ok', 'eliminadas': count})
+    
+    def perform_update(self, serializer):
+        """Mantiene el contador de no leídas si cambia el estado 'leida'"""
+        estaba_leida = serializer.instance.leida
+        notificacion = serializer.save()
+        if notificacion.leida != estaba_leida:
+            Notificacion.ajustar_no_leidas({notificacion.usuario_id: -1 if notificacion.leida else 1})
+    
 
 
 # ============================================
@@ -2486,7 +3047,8 @@ class NotificacionViewSet(viewsets.ModelViewSet):
 def poll_updates(request):
     """
     Endpoint de polling para obtener actualizaciones de chat y notificaciones.
-    El frontend debe llamar este endpoint cada 2-3 segundos.
+    Es el mecanismo de respaldo: los clientes deben preferir el stream
+    /api/eventos/ y usar este endpoint solo si el stream no está disponible.
     """
     try:
         user = request.user
@@ -2529,10 +3091,7 @@ def poll_updates(request):
             ).data
             
             # Conteo de notificaciones no leídas
-            response_data['notificaciones_no_leidas'] = Notificacion.objects.filter(
-                usuario=user,
-                leida=False
-            ).count()
+            response_data['notificaciones_no_leidas'] = Notificacion.conteo_no_leidas(user.id)
         except Exception:
             pass  # Ignorar errores de notificaciones
         
@@ -2546,6 +3105,213 @@ def poll_updates(request):
         })
 
 
+# ============================================
+# STREAM DE EVENTOS (SSE) PARA CHAT Y NOTIFICACIONES
+# ============================================
+
+SSE_HEARTBEAT_SEGUNDOS = 15
+SSE_MAX_REPLAY = 100
+
+
+def _parse_cursor(request):
+    """
+    Obtiene (last_message_id, last_notification_id) desde el header Last-Event-ID
+    (formato "<mensaje>:<notificacion>") o desde los query params equivalentes.
+    """
+    last_message_id = request.GET.get('last_message_id', 0)
+    last_notification_id = request.GET.get('last_notification_id', 0)
+    
+    last_event_id = request.headers.get('Last-Event-ID')
+    if last_event_id and ':' in last_event_id:
+        last_message_id, last_notification_id = last_event_id.split(':', 1)
+    
+    try:
+        return int(last_message_id), int(last_notification_id)
+    except (ValueError, TypeError):
+        return 0, 0
+
+
+def _pendientes(queryset, cursor):
+    """
+    Filas posteriores al cursor, en orden de id.
+    
+    Con más de SSE_MAX_REPLAY pendientes se entregan las SSE_MAX_REPLAY más
+    recientes (las anteriores se consultan por REST).
+    
+    Returns:
+        tuple: (filas, truncado) donde truncado indica que se saltaron filas
+    """
+    filas = list(queryset.filter(id__gt=cursor).order_by('id')[:SSE_MAX_REPLAY + 1])
+    if len(filas) <= SSE_MAX_REPLAY:
+        return filas, False
+    return list(queryset.filter(id__gt=cursor).order_by('-id')[:SSE_MAX_REPLAY])[::-1], True
+
+
+@sync_to_async
+def _cursor_inicial(usuario, ficha_id, last_message_id, last_notification_id):
+    """
+    Completa el cursor de una conexión nueva con los ids más recientes.
+    
+    Sin cursor no se reenvía el historial como si fuera nuevo (incluidas
+    notificaciones ya leídas): el cliente lo carga por REST y el stream
+    entrega solo lo que se escriba desde ahora.
+    """
+    from django.db.models import Max
+    if not last_message_id and ficha_id:
+        last_message_id = MensajeChat.objects.filter(ficha_id=ficha_id).aggregate(tope=Max('id'))['tope'] or 0
+    if not last_notification_id:
+        last_notification_id = Notificacion.objects.filter(usuario=usuario).aggregate(tope=Max('id'))['tope'] or 0
+    return last_message_id, last_notification_id
+
+
+@sync_to_async
+def _eventos_pendientes(request, usuario, ficha_id, last_message_id, last_notification_id):
+    """
+    Mensajes y notificaciones creados después del cursor del cliente.
+    
+    Returns:
+        tuple: (mensajes, notificaciones, truncados) con truncados =
+        {'chat': bool, 'notificaciones': bool}
+    """
+    mensajes, chat_truncado = [], False
+    if ficha_id:
+        filas, chat_truncado = _pendientes(
+            MensajeChat.objects.filter(ficha_id=ficha_id)
+            .select_related('autor', 'archivo_adjunto').prefetch_related('leido_por'),
+            last_message_id
+        )
+        mensajes = MensajeChatSerializer(filas, many=True, context={'request': request}).data
+    
+    filas, notificaciones_truncadas = _pendientes(Notificacion.objects.filter(usuario=usuario), last_notification_id)
+    notificaciones = NotificacionSerializer(filas, many=True).data
+    
+    return mensajes, notificaciones, {'chat': chat_truncado, 'notificaciones': notificaciones_truncadas}
+
+
+@sync_to_async
+def _ficha_existe(ficha_id):
+    return FichaEmergencia.objects.filter(pk=ficha_id).exists()
+
+
+def _formatear_sse(evento, datos, cursor):
+    """Formatea un evento en el protocolo text/event-stream"""
+    payload = json.dumps(datos, cls=DjangoJSONEncoder)
+    return f"id: {cursor[0]}:{cursor[1]}\nevent: {evento}\ndata: {payload}\n\n"
+
+
+async def eventos_stream(request):
+    """
+    Stream SSE (Server-Sent Events) con mensajes de chat y notificaciones.
+    
+    Reemplaza el polling de /api/poll/: los eventos llegan en cuanto se
+    escriben en la base de datos. Al reconectarse se envían primero los
+    eventos posteriores al cursor del cliente; sin cursor solo los que se
+    escriban desde la conexión. Si hay más pendientes que SSE_MAX_REPLAY
+    se envía un evento 'resync' ({"chat": bool, "notificaciones": bool})
+    antes de los más recientes: el cliente debe recargar esas listas por REST.
+    
+    Query params:
+        ficha_id: Ficha cuyo chat se quiere seguir (opcional)
+        last_message_id / last_notification_id: Cursor inicial (opcional)
+    El navegador reenvía automáticamente el header Last-Event-ID al reconectar.
+    
+    Requiere un servidor ASGI (daphne/uvicorn); bajo WSGI responde 501 y el
+    cliente debe seguir usando /api/poll/.
+    """
+    usuario = await request.auser()
+    if not usuario.is_authenticated:
+        return JsonResponse({'detail': 'Las credenciales de autenticación no se proveyeron.'}, status=403)
+    
+    layer = get_layer()
+    if layer is None or not isinstance(request, ASGIRequest):
+        return JsonResponse(
+            {'error': 'Stream de eventos no disponible, use /api/poll/'},
+            status=status.HTTP_501_NOT_IMPLEMENTED
+        )
+    
+    try:
+        ficha_id = int(request.GET.get('ficha_id')) if request.GET.get('ficha_id') else None
+    except ValueError:
+        return JsonResponse({'error': 'ficha_id inválido'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    # Mismo acceso que el chat por REST: la ficha debe existir
+    if ficha_id and not await _ficha_existe(ficha_id):
+        return JsonResponse({'detail': 'No encontrado.'}, status=status.HTTP_404_NOT_FOUND)
+    
+    last_message_id, last_notification_id = _parse_cursor(request)
+    
+    async def stream():
+        nonlocal last_message_id, last_notification_id
+        
+        canal = await layer.new_channel()
+        grupos = [grupo_usuario(usuario.id), grupo_rol(usuario.rol)]
+        if ficha_id:
+            grupos.append(grupo_chat(ficha_id))
+        
+        # Suscribirse antes de leer pendientes para no perder eventos intermedios
+        for grupo in grupos:
+            await layer.group_add(grupo, canal)
+        
+        try:
+            last_message_id, last_notification_id = await _cursor_inicial(
+                usuario, ficha_id, last_message_id, last_notification_id
+            )
+            yield "retry: 3000\n\n"
+            
+            async def ponerse_al_dia():
+                nonlocal last_message_id, last_notification_id
+                mensajes, notificaciones, truncados = await _eventos_pendientes(
+                    request, usuario, ficha_id, last_message_id, last_notification_id
+                )
+                salida = []
+                if any(truncados.values()):
+                    salida.append(_formatear_sse('resync', truncados, (last_message_id, last_notification_id)))
+                for mensaje in mensajes:
+                    last_message_id = max(last_message_id, mensaje['id'])
+                    salida.append(_formatear_sse('chat_message', mensaje, (last_message_id, last_notification_id)))
+                for notificacion in notificaciones:
+                    last_notification_id = max(last_notification_id, notificacion['id'])
+                    salida.append(_formatear_sse('notificacion', notificacion, (last_message_id, last_notification_id)))
+                return salida
+            
+            for chunk in await ponerse_al_dia():
+                yield chunk
+            
+            while True:
+                try:
+                    evento = await asyncio.wait_for(layer.receive(canal), timeout=SSE_HEARTBEAT_SEGUNDOS)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                
+                tipo = evento.get('type')
+                if tipo == 'chat_message':
+                    mensaje = evento['mensaje']
+                    if mensaje.get('id') is None or mensaje['id'] <= last_message_id:
+                        continue
+                    last_message_id = mensaje['id']
+                    yield _formatear_sse('chat_message', mensaje, (last_message_id, last_notification_id))
+                elif tipo in ('notificacion', 'notificacion_rol'):
+                    notificacion = evento['notificacion']
+                    if notificacion.get('id') is None:
+                        # Notificación masiva al rol: leer las del usuario desde el cursor
+                        for chunk in await ponerse_al_dia():
+                            yield chunk
+                        continue
+                    if notificacion['id'] <= last_notification_id:
+                        continue
+                    last_notification_id = notificacion['id']
+                    yield _formatear_sse('notificacion', notificacion, (last_message_id, last_notification_id))
+        finally:
+            for grupo in grupos:
+                await layer.group_discard(grupo, canal)
+    
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 # ============================================================================
 # TURNOS
 # ============================================================================